@@ -1,9 +1,70 @@
 import argparse
 import time
 import csv
+import gc
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import tracemalloc
 from pathlib import Path
 import solvers.parser as parser
 from solvers.varmap import VarManager
+from solvers.presolve import presolve as run_presolve, fixed_cells
+from solvers.cache import CNFCache, encoder_version, DEFAULT_DIR as CACHE_DIR
+from solvers.sinks import CountingSink, ClauseBuffer, DimacsSink
+from solvers.cardinality import METHODS as AMO_METHODS
+from solvers import profiling
+
+try:
+    import resource
+except ImportError:  # Windows 上没有 resource 模块
+    resource = None
+
+STORES = ['count', 'list', 'buffer']
+
+# CSV 列: 前 5 列与 compare_results/ 中的文件相同，其余为端到端测试增加的列
+BASE_HEADER = ['puzzle', 'approach', 'variables', 'clauses', 'encoding_time_s']
+EXTRA_HEADER = ['status', 'trials', 'parse_time_s', 'presolve_time_s', 'cnf_write_time_s', 'solve_time_s',
+                'total_time_s', 'encoding_time_iqr_s', 'solve_time_iqr_s', 'total_time_iqr_s', 'peak_rss_mb',
+                'conflicts', 'decisions', 'propagations', 'restarts', 'sat_time_s']
+MEMORY_HEADER = ['peak_mem_mb', 'gc_collections', 'gc_time_s']
+SOLVER_STATS = ['conflicts', 'decisions', 'propagations', 'restarts']
+
+# --compare 检查的耗时列与规模列
+TIME_COLUMNS = ['encoding_time_s', 'solve_time_s', 'total_time_s']
+SIZE_COLUMNS = ['variables', 'clauses']
+
+def make_sink(store):
+    """编码结果的存放方式: 只计数 / Python 列表 / 紧凑的 ClauseBuffer。"""
+    if store == 'list':
+        return []
+    if store == 'buffer':
+        return ClauseBuffer()
+    return CountingSink()
+
+class GCTimer:
+    """通过 gc.callbacks 记录垃圾回收的次数与耗时。"""
+    def __init__(self):
+        self.collections = 0
+        self.time = 0.0
+        self._start = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self._start = time.perf_counter()
+        elif self._start is not None:
+            self.time += time.perf_counter() - self._start
+            self.collections += 1
+            self._start = None
+
+    def __enter__(self):
+        gc.callbacks.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        gc.callbacks.remove(self)
 
 # 动态导入指定的方法
 def get_encoder(approach_num):
@@ -11,94 +72,394 @@ def get_encoder(approach_num):
         from solvers.approach1 import encode
     elif approach_num == 2:
         from solvers.approach2 import encode
+    elif approach_num == 3:
+        from solvers.approach3 import encode
     elif approach_num == 4:
         from solvers.approach4 import encode
     else:
         raise ValueError(f"不支持的方法: {approach_num}")
     return encode
 
-def run_benchmark(clue_files, approaches_to_test, timeout_s=60):
+def peak_rss_mb():
+    """当前进程的峰值常驻内存 (MB)，不支持时为 -1。"""
+    if resource is None:
+        return -1
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+def run_case(file_path, approach_num, opts):
+    """
+    在当前进程中完整运行一次: 解析 → 预处理 → 编码 → 写 CNF → 求解，
+    返回包含各阶段耗时、规模、求解器统计与峰值内存的字典。
+    opts 的键: presolve, amo, cache_dir, store, memory, write_cnf, solve, backend, conflicts, propagations,
+    templates, profile。
+    opts['profile'] 不为 None 时记录每一行的编码开销 (见 solvers/profiling.py)，
+    result['profile'] 为报告，列出开销最大的 opts['profile'] 行。
+    """
+    result = {'status': 'encoded', 'cache': None}
+    times = result['times'] = {}
+
+    start = time.perf_counter()
+    # 使用缓存时解析结果也走磁盘缓存
+    puzzle = parser.parse_clues(str(file_path), parser.DEFAULT_CACHE_DIR if opts['cache_dir'] else None)
+    times['parse'] = time.perf_counter() - start
+
+    fixed = None
+    if opts['presolve']:
+        start = time.perf_counter()
+        domains = run_presolve(puzzle)
+        times['presolve'] = time.perf_counter() - start
+        if domains is None:
+            result['status'] = 'unsat'
+            return result
+        puzzle['domains'] = domains
+        fixed = fixed_cells(domains)
+        result['fixed'] = len(fixed)
+
+    encoder = get_encoder(approach_num)
+    cache = CNFCache(opts['cache_dir']) if opts['cache_dir'] else None
+    vm = VarManager()
+    # 需要写 CNF、求解或缓存时，子句至少要保存为紧凑数组
+    store = opts['store']
+    if store == 'count' and (opts['write_cnf'] or opts['solve'] or cache is not None):
+        store = 'buffer'
+
+    if opts['memory']:
+        tracemalloc.start()
+        profiling.reset_peak()
+    profiler = profiling.LineProfiler(opts['profile']) if opts['profile'] is not None else None
+    gc_timer = GCTimer()
+    try:
+        start = time.perf_counter()
+        cached = None
+        if cache is not None:
+            key = cache.key(file_path.read_bytes(), approach_num, encoder_version(encoder),
+                            amo=opts['amo'], presolve=opts['presolve'], templates=opts['templates'])
+            cached = cache.load(key)
+            result['cache'] = 'miss' if cached is None else 'hit'
+        if cached is not None:
+            vm, clauses, fixed = cached
+        else:
+            if profiler is not None:
+                profiling.subscribe(profiler)
+            try:
+                with gc_timer:
+                    clauses = encoder(puzzle, vm, amo=opts['amo'], sink=make_sink(store), templates=opts['templates'])
+            finally:
+                if profiler is not None:
+                    profiling.unsubscribe(profiler)
+            if cache is not None:
+                cache.store(key, vm, clauses, fixed)
+        times['encode'] = time.perf_counter() - start
+        if profiler is not None and cached is None:
+            result['profile'] = profiler.report(encode=times['encode'])
+            if opts['memory']:
+                result['profile']['memory_sites'] = profiling.memory_sites(tracemalloc.take_snapshot())
+        if opts['memory']:
+            # 逐行分析会重置 tracemalloc 的峰值，因此从 profiling 取整体峰值
+            result['peak_mem_mb'] = profiling.traced_peak() / (1024 * 1024)
+            result['gc_collections'] = gc_timer.collections
+            result['gc_time_s'] = gc_timer.time
+    finally:
+        if opts['memory']:
+            tracemalloc.stop()
+    result['variables'] = vm.nvars()
+    result['clauses'] = len(clauses)
+
+    if opts['write_cnf']:
+        fd, path = tempfile.mkstemp(suffix='.cnf')
+        os.close(fd)
+        try:
+            start = time.perf_counter()
+            sink = DimacsSink(path)
+            sink.extend(clauses)
+            sink.close(vm.nvars())
+            times['cnf_write'] = time.perf_counter() - start
+        finally:
+            os.remove(path)
+
+    if opts['solve']:
+        from solvers.solver_pysat import SolverSink
+        start = time.perf_counter()
+        with SolverSink(opts['backend']) as solver:
+            solver.extend(clauses)
+            solved = solver.solve(vm, fixed, opts['conflicts'], opts['propagations'])
+        times['solve'] = time.perf_counter() - start
+        result['status'] = solved.status
+        result['sat_time_s'] = solved.elapsed
+        result.update(solved.stats)
+
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def _case_worker(file_path, approach_num, opts, conn):
+    try:
+        result = run_case(file_path, approach_num, opts)
+    except MemoryError:
+        result = {'status': 'memout'}
+    except Exception as e:
+        result = {'status': 'error', 'error': repr(e)}
+    conn.send(result)
+    conn.close()
+
+def run_isolated(file_path, approach_num, opts, timeout_s):
+    """在独立子进程中运行 run_case；超过 timeout_s 秒则杀死子进程，返回 status='timeout'。"""
+    ctx = multiprocessing.get_context()
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_case_worker, args=(file_path, approach_num, opts, send))
+    proc.start()
+    send.close()
+    if recv.poll(timeout_s):
+        try:
+            result = recv.recv()
+        except EOFError:
+            # 子进程没有返回结果就退出了 (例如被系统杀死)
+            result = None
+    else:
+        proc.kill()
+        result = {'status': 'timeout'}
+    proc.join()
+    recv.close()
+    if result is None:
+        result = {'status': 'crashed', 'error': f'exit code {proc.exitcode}'}
+    return result
+
+def median_iqr(values):
+    """中位数与四分位距 (少于 2 个值时 IQR 为 0)。"""
+    if len(values) < 2:
+        return values[0], 0.0
+    q1, _, q3 = statistics.quantiles(values, n=4)
+    return statistics.median(values), q3 - q1
+
+def summarize(file_path, approach_num, trials, timeout_s, memory):
+    """把多次试验的结果汇总成一行 CSV (dict)：耗时取中位数并给出 IQR。"""
+    row = {'puzzle': file_path.name, 'approach': approach_num, 'trials': len(trials)}
+    failed = [t for t in trials if t['status'] in ('timeout', 'error', 'memout', 'crashed')]
+    if failed:
+        # 与旧格式一致: 超时记录 -1 变量 / -1 子句与超时时间，错误全部记为 -1
+        status = failed[0]['status']
+        row.update(variables=-1, clauses=-1, status=status,
+                   encoding_time_s=timeout_s if status == 'timeout' else -1)
+        return row
+
+    def phase(t, name):
+        return t['times'].get(name)
+
+    def column(name, values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return '', ''
+        return median_iqr(values)
+
+    first = trials[0]
+    row['status'] = first['status']
+    row['variables'] = first.get('variables', -1)
+    row['clauses'] = first.get('clauses', -1)
+    # encoding_time_s 与旧的 CSV 含义相同: 编码时间 (启用预处理时包含预处理时间)
+    encoding = [(phase(t, 'presolve') or 0.0) + (phase(t, 'encode') or 0.0) for t in trials]
+    totals = [sum(t['times'].values()) for t in trials]
+    row['encoding_time_s'], row['encoding_time_iqr_s'] = median_iqr(encoding)
+    row['total_time_s'], row['total_time_iqr_s'] = median_iqr(totals)
+    row['solve_time_s'], row['solve_time_iqr_s'] = column('solve', [phase(t, 'solve') for t in trials])
+    row['sat_time_s'], _ = column('sat', [t.get('sat_time_s') for t in trials])
+    row['parse_time_s'], _ = column('parse', [phase(t, 'parse') for t in trials])
+    row['presolve_time_s'], _ = column('presolve', [phase(t, 'presolve') for t in trials])
+    row['cnf_write_time_s'], _ = column('cnf_write', [phase(t, 'cnf_write') for t in trials])
+    row['peak_rss_mb'] = max(t.get('peak_rss_mb', -1) for t in trials)
+    for name in SOLVER_STATS:
+        row[name] = first.get(name, '')
+    if memory:
+        for name in MEMORY_HEADER:
+            row[name] = statistics.median(t.get(name, -1) for t in trials)
+    return row
+
+def case_options(presolve=False, amo='auto', cache_dir=None, store='count', memory=False, write_cnf=True,
+                 solve=False, backend='glucose3', templates=True, profile=None, conflicts=None, propagations=None):
+    """run_case / run_isolated 的 opts (各项含义见 run_benchmark)。"""
+    return {'presolve': presolve, 'amo': amo, 'cache_dir': cache_dir, 'store': store, 'memory': memory,
+            'write_cnf': write_cnf, 'solve': solve, 'backend': backend, 'templates': templates,
+            'profile': profile, 'conflicts': conflicts, 'propagations': propagations}
+
+def run_benchmark(clue_files, approaches_to_test, timeout_s=60, presolve=False, amo='auto', cache_dir=None,
+                  store='count', memory=False, trials=1, write_cnf=True, solve=False, backend='glucose3',
+                  templates=True, profile=None, profiles=None, conflicts=None, propagations=None):
     """
-    对给定的文件和方法进行基准测试，并返回结果。
+    对给定的文件和方法进行端到端基准测试，返回每个 (文件, 方法) 一行的结果 (dict)。
+    每次试验都在独立的子进程中运行 (run_case)，超过 timeout_s 秒即被终止；
+    共运行 trials 次，各阶段耗时取中位数并记录四分位距 (IQR)。
+    presolve=True 时先进行行求解预处理，其耗时计入编码时间。
+    amo 指定 at-most-one 约束的编码方式 (见 solvers/cardinality.py)。
+    cache_dir 不为空时使用该目录下的 CNFCache，命中的条目直接从磁盘加载 (此时记录的是加载时间)。
+    store 指定子句的存放方式 (见 make_sink)；memory=True 时额外记录
+    tracemalloc 峰值内存以及编码期间的 GC 次数与耗时。
+    write_cnf / solve 控制是否测量写 CNF 与求解 (backend 为 PySAT 后端名称) 两个阶段；
+    conflicts / propagations 为求解的冲突 / 传播预算，用完时该行状态为 limit。
+    求解器统计 (conflicts 等) 与求解调用本身的耗时 (sat_time_s) 记入 CSV。
+    templates=False 时不使用行模板 (见 solvers/templates.py)，每行都重新编码。
+    profile 不为 None 时逐行分析编码开销，每个 (文件, 方法) 最后一次试验的报告
+    以 profiles[文件名][方法编号] 的形式放入 profiles (dict)。
     """
+    opts = case_options(presolve, amo, cache_dir, store, memory, write_cnf, solve, backend, templates,
+                        profile, conflicts, propagations)
     results = []
-    
+    hits = misses = 0
+
     for file_path in clue_files:
         print(f"\n--- 正在测试: {file_path.name} ---")
-        try:
-            puzzle = parser.parse_clues(str(file_path))
-        except Exception as e:
-            print(f"  -> 解析失败: {e}")
-            continue
-
         for approach_num in approaches_to_test:
             print(f"  使用方法 {approach_num}...")
-            
-            # 创建新的 VarManager 和 encoder
-            vm = VarManager()
-            try:
-                encoder = get_encoder(approach_num)
-            except ImportError:
-                print(f"  -> 无法导入方法 {approach_num}, 跳过。")
-                continue
+            runs = []
+            for _ in range(trials):
+                t = run_isolated(file_path, approach_num, opts, timeout_s)
+                runs.append(t)
+                hits += t.get('cache') == 'hit'
+                misses += t.get('cache') == 'miss'
+                if t['status'] in ('timeout', 'error', 'memout', 'crashed'):
+                    break
+            row = summarize(file_path, approach_num, runs, timeout_s, memory)
+            results.append(row)
+            if profiles is not None and 'profile' in runs[-1]:
+                profiles.setdefault(file_path.name, {})[approach_num] = runs[-1]['profile']
 
-            start_time = time.time()
-            try:
-                # 注意：这里我们不真正运行求解器，只关注编码阶段的性能
-                clauses = encoder(puzzle, vm)
-                end_time = time.time()
-                
-                encoding_time = end_time - start_time
-                num_vars = vm.nvars()
-                num_clauses = len(clauses)
-                
-                if encoding_time > timeout_s:
-                    print(f"  -> 编码超时 ( > {timeout_s}s )")
-                    results.append([file_path.name, approach_num, -1, -1, encoding_time])
-                else:
-                    print(f"  -> 完成: {num_vars} 变量, {num_clauses} 子句, {encoding_time:.4f} 秒")
-                    results.append([file_path.name, approach_num, num_vars, num_clauses, encoding_time])
-
-            except Exception as e:
-                print(f"  -> 编码时发生错误: {e}")
-                results.append([file_path.name, approach_num, -1, -1, -1]) # -1 代表错误
+            status = row['status']
+            if status == 'timeout':
+                print(f"  -> 超时 ( > {timeout_s}s )")
+            elif status in ('error', 'memout', 'crashed'):
+                print(f"  -> 运行失败 ({status}): {runs[-1].get('error', '')}")
+            else:
+                line = (f"  -> {status}: {row['variables']} 变量, {row['clauses']} 子句, "
+                        f"编码 {row['encoding_time_s']:.4f} 秒 (IQR {row['encoding_time_iqr_s']:.4f})")
+                if row['solve_time_s'] != '':
+                    line += f", 求解 {row['solve_time_s']:.4f} 秒"
+                print(line + f", 总计 {row['total_time_s']:.4f} 秒, 峰值 RSS {row['peak_rss_mb']:.1f} MB")
+                if memory:
+                    print(f"     峰值内存 {row['peak_mem_mb']:.1f} MB, GC {row['gc_collections']} 次 / {row['gc_time_s']:.4f} 秒")
 
+    if hits or misses:
+        print(f"CNF cache: {hits} hits, {misses} misses")
     return results
 
+def load_results(path):
+    """读取结果 CSV (compare_results/ 格式，可带额外列)，返回 {(puzzle, approach): row}。"""
+    rows = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            rows[(row['puzzle'], int(row['approach']))] = row
+    return rows
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def compare_results(current, baseline, threshold=0.1, min_delta=0.01):
+    """
+    与基线结果比较，返回回归列表 [(puzzle, approach, 列名, 基线值, 当前值)]。
+    耗时列比基线慢 threshold (相对) 且 min_delta 秒 (绝对) 以上视为回归；
+    变量数/子句数增加、或基线成功而当前失败 (-1) 也视为回归。
+    """
+    regressions = []
+    for row in current:
+        key = (row['puzzle'], int(row['approach']))
+        base = baseline.get(key)
+        if base is None:
+            continue
+        base_ok = (_number(base.get('variables')) or -1) >= 0
+        cur_ok = (_number(row.get('variables')) or -1) >= 0
+        if base_ok and not cur_ok:
+            regressions.append(key + ('status', base.get('status', 'ok'), row.get('status')))
+            continue
+        if not (base_ok and cur_ok):
+            continue
+        for col in SIZE_COLUMNS:
+            old, new = _number(base.get(col)), _number(row.get(col))
+            if old is not None and new is not None and new > old:
+                regressions.append(key + (col, old, new))
+        for col in TIME_COLUMNS:
+            old, new = _number(base.get(col)), _number(row.get(col))
+            if old is None or new is None or old < 0 or new < 0:
+                continue
+            if new > old * (1 + threshold) and new - old > min_delta:
+                regressions.append(key + (col, old, new))
+    return regressions
+
 def main():
-    parser = argparse.ArgumentParser(description="对 Nonogram SAT 编码方法进行基准测试。")
+    parser = argparse.ArgumentParser(description="对 Nonogram SAT 编码方法进行端到端基准测试。")
     parser.add_argument("clues_dir", help="包含 .clues 文件的目录。")
     parser.add_argument("--approaches", nargs='+', type=int, required=True, help="要测试的方法编号 (例如: 1 2 4)。")
     parser.add_argument("--output", default="benchmark_results.csv", help="输出的 CSV 文件名。")
-    parser.add_argument("--timeout", type=int, default=300, help="单个编码任务的超时时间（秒）。")
+    parser.add_argument("--timeout", type=float, default=300, help="单次试验的超时时间（秒），超时的子进程会被终止。")
+    parser.add_argument("--amo", default="auto", choices=AMO_METHODS, help="at-most-one 约束的编码方式。")
+    parser.add_argument("--cache", action="store_true", help="使用磁盘 CNF 缓存 (命中时跳过编码) 与解析缓存。")
+    parser.add_argument("--presolve", action="store_true", help="编码前先用行求解预处理确定单元格。")
+    parser.add_argument("--store", default="count", choices=STORES, help="子句的存放方式: 只计数 / Python 列表 / ClauseBuffer。")
+    parser.add_argument("--memory", action="store_true", help="记录峰值内存 (tracemalloc) 与 GC 统计，CSV 增加相应列。")
+    parser.add_argument("--trials", type=int, default=1, help="每个 (拼图, 方法) 重复运行的次数，耗时取中位数。")
+    parser.add_argument("--solve", action="store_true", help="同时测量求解阶段 (PySAT)。")
+    parser.add_argument("--backend", default="glucose3", help="求解使用的 PySAT 后端。")
+    parser.add_argument("--conflicts", type=int, default=None, help="求解的冲突数预算 (需要 --solve)。")
+    parser.add_argument("--propagations", type=int, default=None, help="求解的传播数预算 (需要 --solve)。")
+    parser.add_argument("--no-templates", action="store_true", help="不使用行模板，每一行都单独编码。")
+    parser.add_argument("--profile", metavar="JSON", help="逐行分析编码开销 (变量、子句、耗时；配合 --memory 还有内存)，报告写入该 JSON 文件。")
+    parser.add_argument("--profile-top", type=int, default=profiling.DEFAULT_TOP, help="报告中每一类列出的行数。")
+    parser.add_argument("--no-cnf", action="store_true", help="不测量写 DIMACS 文件的阶段。")
+    parser.add_argument("--compare", metavar="BASELINE_CSV", help="与基线 CSV 比较并标出性能回归。")
+    parser.add_argument("--threshold", type=float, default=0.1, help="耗时回归的相对阈值 (默认 0.1 即 10%%)。")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="耗时回归的最小绝对差 (秒)，用于过滤噪声。")
 
     args = parser.parse_args()
 
     clues_path = Path(args.clues_dir)
     if not clues_path.is_dir():
         print(f"错误: '{args.clues_dir}' 不是一个有效的目录。")
-        return
+        return 2
 
     clue_files = sorted(list(clues_path.glob('*.clues')))
     if not clue_files:
         print(f"在 '{args.clues_dir}' 中未找到任何 .clues 文件。")
-        return
+        return 2
+
+    baseline = load_results(args.compare) if args.compare else None
 
     print(f"找到 {len(clue_files)} 个拼图文件。将使用方法 {args.approaches} 进行测试。")
     
-    benchmark_data = run_benchmark(clue_files, args.approaches, args.timeout)
+    profiles = {} if args.profile else None
+    benchmark_data = run_benchmark(clue_files, args.approaches, args.timeout, args.presolve, args.amo,
+                                   CACHE_DIR if args.cache else None, args.store, args.memory,
+                                   trials=args.trials, write_cnf=not args.no_cnf, solve=args.solve,
+                                   backend=args.backend, templates=not args.no_templates,
+                                   profile=args.profile_top if args.profile else None, profiles=profiles,
+                                   conflicts=args.conflicts, propagations=args.propagations)
 
     # 写入 CSV 文件
-    header = ['puzzle', 'approach', 'variables', 'clauses', 'encoding_time_s']
+    header = BASE_HEADER + EXTRA_HEADER
+    if args.memory:
+        header += MEMORY_HEADER
     with open(args.output, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
+        writer = csv.DictWriter(f, fieldnames=header, restval='')
+        writer.writeheader()
         writer.writerows(benchmark_data)
 
     print(f"\n基准测试完成！结果已保存到 '{args.output}'。")
     print("您现在可以使用此 CSV 文件生成图表以进行性能比较。")
+    if profiles is not None:
+        profiling.write_report(args.profile, profiles)
+        print(f"逐行分析报告已保存到 '{args.profile}'。")
 
+    if baseline is not None:
+        regressions = compare_results(benchmark_data, baseline, args.threshold, args.min_delta)
+        if not regressions:
+            print(f"与基线 '{args.compare}' 相比没有发现回归。")
+            return 0
+        print(f"\n与基线 '{args.compare}' 相比发现 {len(regressions)} 处回归:")
+        print(f"{'puzzle':<24} {'approach':>8} {'column':<18} {'baseline':>14} {'current':>14}")
+        for puzzle, approach, col, old, new in regressions:
+            print(f"{puzzle:<24} {approach:>8} {col:<18} {str(old):>14} {str(new):>14}")
+        return 1
+    return 0
 
-if __name__ == "__main__":
-    main()
 
+if __name__ == "__main__":
+    raise SystemExit(main())
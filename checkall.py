@@ -1,41 +1,65 @@
-import requests
 import sys
 import pathlib
 import json
 
-if len(sys.argv) != 3:
-    print('Usage: checkall.py <clue_dir> <solution_dir>')
+# --remote: the check server; --daemon: the local solve daemon (python -m solvers.daemon)
+args = [a for a in sys.argv[1:] if a not in ('--remote', '--daemon')]
+remote = '--remote' in sys.argv
+daemon = '--daemon' in sys.argv
+
+if len(args) != 2 or (remote and daemon):
+    print('Usage: checkall.py [--remote | --daemon] <clue_dir> <solution_dir>')
     sys.exit(1)
 
-clues_dir = pathlib.Path(sys.argv[1])
-solutions_dir = pathlib.Path(sys.argv[2])
+clues_dir = pathlib.Path(args[0])
+solutions_dir = pathlib.Path(args[1])
 
 correct = 0
 wrong = 0
 
-for solution_path in solutions_dir.glob('*.solution'):
+if not remote and not daemon:
+    # check locally (in parallel) with the offline verifier
+    from solvers.verify import check_directory
 
-    clues = (clues_dir / solution_path.name.replace('solution', 'clues')).read_text()
-    clue_lines = clues.splitlines()
-    solution = solution_path.read_text()
+    for solution_path, result in check_directory(clues_dir, solutions_dir):
+        print(solution_path.name)
+        print('   ', result.describe().replace('\n', '\n    '))
+        if result.ok:
+            correct += 1
+        else:
+            wrong += 1
+else:
+    if daemon:
+        from solvers.daemon import request
+    else:
+        import requests
 
-    # solution file format is different on the server
-    for i, c in enumerate('-abcdefghi'):
-        solution = solution.replace(c, str(i))
+        def request(data):
+            return requests.get(f'http://jfschaefer.de:8973/verify/ws2425a31a/nonograms', data=json.dumps(data)).text
 
-    data = {
-        'goal': 'check',
-        'clues': clues,
-        'solution': 'anonymous problem\n' + clue_lines[0].split()[0] + '\n' + clue_lines[1] + '\n' + solution,
-    }
+    for solution_path in solutions_dir.glob('*.solution'):
 
-    response = requests.get(f'http://jfschaefer.de:8973/verify/ws2425a31a/nonograms', data=json.dumps(data))
-    print(solution_path.name)
-    print('   ', response.text)
-    if response.text == 'Correct':
-        correct += 1
-    else:
-        wrong += 1
+        clues = (clues_dir / solution_path.name.replace('solution', 'clues')).read_text()
+        clue_lines = clues.splitlines()
+        solution = solution_path.read_text()
+
+        # solution file format is different on the server
+        for i, c in enumerate('-abcdefghi'):
+            solution = solution.replace(c, str(i))
+
+        data = {
+            'goal': 'check',
+            'clues': clues,
+            'solution': 'anonymous problem\n' + clue_lines[0].split()[0] + '\n' + clue_lines[1] + '\n' + solution,
+        }
+
+        text = request(data)
+        print(solution_path.name)
+        print('   ', text.replace('\n', '\n    '))
+        if text == 'Correct':
+            correct += 1
+        else:
+            wrong += 1
 
 print()
 print(f'Correct: {correct}, Wrong: {wrong}')
@@ -1,14 +1,29 @@
-import sys, requests, pathlib, json
+import sys, pathlib, json
 
-if len(sys.argv) != 4:
-    print('Usage: nonogram.py [check|visualize] path/to/nonogram.clues path/to/nonogram.solution')
+# --daemon: send the request to the local solve daemon (python -m solvers.daemon) instead of the server
+daemon = '--daemon' in sys.argv
+argv = [a for a in sys.argv if a != '--daemon']
+
+if len(argv) != 4:
+    print('Usage: nonogram.py [check|visualize] path/to/nonogram.clues path/to/nonogram.solution [--daemon]')
+    print('       nonogram.py solve path/to/nonogram.clues path/to/nonogram.solution --daemon')
     sys.exit()
 
-goal = sys.argv[1]
-assert goal in {'check', 'visualize'}
-clues = pathlib.Path(sys.argv[2]).read_text()
+goal = argv[1]
+assert goal in {'check', 'visualize'} or (daemon and goal == 'solve')
+clues = pathlib.Path(argv[2]).read_text()
 clue_lines = clues.splitlines()
-solution_path = pathlib.Path(sys.argv[3])
+solution_path = pathlib.Path(argv[3])
+
+if goal == 'solve':
+    from solvers.daemon import request
+    answer = json.loads(request({'goal': 'solve', 'clues': clues}))
+    print(answer['status'], ', '.join(f'{k} {v:.3f}s' for k, v in answer['times'].items()))
+    if 'solution' in answer:
+        print(f'Writing {solution_path}')
+        solution_path.write_text(answer['solution'])
+    sys.exit()
+
 solution = solution_path.read_text()
 
 # solution file format is different on the server
@@ -21,12 +36,18 @@ data = {
     'solution': 'anonymous problem\n' + clue_lines[0].split()[0] + '\n' + clue_lines[1] + '\n' + solution,
 }
 
-response = requests.get(f'http://jfschaefer.de:8973/verify/ws2425a31a/nonograms', data=json.dumps(data))
+if daemon:
+    from solvers.daemon import request
+    text = request(data)
+else:
+    import requests
+    response = requests.get(f'http://jfschaefer.de:8973/verify/ws2425a31a/nonograms', data=json.dumps(data))
+    text = response.text
 
 if goal == 'check':
-    print(response.text)
+    print(text)
 else:
     path = solution_path.parent / (solution_path.name + '.html')
     print(f'Creating {path}')
     with open(path, 'w') as fp:
-        fp.write(f'<html><body><div style="width: 10cm;">{response.text}</div></body></html>')
+        fp.write(f'<html><body><div style="width: 10cm;">{text}</div></body></html>')
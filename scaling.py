@@ -0,0 +1,278 @@
+"""
+规模曲线测试: 对一个拼图族按规模从小到大依次测试各个方法，拟合增长指数并画图。
+
+拼图来自一个目录 (例如 generated/stairs，规模取自文件头) 或由 solvers.generate
+按 --generate / --sizes 现场生成。每个方法按规模递增运行 (与 benchmark.py 相同，
+每次都在独立子进程中，见 run_isolated)；一旦某个规模的编码 + 求解时间超过
+--budget 秒 (或超时、内存不足、出错)，该方法就不再测试更大的规模。
+--step 让目录中的规模至少按该倍数增长，不必把 99 个文件逐个跑完。
+
+对变量数、子句数、编码时间与求解时间分别按单元格数在双对数坐标下做最小二乘拟合，
+得到经验增长指数 (值 ∝ 单元格数^k)。只拟合较大的一半规模 (FIT_TAIL)，小规模上的
+固定开销 (进程、求解器启动) 会把指数压低；太短的耗时 (< MIN_FIT_TIME 秒) 只是噪声，不参与拟合。
+输出目录中写入:
+  points.csv    每个 (方法, 规模) 一行
+  summary.csv   每个方法一行: 各指标的增长指数、预算内的最大规模、停止原因
+  <指标>.png    双对数图，每个方法一条曲线与拟合直线 (需要 pillow)
+
+    python scaling.py generated/stairs --approaches 1 2 4 --budget 10
+    python scaling.py --generate random --sizes 10 20 40 80 160 320 640 --density 0.5 --approaches 2 4
+"""
+import argparse
+import csv
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from benchmark import case_options, run_isolated
+
+METRICS = ['variables', 'clauses', 'encode_s', 'solve_s']
+TIME_METRICS = ['encode_s', 'solve_s']
+FAILED = ('timeout', 'error', 'memout', 'crashed')
+MIN_FIT_TIME = 0.005
+FIT_TAIL = 0.5
+DEFAULT_OUT = 'scaling_results'
+
+POINT_HEADER = ['approach', 'puzzle', 'size', 'cells', 'status'] + METRICS
+SUMMARY_HEADER = ['approach', 'points', 'max_size', 'max_cells', 'stopped'] + [f'{m}_exp' for m in METRICS]
+
+# 图的颜色，按方法编号循环使用
+SERIES_COLORS = ['#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b']
+
+
+def puzzle_size(path):
+    """(边长, 单元格数)，取自 .clues 文件的第一行。"""
+    with open(path) as fp:
+        head = fp.readline().split()
+    if head[0] == 'rect':
+        h, w = int(head[1]), int(head[2])
+        return h, h * w
+    n = int(head[1])
+    return n, 3 * n * (n - 1) + 1
+
+
+def pick_sizes(files, step):
+    """按单元格数排序，只保留比上一个至少大 step 倍的文件 (step <= 1 时全部保留)。"""
+    sized = sorted(((puzzle_size(f), f) for f in files), key=lambda x: (x[0][1], x[1].name))
+    picked = []
+    for (size, cells), f in sized:
+        if not picked or cells >= picked[-1][2] * step:
+            picked.append((f, size, cells))
+    return picked
+
+
+def generated_files(family, sizes, out_dir, density=None, ncolors=1, hex_grid=False, seed=0):
+    from solvers.generate import write_instance
+    kind = 'hex' if hex_grid else 'rect'
+    files = []
+    for size in sizes:
+        dims = (size,) if hex_grid else (size, size)
+        files.append(write_instance(out_dir, family, kind, dims, density, ncolors, seed))
+    return files
+
+
+def sweep(files, approach, opts, budget, timeout):
+    """
+    按规模递增测试一个方法，返回 (测试点列表, 停止原因)。
+    停止原因为 None (全部完成)、'budget' 或失败的状态。
+    """
+    points = []
+    for path, size, cells in files:
+        result = run_isolated(path, approach, opts, timeout)
+        status = result['status']
+        times = result.get('times', {})
+        point = {'approach': approach, 'puzzle': path.name, 'size': size, 'cells': cells, 'status': status,
+                 'variables': result.get('variables'), 'clauses': result.get('clauses'),
+                 'encode_s': (times.get('presolve') or 0.0) + times['encode'] if 'encode' in times else None,
+                 'solve_s': times.get('solve')}
+        points.append(point)
+        if status in FAILED:
+            print(f"  方法 {approach}, {path.name}: {status}，停止")
+            return points, status
+        total = (point['encode_s'] or 0.0) + (point['solve_s'] or 0.0)
+        print(f"  方法 {approach}, {path.name} ({cells} 单元格): {point['variables']} 变量, "
+              f"{point['clauses']} 子句, 编码 {point['encode_s'] or 0:.3f} 秒, 求解 {point['solve_s'] or 0:.3f} 秒")
+        if total > budget:
+            print(f"  方法 {approach}: 超出预算 {budget} 秒，停止")
+            return points, 'budget'
+    return points, None
+
+
+def fit_growth(points, metric, tail=FIT_TAIL):
+    """
+    (指数 k, 系数 c, 拟合的单元格数范围)，使 metric ≈ c * 单元格数^k，只用较大的 tail 部分规模；
+    有效点少于 2 个时为 None。
+    """
+    valid = []
+    for p in points:
+        v = p.get(metric)
+        if p['status'] in FAILED or v is None or v <= 0:
+            continue
+        if metric in TIME_METRICS and v < MIN_FIT_TIME:
+            continue
+        valid.append((math.log(p['cells']), math.log(v)))
+    valid = valid[-max(2, math.ceil(len(valid) * tail)):]
+    xs = [x for x, _ in valid]
+    ys = [y for _, y in valid]
+    if len(set(xs)) < 2:
+        return None
+    k, logc = np.polyfit(xs, ys, 1)
+    return float(k), math.exp(logc), math.exp(xs[0]), math.exp(xs[-1])
+
+
+def summarize(approach, points, stopped):
+    ok = [p for p in points if p['status'] not in FAILED]
+    row = {'approach': approach, 'points': len(ok), 'stopped': stopped or ''}
+    # 预算内的最大规模: 最后一个没有失败也没有超出预算的点
+    within = ok[:-1] if stopped == 'budget' else ok
+    row['max_size'] = within[-1]['size'] if within else ''
+    row['max_cells'] = within[-1]['cells'] if within else ''
+    for m in METRICS:
+        fit = fit_growth(ok, m)
+        row[f'{m}_exp'] = '' if fit is None else round(fit[0], 3)
+    return row
+
+
+def _log_range(values):
+    lo, hi = math.floor(math.log10(min(values))), math.ceil(math.log10(max(values)))
+    return lo, max(hi, lo + 1)
+
+
+def plot_metric(path, metric, series, width=720, height=480):
+    """
+    画一个指标的双对数图: series 为 {方法: 测试点列表}，每个方法一条折线与虚线拟合直线。
+    需要 pillow。
+    """
+    try:
+        from PIL import Image, ImageDraw, ImageFont
+    except ImportError:
+        raise ImportError('画图需要 pillow (pip install pillow)')
+    data = {a: [(p['cells'], p[metric]) for p in pts
+                if p['status'] not in FAILED and p.get(metric) is not None and p[metric] > 0]
+            for a, pts in series.items()}
+    data = {a: xy for a, xy in data.items() if xy}
+    if not data:
+        return None
+
+    left, right, top, bottom = 70, 170, 40, 50
+    xlo, xhi = _log_range([x for xy in data.values() for x, _ in xy])
+    ylo, yhi = _log_range([y for xy in data.values() for _, y in xy])
+    pw, ph = width - left - right, height - top - bottom
+
+    def at(x, y):
+        return (left + (math.log10(x) - xlo) / (xhi - xlo) * pw,
+                top + ph - (math.log10(y) - ylo) / (yhi - ylo) * ph)
+
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    draw.text((left, 12), f'{metric} vs cells (log-log)', fill='black', font=font)
+    for e in range(xlo, xhi + 1):
+        x, _ = at(10 ** e, 10 ** ylo)
+        draw.line([(x, top), (x, top + ph)], fill='#dddddd')
+        draw.text((x - 10, top + ph + 6), f'1e{e}', fill='black', font=font)
+    for e in range(ylo, yhi + 1):
+        _, y = at(10 ** xlo, 10 ** e)
+        draw.line([(left, y), (left + pw, y)], fill='#dddddd')
+        draw.text((left - 40, y - 6), f'1e{e}', fill='black', font=font)
+    draw.rectangle([left, top, left + pw, top + ph], outline='black')
+    draw.text((left + pw // 2 - 15, height - 20), 'cells', fill='black', font=font)
+
+    for i, (approach, xy) in enumerate(sorted(data.items())):
+        color = SERIES_COLORS[i % len(SERIES_COLORS)]
+        pts = [at(x, y) for x, y in xy]
+        if len(pts) > 1:
+            draw.line(pts, fill=color, width=2)
+        for x, y in pts:
+            draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill=color)
+        label = f'approach {approach}'
+        fit = fit_growth(series[approach], metric)
+        if fit is not None:
+            k, c, x0, x1 = fit
+            a, b = at(x0, c * x0 ** k), at(x1, c * x1 ** k)
+            # 虚线: 拟合直线
+            n = 20
+            for j in range(0, n, 2):
+                draw.line([(a[0] + (b[0] - a[0]) * j / n, a[1] + (b[1] - a[1]) * j / n),
+                           (a[0] + (b[0] - a[0]) * (j + 1) / n, a[1] + (b[1] - a[1]) * (j + 1) / n)], fill=color)
+            label += f'  k={k:.2f}'
+        ly = top + 10 + 18 * i
+        draw.line([(left + pw + 12, ly + 6), (left + pw + 32, ly + 6)], fill=color, width=2)
+        draw.text((left + pw + 38, ly), label, fill='black', font=font)
+    img.save(path)
+    return path
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=header, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='按规模扫描一个拼图族，拟合增长指数并画出规模曲线。')
+    parser.add_argument('clues_dir', nargs='?', help='包含 .clues 文件的目录 (与 --generate 二选一)。')
+    parser.add_argument('--generate', metavar='FAMILY', help='用 solvers.generate 现场生成该族的拼图。')
+    parser.add_argument('--sizes', type=int, nargs='+', help='--generate 时的边长列表。')
+    parser.add_argument('--density', type=float, default=None, help='--generate 时的填充密度。')
+    parser.add_argument('--colors', type=int, default=1, help='--generate 时的颜色数。')
+    parser.add_argument('--hex', action='store_true', help='--generate 时生成六边形拼图。')
+    parser.add_argument('--approaches', nargs='+', type=int, default=[1, 2, 4], help='要测试的方法编号。')
+    parser.add_argument('--budget', type=float, default=10, help='编码 + 求解超过该秒数后不再测试更大的规模。')
+    parser.add_argument('--timeout', type=float, default=None, help='单次运行的超时 (秒，默认为预算的 4 倍)。')
+    parser.add_argument('--step', type=float, default=1.0, help='目录中相邻规模的单元格数至少相差的倍数。')
+    parser.add_argument('--no-solve', action='store_true', help='只测量编码。')
+    parser.add_argument('--presolve', action='store_true', help='编码前先用行求解预处理。')
+    parser.add_argument('--out', default=DEFAULT_OUT, help='输出目录。')
+    args = parser.parse_args(argv[1:])
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    if args.generate:
+        if not args.sizes:
+            print('错误: --generate 需要 --sizes。')
+            return 2
+        paths = generated_files(args.generate, args.sizes, out / 'puzzles', args.density, args.colors, args.hex)
+    elif args.clues_dir and Path(args.clues_dir).is_dir():
+        paths = list(Path(args.clues_dir).glob('*.clues'))
+    else:
+        print('错误: 需要一个 .clues 目录或 --generate。')
+        return 2
+    files = pick_sizes(paths, args.step)
+    if not files:
+        print('没有找到任何 .clues 文件。')
+        return 2
+
+    timeout = args.timeout or 4 * args.budget
+    opts = case_options(presolve=args.presolve, write_cnf=False, solve=not args.no_solve)
+    print(f'{len(files)} 个规模 ({files[0][2]} .. {files[-1][2]} 单元格)，方法 {args.approaches}，预算 {args.budget} 秒。')
+
+    series, summary, points = {}, [], []
+    for approach in args.approaches:
+        pts, stopped = sweep(files, approach, opts, args.budget, timeout)
+        series[approach] = pts
+        points += pts
+        summary.append(summarize(approach, pts, stopped))
+
+    write_csv(out / 'points.csv', POINT_HEADER, points)
+    write_csv(out / 'summary.csv', SUMMARY_HEADER, summary)
+    print(f"\n{'方法':<6}{'点数':>6}{'最大规模':>10}{'停止':>10}" + ''.join(f'{m:>12}' for m in METRICS))
+    for row in summary:
+        print(f"{row['approach']:<6}{row['points']:>6}{str(row['max_size']):>10}{row['stopped'] or '-':>10}"
+              + ''.join(f"{str(row[m + '_exp']):>12}" for m in METRICS))
+
+    try:
+        plots = [plot_metric(out / f'{m}.png', m, series) for m in METRICS]
+    except ImportError as e:
+        print(e)
+    else:
+        print(f"图已保存: {', '.join(str(p) for p in plots if p)}")
+    print(f"结果已保存到 '{out}'。")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -1,3 +1,5 @@
 __all__ = [
-    'varmap', 'parser', 'approach1', 'approach2', 'approach3', 'approach4', 'solver_pysat', 'run'
+    'varmap', 'parser', 'automaton', 'presolve', 'native', 'cardinality', 'cells', 'sinks', 'templates', 'profiling', 'cache',
+    'approach1', 'approach2', 'approach3', 'approach4', 'solver_pysat', 'portfolio', 'batch', 'verify', 'render', 'run',
+    'daemon', 'generate', 'session'
 ]
@@ -1,42 +1,66 @@
 """
 Approach 1: enumerate all valid arrangements for each line and link to cell color vars.
+
+Arrangements are block positions only; '?' blocks get per-block colour
+variables instead of one arrangement per colour choice.
 """
 from .varmap import VarManager
+from .parser import parse_clue_line  # re-exported, it used to live here
+from .cells import clause_sink, encode_cells
+from .templates import encode_lines
+from .cardinality import exactly_one
+from .profiling import note
 
-def parse_clue_line(clue_line):
-    """
-    Parse a clue line into a list of (length, color_index_or_None).
-    """
-    parts = clue_line.replace(',', ' ').split()
-    parsed = []
-
-    for token in parts:
-        token = token.strip()
-        if not token:
-            continue
-        if token[-1].isalpha() or token[-1] == '?':
-            n = int(token[:-1])
-            if token[-1] == '?':
-                parsed.append((n, None))
-            else:
-                parsed.append((n, ord(token[-1]) - ord('a')))
-        else:
-            raise ValueError(f"Invalid clue token: {token}")
+# Bump when the generated CNF changes (invalidates the CNF cache)
+VERSION = 4
 
-    return parsed
+def block_gaps(blocks):
+    """gaps[i]: cells needed between blocks i and i+1 (1 only for two blocks of the same fixed colour)."""
+    return [1 if blocks[i][1] is not None and blocks[i][1] == blocks[i + 1][1] else 0
+            for i in range(len(blocks) - 1)]
 
-def enumerate_starts(length, blocks):
+def enumerate_starts(length, blocks, doms=None):
+    """
+    Yield every list of block start positions that fits the line.  Blocks of
+    the same fixed colour keep a gap; '?' blocks may touch their neighbours
+    (their colours must then differ, see `encode_line`).
+    With `doms` (allowed colours per position) placements that would put a block
+    or background on a cell that cannot take it are pruned early.
+    """
     k = len(blocks)
+    gaps = block_gaps(blocks) + [0]
+    # room needed by blocks i.. (with their gaps)
+    need = [0] * (k + 1)
+    for i in range(k - 1, -1, -1):
+        need[i] = need[i + 1] + blocks[i][0] + (gaps[i] if i + 1 < k else 0)
+
+    # Prefix counts of cells that cannot be background / cannot hold block i
+    bad_bg = [0] * (length + 1)
+    bad_blk = [[0] * (length + 1) for _ in range(k)]
+    if doms is not None:
+        for p in range(length):
+            bad_bg[p + 1] = bad_bg[p] + (0 not in doms[p])
+            for i, (_, color) in enumerate(blocks):
+                if color is None:
+                    ok = any(c != 0 for c in doms[p])
+                else:
+                    ok = color + 1 in doms[p]
+                bad_blk[i][p + 1] = bad_blk[i][p] + (not ok)
+
     def helper(i, minpos, acc):
+        # minpos: first cell after the previous block
         if i == k:
-            yield list(acc)
+            if bad_bg[length] - bad_bg[minpos] == 0:
+                yield list(acc)
             return
 
         size, _ = blocks[i]
-        for s in range(minpos, length - size + 1):
+        first = minpos + (gaps[i - 1] if i else 0)
+        for s in range(first, length - need[i] + 1):
+            if bad_bg[s] - bad_bg[minpos] > 0:
+                break
             end = s + size
-            remaining = sum(b[0] for b in blocks[i + 1 :])
-            if length - end < remaining:
+            if bad_blk[i][end] - bad_blk[i][s] > 0:
                 continue
 
             acc.append(s)
@@ -45,82 +69,77 @@ def enumerate_starts(length, blocks):
 
     yield from helper(0, 0, [])
 
-def enumerate_block_colors(blocks, ncolors):
-    choices = []
-    for _, color in blocks:
-        if color is None:
-            choices.append(list(range(ncolors - 1)))  # a,b,c,...
-        else:
-            choices.append([color])
-
-    def helper(i, acc):
-        if i == len(choices):
-            yield list(acc)
-            return
-        for c in choices[i]:
-            acc.append(c)
-            yield from helper(i + 1, acc)
-            acc.pop()
+def encode_line(lidx, blocks, length, ncolors, cl, doms, vm, clauses, amo='auto'):
+    """
+    Encode one line (see `templates`): one selector per arrangement of block
+    positions, and exactly one selector.  A selector fixes background and
+    fixed-colour cells directly.  A '?' block has its own colour variables;
+    the selector marks the cells the block covers and a covered cell takes
+    the block's colour, so the number of arrangements does not depend on the
+    number of colours.
+    """
+    arrangements = list(enumerate_starts(length, blocks, doms))
+    note(arrangements=len(arrangements))
+    unknown = [b_i for b_i, (_, color) in enumerate(blocks) if color is None]
+    touching = [b_i for b_i in range(1, len(blocks))
+                if blocks[b_i - 1][1] is None or blocks[b_i][1] is None]
+
+    base = vm.reserve(len(arrangements), 'arr', lidx)
+    selectors = list(range(base, base + len(arrangements)))
+    # block colour, cover and touch variables of the '?' blocks
+    b_cols, cover, touch = {}, {}, {}
+    if unknown:
+        for b_i in unknown:
+            base = vm.reserve(ncolors - 1, 'b_col', lidx, b_i)
+            b_cols[b_i] = list(range(base, base + ncolors - 1))
+            covered = sorted({p for starts in arrangements
+                              for p in range(starts[b_i], starts[b_i] + blocks[b_i][0])})
+            base = vm.reserve(len(covered), 'cover', lidx, b_i)
+            cover[b_i] = {p: base + k for k, p in enumerate(covered)}
+        for b_i in touching:
+            touch[b_i] = vm.reserve(1, 'touch', lidx, b_i)
+
+    for sel, starts in zip(selectors, arrangements):
+        cell_colors = [0] * length
+        for b_i, (size, color) in enumerate(blocks):
+            s = starts[b_i]
+            for p in range(s, s + size):
+                cell_colors[p] = None if color is None else color + 1
+        for pos, col in enumerate(cell_colors):
+            if col is not None:
+                clauses.append([-sel, cl[pos * ncolors + col]])
+        for b_i in unknown:
+            s = starts[b_i]
+            for p in range(s, s + blocks[b_i][0]):
+                clauses.append([-sel, cover[b_i][p]])
+        for b_i in touching:
+            if starts[b_i] == starts[b_i - 1] + blocks[b_i - 1][0]:
+                clauses.append([-sel, touch[b_i]])
+
+    exactly_one(selectors, vm, clauses, amo)
+
+    for b_i in unknown:
+        exactly_one(b_cols[b_i], vm, clauses, amo)
+        # a covered cell has the block's colour (a cover variable is only ever forced true)
+        for p, cov in cover[b_i].items():
+            for c in range(ncolors - 1):
+                clauses.append([-cov, -b_cols[b_i][c], cl[p * ncolors + c + 1]])
+
+    # touching blocks must differ in colour
+    for b_i in touching:
+        for c in range(ncolors - 1):
+            clause = [-touch[b_i]]
+            for j in (b_i - 1, b_i):
+                if blocks[j][1] is None:
+                    clause.append(-b_cols[j][c])
+                elif blocks[j][1] != c:
+                    break
+            else:
+                clauses.append(clause)
+
 
-    yield from helper(0, [])
-
-def same_color_spacing_ok(starts, blocks, colors):
-    for i in range(1, len(blocks)):
-        if colors[i] == colors[i - 1]:
-            prev_start = starts[i - 1]
-            prev_size = blocks[i - 1][0]
-            if starts[i] < prev_start + prev_size + 1:
-                return False
-    return True
-
-def encode(puzzle, vm: VarManager):
-    clauses = []
-    colors = puzzle['colors']
-    ncolors = len(colors)
-
-    for coord in puzzle['cells']:
-        vars_cell = []
-        for col in range(ncolors):
-            vars_cell.append(vm.new(('cell', coord, col)))
-
-        clauses.append(vars_cell[:])
-        for i in range(len(vars_cell)):
-            for j in range(i + 1, len(vars_cell)):
-                clauses.append([-vars_cell[i], -vars_cell[j]])
-
-    for lidx, line in enumerate(puzzle['lines']):
-        blocks = parse_clue_line(line['clue'])
-        cells = line['cells']
-        line_len = len(cells)
-
-        selectors = []
-
-        for starts in enumerate_starts(line_len, blocks):
-            for block_colors in enumerate_block_colors(blocks, ncolors):
-                if not same_color_spacing_ok(starts, blocks, block_colors):
-                    continue
-
-                sel = vm.new(('line', lidx, 'arr', len(selectors)))
-                selectors.append(sel)
-
-                cell_colors = [0] * line_len
-                for b_i, (size, _) in enumerate(blocks):
-                    s = starts[b_i]
-                    color_idx = block_colors[b_i]
-                    for p in range(s, s + size):
-                        cell_colors[p] = color_idx + 1
-
-                for pos, col in enumerate(cell_colors):
-                    coord = cells[pos]
-                    v = vm.get(('cell', coord, col))
-                    clauses.append([-sel, v])
-
-        if not selectors:
-            clauses.append([])
-        else:
-            clauses.append(selectors[:])
-            for i in range(len(selectors)):
-                for j in range(i + 1, len(selectors)):
-                    clauses.append([-selectors[i], -selectors[j]])
-
-    return clauses
+def encode(puzzle, vm: VarManager, amo='auto', sink=None, templates=True):
+    clauses, out = clause_sink(puzzle, vm, sink)
+    lits = encode_cells(puzzle, vm, clauses, amo)
+    encode_lines(puzzle, vm, clauses, lits, encode_line, amo, templates)
+    return out
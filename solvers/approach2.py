@@ -1,101 +1,191 @@
 """
 Approach 2: Block-start variables with block-color selection.
+
+Each block may only start between its leftmost and rightmost placement, and
+its starts are tied to "starts at or before p" ladder variables, which carry
+the ordering, spacing and background constraints in O(L) clauses per block.
 """
 from .varmap import VarManager
-from .approach1 import parse_clue_line
+from .cells import clause_sink, encode_cells
+from .templates import encode_lines
+from .cardinality import at_most_one
+from .profiling import note
 
-def encode(puzzle, vm: VarManager):
-    clauses = []
-    colors = puzzle['colors']
-    ncolors = len(colors)
+# Bump when the generated CNF changes (invalidates the CNF cache)
+VERSION = 4
 
-    # 1. Cell color variables: Exactly one color per cell
-    for coord in puzzle['cells']:
-        cvars = [vm.new(('cell', coord, c)) for c in range(ncolors)]
-        clauses.append(cvars)
-        for i in range(ncolors):
-            for j in range(i + 1, len(cvars)):
-                clauses.append([-cvars[i], -cvars[j]])
+def can_hold(dom, fix_c):
+    """Whether a cell with colour domain `dom` can be covered by a block of colour `fix_c` (None for '?')."""
+    if fix_c is None:
+        return any(c != 0 for c in dom)
+    return fix_c + 1 in dom
 
-    # 2. Encode each line
-    for lidx, line in enumerate(puzzle['lines']):
-        cells = line['cells']
-        blocks = parse_clue_line(line['clue'])
-        L, K = len(cells), len(blocks)
-        
-        if K == 0:
-            for coord in cells:
-                clauses.append([vm.get(('cell', coord, 0))])
+def start_range(blocks, length):
+    """
+    [leftmost, rightmost] start of every block: all blocks before it packed to
+    the left, all blocks after it packed to the right.  Two adjacent blocks
+    need a gap only if both have the same fixed colour.
+    """
+    K = len(blocks)
+    gaps = [1 if blocks[i][1] is not None and blocks[i][1] == blocks[i + 1][1] else 0
+            for i in range(K - 1)] + [0]
+    left, pos = [], 0
+    for b_i, (sz, _) in enumerate(blocks):
+        left.append(pos)
+        pos += sz + gaps[b_i]
+    right, pos = [0] * K, length
+    for b_i in range(K - 1, -1, -1):
+        pos -= blocks[b_i][0]
+        right[b_i] = pos
+        if b_i > 0:
+            pos -= gaps[b_i - 1]
+    return left, right, gaps
+
+
+class Ladder:
+    """
+    Order ("starts at or before p") variables of one block over its feasible
+    starts.  at(p) is a literal, or True / False where the answer is fixed by
+    the start domain.
+    """
+
+    def __init__(self, positions, base):
+        self.positions = positions
+        # at or before the last feasible start is always true, so it has no variable
+        self.var = {p: base + k for k, p in enumerate(positions[:-1])}
+
+    def at(self, p):
+        positions = self.positions
+        if p < positions[0]:
+            return False
+        if p >= positions[-1]:
+            return True
+        # the latest feasible start <= p
+        lo, hi = 0, len(positions) - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if positions[mid] <= p:
+                lo = mid
+            else:
+                hi = mid
+        return self.var[positions[lo]]
+
+
+def neg(x):
+    """Negation of a literal or a True/False constant."""
+    return (not x) if isinstance(x, bool) else -x
+
+
+def add_clause(clauses, lits):
+    """Append a clause of literals and True/False constants (simplified)."""
+    if any(x is True for x in lits):
+        return
+    clauses.append([x for x in lits if x is not False])
+
+
+def encode_line(lidx, blocks, length, ncolors, cl, doms, vm, clauses, amo='auto'):
+    """Encode one line (see `templates`) with block-start and block-colour variables."""
+    L, K = length, len(blocks)
+
+    if K == 0:
+        for t in range(L):
+            clauses.append([cl[t * ncolors]])
+        return
+
+    # 2a. Create all block-related variables (starts, ladders and colors)
+    # Starts are restricted to [leftmost, rightmost]; with presolved domains,
+    # starts that would cover a cell no block colour can take are left out too.
+    # b_starts[b_i] maps each feasible start position to its variable.
+    left, right, gaps = start_range(blocks, L)
+    b_starts = []
+    ladders = []
+    b_cols = []
+    for b_i, (sz, fix_c) in enumerate(blocks):
+        positions = [p for p in range(left[b_i], right[b_i] + 1)
+                     if doms is None or all(can_hold(doms[t], fix_c) for t in range(p, p + sz))]
+        if not positions:
+            clauses.append([])
+            return
+        base = vm.reserve(len(positions), 'start', lidx, b_i)
+        b_starts.append({p: base + k for k, p in enumerate(positions)})
+        base = vm.reserve(len(positions) - 1, 'order', lidx, b_i)
+        ladders.append(Ladder(positions, base))
+        base = vm.reserve(ncolors - 1, 'b_col', lidx, b_i)
+        b_cols.append(list(range(base, base + ncolors - 1)))
+    note(starts=sum(len(starts) for starts in b_starts))
+
+    # 2b. Ladder monotonicity and channelling: block b starts at p iff it starts
+    # at or before p but not at or before the previous feasible start.  This
+    # also makes exactly one start true.
+    for b_i, (sz, fix_c) in enumerate(blocks):
+        ladder = ladders[b_i]
+        prev = False
+        for p, s_var in b_starts[b_i].items():
+            le = ladder.at(p)
+            add_clause(clauses, [neg(prev), le])
+            add_clause(clauses, [-s_var, le])
+            add_clause(clauses, [-s_var, neg(prev)])
+            add_clause(clauses, [s_var, neg(le), prev])
+            prev = le
+
+        if fix_c is not None:
+            clauses.append([b_cols[b_i][fix_c]])
+        else:
+            clauses.append(b_cols[b_i])
+        at_most_one(b_cols[b_i], vm, clauses, amo)
+
+    # 2c. Link Block start/color to Cell color (Forward constraint)
+    for b_i, (sz, fix_c) in enumerate(blocks):
+        for p, s_var in b_starts[b_i].items():
+            for t in range(p, p + sz):
+                if fix_c is not None:
+                    clauses.append([-s_var, cl[t * ncolors + fix_c + 1]])
+                    continue
+                for c_idx in range(1, ncolors):
+                    clauses.append([-s_var, -b_cols[b_i][c_idx-1], cl[t * ncolors + c_idx]])
+
+    # 2d. Ordering and spacing, O(L) per block pair: if block b+1 starts at or
+    # before q, block b starts at or before q - size - gap.  With a '?' block
+    # on either side the gap depends on the colours, so touching blocks of the
+    # same colour are forbidden explicitly.
+    for b_i in range(K - 1):
+        sz_curr = blocks[b_i][0]
+        for q in b_starts[b_i + 1]:
+            add_clause(clauses, [neg(ladders[b_i + 1].at(q)), ladders[b_i].at(q - sz_curr - gaps[b_i])])
+        if blocks[b_i][1] is not None and blocks[b_i + 1][1] is not None:
             continue
+        for q, s_next in b_starts[b_i + 1].items():
+            s_curr = b_starts[b_i].get(q - sz_curr)
+            if s_curr is None:
+                continue
+            for c_idx in range(1, ncolors):
+                clauses.append([-s_curr, -s_next, -b_cols[b_i][c_idx-1], -b_cols[b_i+1][c_idx-1]])
 
-        # 2a. Create all block-related variables (starts and colors)
-        b_starts = []
-        b_cols = []
-        for b_i, (sz, fix_c) in enumerate(blocks):
-            if sz > L:
-                clauses.append([])
+    # 2e. Background Color Constraint (Reverse constraint), O(L) per block:
+    # when exactly blocks 0..b-1 start at or before t, cell t is covered iff
+    # block b-1 started after t - size, and it is background iff not covered.
+    for t in range(L):
+        bg_var = cl[t * ncolors]
+        # no block started yet
+        add_clause(clauses, [ladders[0].at(t), bg_var])
+        for b_i in range(1, K + 1):
+            prev = ladders[b_i - 1]
+            started = prev.at(t)
+            if started is False:
                 break
-            b_starts.append([vm.new(('start', lidx, b_i, p)) for p in range(L - sz + 1)])
-            b_cols.append([vm.new(('b_col', lidx, b_i, c)) for c in range(1, ncolors)])
-        if not clauses or clauses[-1] == []: continue
-
-        # 2b. Add constraints for these variables (exactly-one start/color)
-        for b_i, (sz, fix_c) in enumerate(blocks):
-            clauses.append(b_starts[b_i])
-            for i in range(len(b_starts[b_i])):
-                for j in range(i + 1, len(b_starts[b_i])):
-                    clauses.append([-b_starts[b_i][i], -b_starts[b_i][j]])
-            
-            if fix_c is not None:
-                clauses.append([b_cols[b_i][fix_c]])
-            else:
-                clauses.append(b_cols[b_i])
-            if len(b_cols[b_i]) > 1:
-                for i in range(len(b_cols[b_i])):
-                    for j in range(i + 1, len(b_cols[b_i])):
-                        clauses.append([-b_cols[b_i][i], -b_cols[b_i][j]])
-                        
-        # 2c. Link Block start/color to Cell color (Forward constraint)
-        for b_i, (sz, _) in enumerate(blocks):
-            for p, s_var in enumerate(b_starts[b_i]):
-                for t in range(p, p + sz):
-                    for c_idx in range(1, ncolors):
-                        clauses.append([-s_var, -b_cols[b_i][c_idx-1], vm.get(('cell', cells[t], c_idx))])
-
-        # 2d. UNIFIED Spacing and Ordering Constraint
-        for b_i in range(K - 1):
-            sz_curr = blocks[b_i][0]
-            for p, s_curr in enumerate(b_starts[b_i]):
-                for q, s_next in enumerate(b_starts[b_i + 1]):
-                    if q < p + sz_curr:
-                        clauses.append([-s_curr, -s_next])
-                        continue
-                    if q == p + sz_curr:
-                        for c_idx in range(1, ncolors):
-                            clauses.append([-s_curr, -s_next, -b_cols[b_i][c_idx-1], -b_cols[b_i+1][c_idx-1]])
-
-        # 2e. THE FINAL FIX: Background Color Constraint (Reverse constraint)
-        for pos, coord in enumerate(cells):
-            bg_var = vm.get(('cell', coord, 0))
-            
-            # Collect all possible start variables that could cover this cell
-            starts_that_cover_pos = []
-            for b_i, (sz, _) in enumerate(blocks):
-                for p in range(max(0, pos - sz + 1), pos + 1):
-                    if p < len(b_starts[b_i]):
-                        starts_that_cover_pos.append(b_starts[b_i][p])
-
-            # Constraint: cell_is_background IFF no block covers it
-            # This is equivalent to:
-            # 1. cell_is_background => no block start is active
-            #    -bg_var => -s_var for all s_var in starts_that_cover_pos
-            #    Which is [-bg_var, -s_var]
-            for s_var in starts_that_cover_pos:
-                clauses.append([-bg_var, -s_var])
-
-            # 2. no block start is active => cell_is_background
-            #    AND(-s_var for all s_var) => bg_var
-            #    Which is [bg_var, s_var_1, s_var_2, ...]
-            clauses.append([bg_var] + starts_that_cover_pos)
-
-    return clauses
+            nxt = ladders[b_i].at(t) if b_i < K else False
+            if nxt is True:
+                continue
+            done = prev.at(t - blocks[b_i - 1][0])
+            region = [neg(started), nxt]
+            add_clause(clauses, region + [done, -bg_var])
+            add_clause(clauses, region + [neg(done), bg_var])
+
+
+def encode(puzzle, vm: VarManager, amo='auto', sink=None, templates=True):
+    clauses, out = clause_sink(puzzle, vm, sink)
+    # 1. Cell color variables: Exactly one color per cell
+    lits = encode_cells(puzzle, vm, clauses, amo)
+    # 2. Encode each line
+    encode_lines(puzzle, vm, clauses, lits, encode_line, amo, templates)
+    return out
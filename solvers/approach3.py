@@ -0,0 +1,114 @@
+"""
+Approach 3: reduced MDD (multi-valued decision diagram) per line.
+
+Each clue is compiled into its line automaton, unrolled over the line's
+positions, restricted to the states that lie on an accepting path, and then
+reduced bottom-up: nodes of a layer with identical outgoing edges are merged.
+Only the remaining nodes get variables.
+"""
+from .varmap import VarManager
+from .automaton import compile_clue, iter_bits
+from .cells import clause_sink, encode_cells
+from .templates import encode_lines
+from .cardinality import exactly_one
+from .profiling import note
+
+# Bump when the generated CNF changes (invalidates the CNF cache)
+VERSION = 3
+
+
+def build_mdd(auto, doms):
+    """
+    Build the reduced MDD of a line.
+    `doms` is the allowed colour bitmask per position.
+    Returns layers: layers[p] is a list of nodes, each node a dict {colour: child index
+    in layers[p + 1]}; layers[len(doms)] holds the single terminal node.
+    Returns None if the line has no solution.
+    """
+    res = auto.reachable(doms)
+    if res is None:
+        return None
+    states, _ = res
+    n = len(doms)
+
+    layers = [None] * (n + 1)
+    layers[n] = [{}]
+    # node index of every live automaton state in the layer below
+    below = {s: 0 for s in iter_bits(states[n])}
+    for p in range(n - 1, -1, -1):
+        d = doms[p]
+        nodes = []
+        index = {}
+        here = {}
+        for s in iter_bits(states[p]):
+            row = auto.delta[s]
+            edges = {}
+            for x in iter_bits(d):
+                child = below.get(row[x], -1)
+                if child >= 0:
+                    edges[x] = child
+            sig = tuple(edges.items())
+            node = index.get(sig)
+            if node is None:
+                node = len(nodes)
+                index[sig] = node
+                nodes.append(edges)
+            here[s] = node
+        layers[p] = nodes
+        below = here
+    return layers
+
+
+def encode_line(lidx, blocks, length, ncolors, cl, doms, vm, clauses, amo='auto'):
+    """Encode one line (see `templates`) through its reduced MDD."""
+    if doms is None:
+        doms = [(1 << ncolors) - 1] * length
+    else:
+        doms = [sum(1 << c for c in dom) for dom in doms]
+
+    auto = compile_clue(blocks, ncolors)
+    layers = build_mdd(auto, doms)
+    if layers is None:
+        clauses.append([])
+        return
+    note(nodes=sum(len(nodes) for nodes in layers))
+
+    # Node variables, one block and exactly-one group per layer
+    node_var = []
+    for p, nodes in enumerate(layers):
+        base = vm.reserve(len(nodes), 'mdd', lidx, p)
+        vs = list(range(base, base + len(nodes)))
+        node_var.append(vs)
+        exactly_one(vs, vm, clauses, amo)
+    clauses.append([node_var[0][0]])
+
+    for p in range(length):
+        parents = [[] for _ in layers[p + 1]]
+        supports = {}
+        for i, edges in enumerate(layers[p]):
+            u = node_var[p][i]
+            for x in iter_bits(doms[p]):
+                c = cl[p * ncolors + x]
+                child = edges.get(x)
+                if child is None:
+                    # node u and colour x cannot both hold
+                    clauses.append([-u, -c])
+                else:
+                    # node u and colour x lead to the child node
+                    clauses.append([-u, -c, node_var[p + 1][child]])
+                    parents[child].append(u)
+                    supports.setdefault(x, []).append(u)
+
+        # Every node below is entered from some parent
+        for child, us in enumerate(parents):
+            clauses.append([-node_var[p + 1][child]] + us)
+        # Every colour of the cell is supported by some node with that edge
+        for x in iter_bits(doms[p]):
+            clauses.append([-cl[p * ncolors + x]] + supports.get(x, []))
+
+
+def encode(puzzle, vm: VarManager, amo='auto', sink=None, templates=True):
+    clauses, out = clause_sink(puzzle, vm, sink)
+    lits = encode_cells(puzzle, vm, clauses, amo)
+    encode_lines(puzzle, vm, clauses, lits, encode_line, amo, templates)
+    return out
@@ -1,188 +1,66 @@
 """
 Approach 4: automaton encoding per clue.
+
+The clue is compiled into an integer-state automaton (see `automaton`).
+Forward/backward reachability over the line decides which states can occur at
+each position; only those get a state variable.
 """
 from .varmap import VarManager
-from .approach1 import parse_clue_line
-
-def build_states_for_blocks(blocks, ncolors):
-    """
-    States:
-      S: Start
-      B{j}_{c}_{t}: Block j, Color c, cell t (1..size)
-      G{j}: Gap after block j
-      E: End
-    """
-    states = ['S']
-    k = len(blocks)
-    real_colors = range(1, ncolors) # 1-based indices for colors
-
-    for j, (size, col) in enumerate(blocks):
-        # Determine valid colors for this block
-        if col is None:
-            valid_cs = list(real_colors)
-        else:
-            valid_cs = [col + 1]
-
-        for c in valid_cs:
-            for t in range(1, size + 1):
-                states.append(f'B{j}_{c}_{t}')
-        
-        if j < k - 1:
-            states.append(f'G{j}')
-            
-    states.append('E')
-    
-    # Accepting states
-    if k == 0:
-        accepting = {'S', 'E'}
+from .automaton import compile_clue, iter_bits
+from .cells import clause_sink, encode_cells
+from .templates import encode_lines
+from .cardinality import exactly_one
+from .profiling import note
+
+# Bump when the generated CNF changes (invalidates the CNF cache)
+VERSION = 3
+
+def encode_line(lidx, blocks, length, ncolors, cl, doms, vm, clauses, amo='auto'):
+    """Encode one line (see `templates`) with state variables of the clue automaton."""
+    N = length
+    auto = compile_clue(blocks, ncolors)
+    if doms is None:
+        doms = [(1 << ncolors) - 1] * N
     else:
-        accepting = {'E'}
-        # Last block finished states
-        last_blk_idx = k - 1
-        last_size = blocks[last_blk_idx][0]
-        last_col = blocks[last_blk_idx][1]
-        
-        if last_col is None:
-            valid_cs = list(real_colors)
-        else:
-            valid_cs = [last_col + 1]
-            
-        for c in valid_cs:
-            accepting.add(f'B{last_blk_idx}_{c}_{last_size}')
-        
-    return states, accepting
-
-def encode(puzzle, vm: VarManager):
-    clauses = []
-    ncolors = len(puzzle['colors'])
-
+        doms = [sum(1 << c for c in dom) for dom in doms]
+
+    res = auto.reachable(doms)
+    if res is None:
+        clauses.append([])
+        return
+    live, _ = res
+    note(states=sum(bin(m).count('1') for m in live))
+
+    # State variables: state_var[p][s] for the states live at position p
+    state_var = []
+    for p in range(0, N+1):
+        ss = list(iter_bits(live[p]))
+        base = vm.reserve(len(ss), 'state', lidx, p)
+        here = {s: base + k for k, s in enumerate(ss)}
+        state_var.append(here)
+        # Exactly one state per position (at N these are all accepting)
+        exactly_one(here.values(), vm, clauses, amo)
+
+    # Init state
+    clauses.append([state_var[0][auto.start]])
+
+    # Transitions
+    for p in range(0, N):
+        nxt = state_var[p+1]
+        for s, curr_s_var in state_var[p].items():
+            row = auto.delta[s]
+            for col_idx in iter_bits(doms[p]):
+                col_var = cl[p * ncolors + col_idx]
+                t = row[col_idx]
+                if t in nxt:
+                    clauses.append([-curr_s_var, -col_var, nxt[t]])
+                else:
+                    clauses.append([-curr_s_var, -col_var])
+
+
+def encode(puzzle, vm: VarManager, amo='auto', sink=None, templates=True):
+    clauses, out = clause_sink(puzzle, vm, sink)
     # Cell color vars
-    for coord in puzzle['cells']:
-        vars_cell = [vm.new(('cell', coord, c)) for c in range(ncolors)]
-        clauses.append(vars_cell[:])
-        for i in range(ncolors):
-            for j in range(i+1, ncolors):
-                clauses.append([-vars_cell[i], -vars_cell[j]])
-
-    def process_line(lidx, line_cells, clue_line):
-        N = len(line_cells)
-        blocks = parse_clue_line(clue_line)
-        states, accepting = build_states_for_blocks(blocks, ncolors)
-
-        # State variables: state[p][sname]
-        state_var = {}
-        for p in range(0, N+1):
-            for s in states:
-                state_var[(p, s)] = vm.new(('state', lidx, p, s))
-
-        # Exactly one state per position
-        for p in range(0, N+1):
-            vars_here = [state_var[(p, s)] for s in states]
-            clauses.append(vars_here[:])
-            for i in range(len(vars_here)):
-                for j in range(i+1, len(vars_here)):
-                    clauses.append([-vars_here[i], -vars_here[j]])
-
-        # Init state
-        clauses.append([state_var[(0, 'S')]])
-
-        # Transitions
-        for p in range(0, N):
-            coord = line_cells[p]
-            
-            for sname in states:
-                curr_s_var = state_var[(p, sname)]
-                
-                for col_idx in range(ncolors):
-                    col_var = vm.get(('cell', coord, col_idx))
-                    next_s = []
-
-                    # ------------------------------------------------
-                    # Transition Logic
-                    # ------------------------------------------------
-                    if sname == 'S':
-                        if col_idx == 0:
-                            next_s.append('S')
-                        elif len(blocks) > 0:
-                            # Try start first block
-                            b0_sz, b0_c = blocks[0]
-                            # Check if col_idx matches block req
-                            if b0_c is None: # ? -> any non-bg
-                                # Transition to the specific color chain
-                                next_s.append(f'B0_{col_idx}_1')
-                            else:
-                                if col_idx == b0_c + 1:
-                                    next_s.append(f'B0_{col_idx}_1')
-                                
-                    elif sname.startswith('B'):
-                        # B{j}_{c}_{t}
-                        parts = sname[1:].split('_')
-                        j = int(parts[0])
-                        c_chain = int(parts[1]) # The color of this block chain
-                        t = int(parts[2])
-                        size, _ = blocks[j]
-                        
-                        # Must match the chain color
-                        if col_idx == c_chain:
-                            if t < size:
-                                next_s.append(f'B{j}_{c_chain}_{t+1}')
-                            # else block finished, cannot continue in block
-                        else:
-                            # Mismatch or end of block
-                            if t == size:
-                                # Block ended. col_idx is next cell color.
-                                if col_idx == 0:
-                                    # To gap
-                                    if j < len(blocks) - 1:
-                                        next_s.append(f'G{j}')
-                                    else:
-                                        next_s.append('E')
-                                else:
-                                    # Direct transition to next block?
-                                    if j < len(blocks) - 1:
-                                        # Only if next block can be col_idx
-                                        # AND col_idx != c_chain (must be different color)
-                                        nxt_sz, nxt_c = blocks[j+1]
-                                        
-                                        valid_next_color = False
-                                        if nxt_c is None: valid_next_color = True
-                                        elif col_idx == nxt_c + 1: valid_next_color = True
-                                        
-                                        if valid_next_color and col_idx != c_chain:
-                                            next_s.append(f'B{j+1}_{col_idx}_1')
-
-                    elif sname.startswith('G'):
-                        j = int(sname[1:])
-                        if col_idx == 0:
-                            next_s.append(f'G{j}')
-                        elif j + 1 < len(blocks):
-                            # Start next block
-                            nxt_sz, nxt_c = blocks[j+1]
-                            
-                            valid_next_color = False
-                            if nxt_c is None: valid_next_color = True
-                            elif col_idx == nxt_c + 1: valid_next_color = True
-                            
-                            if valid_next_color:
-                                next_s.append(f'B{j+1}_{col_idx}_1')
-                                
-                    elif sname == 'E':
-                        if col_idx == 0:
-                            next_s.append('E')
-
-                    # ------------------------------------------------
-                    
-                    if not next_s:
-                        clauses.append([-curr_s_var, -col_var])
-                    else:
-                        literals = [-curr_s_var, -col_var] + [state_var[(p+1, ns)] for ns in next_s]
-                        clauses.append(literals)
-
-        # Final acceptance
-        acc_vars = [state_var[(N, s)] for s in accepting if (N, s) in state_var]
-        clauses.append(acc_vars)
-
-    for lidx, line in enumerate(puzzle['lines']):
-        process_line(lidx, line['cells'], line['clue'])
-
-    return clauses
+    lits = encode_cells(puzzle, vm, clauses, amo)
+    encode_lines(puzzle, vm, clauses, lits, encode_line, amo, templates)
+    return out
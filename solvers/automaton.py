@@ -0,0 +1,161 @@
+"""
+Compiled line automaton for a single clue.
+
+States are small integers laid out in reading order:
+  gap 0, block 0 chains, gap 1, block 1 chains, ..., gap k
+A gap state i means "i blocks completed, currently on background".
+A block chain state (j, c, t) means "inside block j of colour c, t cells filled".
+Colours are cell colour indices: 0 is background, 1.. are 'a', 'b', ...
+
+Besides the plain transition table, every transition is grouped by
+(colour, forward offset) so that sets of states can be advanced as Python
+int bitmasks, which is what the line solver in `presolve` relies on.
+"""
+
+
+class LineAutomaton:
+    def __init__(self, blocks, ncolors):
+        self.blocks = blocks
+        self.ncolors = ncolors
+        k = len(blocks)
+
+        # Allowed cell colours for every block (1-based cell colour indices)
+        self.block_colors = []
+        for _, col in blocks:
+            if col is None:
+                self.block_colors.append(list(range(1, ncolors)))
+            else:
+                self.block_colors.append([col + 1])
+
+        # 1. Lay out the states
+        self.gap = []            # gap[i] -> state id
+        self.chain = []          # chain[j][c] -> state id of (j, c, 1)
+        self.info = []           # state id -> ('gap', i) or ('blk', j, c, t)
+        for j in range(k):
+            self.gap.append(len(self.info))
+            self.info.append(('gap', j))
+            starts = {}
+            for c in self.block_colors[j]:
+                starts[c] = len(self.info)
+                for t in range(1, blocks[j][0] + 1):
+                    self.info.append(('blk', j, c, t))
+            self.chain.append(starts)
+        self.gap.append(len(self.info))
+        self.info.append(('gap', k))
+        self.nstates = len(self.info)
+        self.start = self.gap[0]
+
+        # 2. Transition table: delta[s][x] -> next state or -1
+        self.delta = [[-1] * ncolors for _ in range(self.nstates)]
+        for s, inf in enumerate(self.info):
+            row = self.delta[s]
+            if inf[0] == 'gap':
+                i = inf[1]
+                row[0] = s
+                if i < k:
+                    for x in self.block_colors[i]:
+                        row[x] = self.chain[i][x]
+            else:
+                _, j, c, t = inf
+                size = blocks[j][0]
+                if t < size:
+                    row[c] = s + 1
+                    continue
+                row[0] = self.gap[j + 1]
+                if j + 1 < k:
+                    for x in self.block_colors[j + 1]:
+                        if x != c:
+                            row[x] = self.chain[j + 1][x]
+
+        # 3. Accepting states: final gap, or the last cell of the last block
+        self.accepting = [self.gap[k]]
+        if k > 0:
+            last = k - 1
+            for c in self.block_colors[last]:
+                self.accepting.append(self.chain[last][c] + blocks[last][0] - 1)
+        self.accept_mask = 0
+        for s in self.accepting:
+            self.accept_mask |= 1 << s
+
+        # 4. Group transitions by (colour, offset) for bit-parallel stepping
+        groups = [{} for _ in range(ncolors)]
+        for s in range(self.nstates):
+            for x, t in enumerate(self.delta[s]):
+                if t >= 0:
+                    off = t - s
+                    groups[x][off] = groups[x].get(off, 0) | (1 << s)
+        self.groups = [sorted(g.items()) for g in groups]
+
+    def step(self, states, colors):
+        """Advance a state bitmask over a cell whose colour is in the bitmask `colors`."""
+        nxt = 0
+        for x in range(self.ncolors):
+            if colors >> x & 1:
+                for off, mask in self.groups[x]:
+                    nxt |= (states & mask) << off
+        return nxt
+
+    def forward(self, doms):
+        """State bitmasks reachable before each position (len(doms) + 1 entries)."""
+        cur = 1 << self.start
+        fwd = [cur]
+        for d in doms:
+            cur = self.step(cur, d)
+            fwd.append(cur)
+        return fwd
+
+    def reachable(self, doms):
+        """
+        Forward/backward reachability over the colour domains `doms` (bitmasks).
+        Returns (states, colors): states[p] is the bitmask of states that lie on
+        some accepting path at position p (len(doms) + 1 entries) and colors[p]
+        the bitmask of colours that such paths use at p.  Returns None if no
+        accepting path exists.
+        """
+        fwd = self.forward(doms)
+        back = fwd[-1] & self.accept_mask
+        if not back:
+            return None
+        n = len(doms)
+        states = [0] * (n + 1)
+        colors = [0] * n
+        states[n] = back
+        for p in range(n - 1, -1, -1):
+            d = doms[p]
+            here = fwd[p]
+            keep = 0
+            m = 0
+            for x in range(self.ncolors):
+                if d >> x & 1:
+                    src = 0
+                    for off, mask in self.groups[x]:
+                        src |= (back >> off) & mask
+                    src &= here
+                    if src:
+                        keep |= src
+                        m |= 1 << x
+            states[p] = keep
+            colors[p] = m
+            back = keep
+        return states, colors
+
+
+_cache = {}
+
+
+def compile_clue(blocks, ncolors):
+    """Return the (shared) automaton for a parsed clue."""
+    key = (tuple(blocks), ncolors)
+    auto = _cache.get(key)
+    if auto is None:
+        auto = LineAutomaton(list(blocks), ncolors)
+        _cache[key] = auto
+    return auto
+
+
+def iter_bits(mask):
+    """Yield the indices of the set bits of `mask` in increasing order."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
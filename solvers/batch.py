@@ -0,0 +1,161 @@
+"""
+Multi-process batch mode for `run.py --jobs N`.
+
+Every puzzle is processed in its own worker process, at most N at a time,
+so one hard puzzle cannot block the batch: a worker that runs past the
+wall-clock limit is killed, and the memory limit is applied to each worker
+as an address-space rlimit (allocations beyond it fail and the puzzle is
+reported as 'memout').  One JSON line per puzzle is appended to the results
+file as soon as its worker finishes:
+
+  {"file": ..., "status": ..., "rc": ..., "vars": ..., "clauses": ...,
+   "times": {"parse": ..., "presolve": ..., "encode": ..., "solve": ...}, "wall": ...}
+
+status is one of sat, unsat, limit, encoded, error, timeout, memout or crashed.
+"""
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _limit_memory(memory_mb):
+    if resource is None or not memory_mb:
+        return
+    limit = int(memory_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _kill(proc):
+    """Kill a worker together with any processes it started (e.g. portfolio members)."""
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    proc.kill()
+    proc.join()
+
+
+def _worker(args, clue_path, out_arg, memory_mb, conn):
+    from .run import make_processor, open_cache
+    from .portfolio import parse_members
+
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    _limit_memory(memory_mb)
+    record = {}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            members = parse_members(args.portfolio) if args.portfolio else None
+            # portfolio wins are recorded by the parent, which owns the stats file
+            process_one = make_processor(args, open_cache(args), members)
+            rc = process_one(clue_path, out_arg, record)
+    except MemoryError:
+        rc = 1
+        record['status'] = 'memout'
+    except Exception as e:
+        rc = 1
+        record['status'] = 'error'
+        record['error'] = repr(e)
+    conn.send((rc, record, log.getvalue()))
+    conn.close()
+
+
+def _record_portfolio(stats, members, record):
+    from .portfolio import PortfolioResult, parse_members
+
+    winner = record.get('winner')
+    errors = {parse_members(name)[0]: err for name, err in record.get('member_errors', {}).items()}
+    result = PortfolioResult(record.get('status'), winner=parse_members(winner)[0] if winner else None,
+                             elapsed=record.get('times', {}).get('solve', 0.0), errors=errors)
+    stats.record(members, result)
+
+
+def run_batch(args, files, out_arg, jobs, timeout=None, memory_mb=None, results_path=None,
+              members=None, stats=None):
+    """
+    Process `files` with up to `jobs` workers; `timeout` and `memory_mb`
+    default to args.timeout / args.memory_limit.  Returns the number of
+    puzzles that did not finish with exit code 0.
+    """
+    timeout = args.timeout if timeout is None else timeout
+    memory_mb = args.memory_limit if memory_mb is None else memory_mb
+    ctx = multiprocessing.get_context()
+    pending = list(files)
+    running = {}     # result pipe -> (process, clue path, start time)
+    failures = 0
+    hits = misses = 0
+    results = open(results_path, 'a') if results_path else None
+
+    def finish(path, start, rc, record, log):
+        nonlocal failures, hits, misses
+        record = {'file': str(path), **record, 'rc': rc, 'wall': time.perf_counter() - start}
+        print('Processed', path)
+        if log:
+            print(log, end='')
+        if results is not None:
+            results.write(json.dumps(record) + '\n')
+            results.flush()
+        if rc != 0:
+            failures += 1
+        hits += record.get('cache') == 'hit'
+        misses += record.get('cache') == 'miss'
+        if stats is not None and record.get('status') not in ('error', 'timeout', 'memout', 'crashed'):
+            _record_portfolio(stats, members, record)
+
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                path = pending.pop(0)
+                recv, send = ctx.Pipe(duplex=False)
+                proc = ctx.Process(target=_worker, args=(args, path, out_arg, memory_mb, send))
+                proc.start()
+                send.close()
+                running[recv] = (proc, path, time.perf_counter())
+
+            wait_s = None
+            if timeout is not None:
+                first_deadline = min(start for _, _, start in running.values()) + timeout
+                wait_s = max(0.0, first_deadline - time.perf_counter())
+            for conn in wait(list(running), timeout=wait_s):
+                proc, path, start = running.pop(conn)
+                try:
+                    rc, record, log = conn.recv()
+                except EOFError:
+                    # died without reporting (killed by the OS, crashed in native code, ...)
+                    proc.join()
+                    rc, record, log = 1, {'status': 'crashed', 'exitcode': proc.exitcode}, ''
+                conn.close()
+                proc.join()
+                finish(path, start, rc, record, log)
+
+            if timeout is not None:
+                now = time.perf_counter()
+                for conn, (proc, path, start) in list(running.items()):
+                    if now - start >= timeout:
+                        _kill(proc)
+                        conn.close()
+                        del running[conn]
+                        finish(path, start, 1, {'status': 'timeout'}, '')
+    finally:
+        for proc, _, _ in running.values():
+            _kill(proc)
+        if results is not None:
+            results.close()
+
+    if hits or misses:
+        print(f'CNF cache: {hits} hits, {misses} misses')
+    if stats is not None:
+        stats.save()
+    return failures
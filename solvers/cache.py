@@ -0,0 +1,113 @@
+"""
+Content-addressed on-disk cache for encoded CNFs.
+
+Entries are keyed by a hash of the clue file contents, the approach number,
+the encoder's VERSION and the encoding options (amo, presolve, templates).
+Each entry stores what is needed to solve and decode without re-encoding: the
+number of variables, the clauses (a ClauseBuffer's arrays), the layout of the
+cell variable block and the cells fixed by presolve.  The directory is capped in
+size; the least recently used entries are evicted first (hits refresh the
+file mtime).
+"""
+import hashlib
+import os
+import pickle
+import sys
+from pathlib import Path
+
+from .varmap import VarManager
+from .sinks import ClauseBuffer
+
+# Bump when the on-disk entry layout changes
+FORMAT = 3
+
+DEFAULT_DIR = 'cnf_cache'
+DEFAULT_MAX_MB = 512
+
+
+def encoder_version(encoder):
+    """The VERSION constant of the module an encode() function lives in."""
+    return getattr(sys.modules[encoder.__module__], 'VERSION', 0)
+
+
+class CNFCache:
+    def __init__(self, root=DEFAULT_DIR, max_mb=DEFAULT_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, clue_bytes, approach, version, **options):
+        h = hashlib.sha256()
+        h.update(clue_bytes)
+        h.update(repr((FORMAT, approach, version, sorted(options.items()))).encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / (key + '.pkl')
+
+    def load(self, key):
+        """Return (vm, clauses, fixed) for a cached entry (clauses as a ClauseBuffer), or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        if entry.get('format') != FORMAT:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+
+        vm = VarManager.from_layout(entry['nvars'], entry['cell_base'], entry['cell_owner'])
+        clauses = ClauseBuffer(entry['lits'], entry['starts'])
+        return vm, clauses, entry['fixed']
+
+    def store(self, key, vm, clauses, fixed=None):
+        if not isinstance(clauses, ClauseBuffer):
+            buf = ClauseBuffer()
+            buf.extend(clauses)
+            clauses = buf
+        entry = {
+            'format': FORMAT,
+            'nvars': vm.nvars(),
+            # only the cell block layout is needed to decode a model
+            'cell_base': vm.cell_base,
+            'cell_owner': vm.cell_owner,
+            'lits': clauses.lits,
+            'starts': clauses.starts,
+            'fixed': fixed,
+        }
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as fp:
+            pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits its size cap."""
+        entries = []
+        total = 0
+        for path in self.root.glob('*/*.pkl'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def summary(self):
+        return f'CNF cache: {self.hits} hits, {self.misses} misses'
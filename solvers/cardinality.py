@@ -0,0 +1,105 @@
+"""
+At-most-one / exactly-one encodings shared by all encoders.
+
+  pairwise    O(n^2) binary clauses, no auxiliary variables
+  sequential  sequential counter (Sinz 2005): 3n clauses, n-1 auxiliaries
+  commander   commander encoding (Klieber & Kwon 2007), groups of 3
+  product     2-product encoding (Chen 2010): ~2n clauses, ~2*sqrt(n) auxiliaries
+  auto        pairwise for small sets, sequential for medium, product for large
+"""
+import math
+
+from .varmap import VarManager
+
+METHODS = ['auto', 'pairwise', 'sequential', 'commander', 'product']
+
+# Thresholds used by 'auto'
+PAIRWISE_MAX = 6
+SEQUENTIAL_MAX = 512
+
+COMMANDER_GROUP = 3
+
+
+def pairwise(lits, vm: VarManager, clauses):
+    for i in range(len(lits)):
+        for j in range(i + 1, len(lits)):
+            clauses.append([-lits[i], -lits[j]])
+
+
+def sequential(lits, vm: VarManager, clauses):
+    n = len(lits)
+    if n <= 1:
+        return
+    s = [vm.fresh() for _ in range(n - 1)]
+    clauses.append([-lits[0], s[0]])
+    for i in range(1, n - 1):
+        clauses.append([-lits[i], s[i]])
+        clauses.append([-s[i - 1], s[i]])
+        clauses.append([-lits[i], -s[i - 1]])
+    clauses.append([-lits[n - 1], -s[n - 2]])
+
+
+def commander(lits, vm: VarManager, clauses):
+    n = len(lits)
+    if n <= PAIRWISE_MAX:
+        pairwise(lits, vm, clauses)
+        return
+    commanders = []
+    for g in range(0, n, COMMANDER_GROUP):
+        group = lits[g:g + COMMANDER_GROUP]
+        c = vm.fresh()
+        commanders.append(c)
+        pairwise(group, vm, clauses)
+        clauses.append([-c] + group)
+        for x in group:
+            clauses.append([-x, c])
+    commander(commanders, vm, clauses)
+
+
+def product(lits, vm: VarManager, clauses):
+    n = len(lits)
+    if n <= PAIRWISE_MAX:
+        pairwise(lits, vm, clauses)
+        return
+    p = math.isqrt(n - 1) + 1
+    q = (n + p - 1) // p
+    rows = [vm.fresh() for _ in range(p)]
+    cols = [vm.fresh() for _ in range(q)]
+    for idx, x in enumerate(lits):
+        r, c = divmod(idx, q)
+        clauses.append([-x, rows[r]])
+        clauses.append([-x, cols[c]])
+    product(rows, vm, clauses)
+    product(cols, vm, clauses)
+
+
+_ENCODERS = {
+    'pairwise': pairwise,
+    'sequential': sequential,
+    'commander': commander,
+    'product': product,
+}
+
+
+def choose(n, method='auto'):
+    """Resolve 'auto' to a concrete method for a set of n literals."""
+    if method != 'auto':
+        return method
+    if n <= PAIRWISE_MAX:
+        return 'pairwise'
+    if n <= SEQUENTIAL_MAX:
+        return 'sequential'
+    return 'product'
+
+
+def at_most_one(lits, vm: VarManager, clauses, method='auto'):
+    lits = list(lits)
+    if len(lits) <= 1:
+        return
+    _ENCODERS[choose(len(lits), method)](lits, vm, clauses)
+
+
+def exactly_one(lits, vm: VarManager, clauses, method='auto'):
+    lits = list(lits)
+    clauses.append(lits[:])
+    at_most_one(lits, vm, clauses, method)
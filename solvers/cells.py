@@ -0,0 +1,76 @@
+"""
+Cell-colour variables shared by all encoders.
+"""
+from .varmap import VarManager
+from .cardinality import exactly_one
+from .sinks import ConstantFilter
+
+
+def clause_sink(puzzle, vm: VarManager, sink=None):
+    """
+    Set up where an encoder writes its clauses. Returns (clauses, out):
+    the encoder appends to `clauses` and returns `out`, which is `sink`
+    (a new list by default).
+
+    With presolved 'domains' the constant-true variable (vm.true) is allocated
+    here and `clauses` drops every clause it satisfies and strips its negation.
+    """
+    out = [] if sink is None else sink
+    if puzzle.get('domains') is None:
+        return out, out
+    vm.true = vm.reserve(1, 'true')
+    return ConstantFilter(out, vm.true), out
+
+
+def cell_ids(puzzle):
+    """{coord: cell id}; the literal of colour c of cell i is lits[i * ncolors + c]."""
+    return {coord: i for i, coord in enumerate(puzzle['cells'])}
+
+
+def encode_cells(puzzle, vm: VarManager, clauses, amo='auto'):
+    """
+    Create the cell-colour variable block and the exactly-one constraint of
+    every cell (`amo` picks the at-most-one encoding, see `cardinality`).
+    Returns lits, a flat list: lits[cell_id * ncolors + col] (see `cell_ids`).
+
+    If the puzzle carries presolved 'domains', decided cells and removed
+    colours get no variable: their literal is the constant-true variable or its
+    negation (see `clause_sink`).
+    """
+    ncolors = len(puzzle['colors'])
+    domains = puzzle.get('domains')
+    cells = puzzle['cells']
+
+    if domains is None:
+        base = vm.add_cells([(coord, c) for coord in cells for c in range(ncolors)])
+        lits = list(range(base, base + len(cells) * ncolors))
+        for i in range(len(cells)):
+            exactly_one(lits[i * ncolors:(i + 1) * ncolors], vm, clauses, amo)
+        return lits
+
+    true = vm.true
+    lits = [-true] * (len(cells) * ncolors)
+    open_cells = []
+    for i, coord in enumerate(cells):
+        dom = domains[coord]
+        if len(dom) == 1:
+            lits[i * ncolors + dom[0]] = true
+        else:
+            open_cells.append(i)
+
+    # Reserve the whole cell block before any auxiliary variable
+    base = vm.add_cells([(cells[i], c) for i in open_cells for c in domains[cells[i]]])
+    v = base
+    for i in open_cells:
+        cvars = []
+        for c in domains[cells[i]]:
+            lits[i * ncolors + c] = v
+            cvars.append(v)
+            v += 1
+        exactly_one(cvars, vm, clauses, amo)
+    return lits
+
+
+def line_decided(domains, cells):
+    """True if every cell of the line is decided (the line then needs no clauses)."""
+    return all(len(domains[coord]) == 1 for coord in cells)
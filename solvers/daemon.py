@@ -0,0 +1,315 @@
+"""
+Local solve daemon: keeps the interpreter, the imports and the caches warm
+between requests.
+
+The daemon speaks HTTP on localhost (or on a Unix socket) and takes the JSON
+body `nonogram.py` sends to the check server:
+
+  {'goal': 'check' | 'visualize', 'clues': <.clues text>,
+   'solution': 'anonymous problem\\n<kind>\\n<colours>\\n<rows, colours as digits>'}
+
+'check' answers 'Correct' or the verifier's description, 'visualize' an SVG
+image, as the check server does.  Two more goals answer JSON:
+
+  {'goal': 'solve', 'clues': ..., 'approach': 4, 'presolve': false,
+   'backend': 'glucose3', 'conflicts': None, 'propagations': None, 'timeout': None}
+      -> {'status', 'solution' (.solution file text), 'vars', 'clauses', 'times', 'solver'}
+  {'goal': 'stats', 'clues': ..., 'approach': 4, 'presolve': false, 'top': 10}
+      -> {'vars', 'clauses', 'times', 'profile'} (see `profiling`)
+
+The work runs in a pool of worker processes that live as long as the
+daemon, so every worker keeps its line templates and parsed geometry between
+requests; finished answers are kept in an LRU keyed by the request body.
+
+    python -m solvers.daemon [--listen 127.0.0.1:8974 | --listen /tmp/nonogram.sock] [--jobs N]
+    python nonogram.py check path/to/nonogram.clues path/to/nonogram.solution --daemon
+    python checkall.py --daemon clues_dir solutions_dir
+"""
+import argparse
+import asyncio
+import hashlib
+import http.client
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_ADDRESS = '127.0.0.1:8974'
+DEFAULT_APPROACH = 4
+DEFAULT_CACHE_ENTRIES = 1024
+ADDRESS_ENV = 'NONOGRAM_DAEMON'
+
+# the check server writes colours as digits, .solution files as '-abc...'
+SERVER_COLORS = str.maketrans('0123456789', '-abcdefghi')
+
+
+class DaemonError(Exception):
+    """The daemon answered with an error (its message is the text of the answer)."""
+
+
+def parse_address(address):
+    """('unix', path) for a socket path, ('tcp', host, port) for 'host:port' or ':port'."""
+    if os.sep in address or address.endswith('.sock'):
+        return ('unix', address)
+    host, _, port = address.rpartition(':')
+    return ('tcp', host or '127.0.0.1', int(port))
+
+
+def server_solution(text):
+    """The .solution file text inside the 'solution' field of a check request."""
+    rows = text.splitlines()[3:]
+    return '\n'.join(rows).translate(SERVER_COLORS) + '\n'
+
+
+# --- work done in the worker processes ---------------------------------------
+
+def _warm():
+    # import the encoders and PySAT once per worker instead of on its first request
+    from . import approach1, approach2, approach3, approach4, solver_pysat  # noqa: F401
+
+
+def _prepare(payload, times):
+    """Parse (and presolve) the clues of a request: (puzzle, fixed cells or None, early status or None)."""
+    from .parser import parse_text
+    from .presolve import presolve, fixed_cells
+
+    t0 = time.perf_counter()
+    puzzle = parse_text(payload['clues'])
+    times['parse'] = time.perf_counter() - t0
+    if not payload.get('presolve'):
+        return puzzle, None, None
+    t0 = time.perf_counter()
+    domains = presolve(puzzle)
+    times['presolve'] = time.perf_counter() - t0
+    if domains is None:
+        return puzzle, None, 'unsat'
+    fixed = fixed_cells(domains)
+    if len(fixed) == len(domains):
+        return puzzle, fixed, 'sat'
+    puzzle['domains'] = domains
+    return puzzle, fixed, None
+
+
+def _check(payload):
+    from .parser import parse_text
+    from .verify import Geometry
+
+    result = Geometry(parse_text(payload['clues'])).check(server_solution(payload['solution']))
+    return 'text/plain', result.describe(), True
+
+
+def _visualize(payload):
+    from .parser import parse_text
+    from .verify import Geometry
+    from .render import render_svg
+
+    geo = Geometry(parse_text(payload['clues']))
+    values = geo.read_solution(server_solution(payload['solution'])).tolist()
+    return 'image/svg+xml', render_svg(geo.puzzle, values), True
+
+
+def _solve(payload):
+    from .run import choose_encoder
+    from .varmap import VarManager
+    from .solver_pysat import SolverSink, cells_to_grid
+
+    times = {}
+    puzzle, fixed, status = _prepare(payload, times)
+    answer = {'status': status, 'times': times}
+    if status is None:
+        vm = VarManager()
+        encoder = choose_encoder(payload.get('approach', DEFAULT_APPROACH))
+        with SolverSink(payload.get('backend', 'glucose3')) as sink:
+            t0 = time.perf_counter()
+            encoder(puzzle, vm, sink=sink)
+            times['encode'] = time.perf_counter() - t0
+            result = sink.solve(vm, fixed, payload.get('conflicts'), payload.get('propagations'),
+                                payload.get('timeout'))
+        times['solve'] = result.elapsed
+        answer.update(status=result.status, vars=vm.nvars(), clauses=len(sink), solver=result.stats)
+        grid = result.grid
+    else:
+        grid = cells_to_grid(fixed) if status == 'sat' else None
+    if grid is not None:
+        answer['solution'] = ''.join(''.join(row) + '\n' for row in grid)
+    # a run out of budget may finish next time, everything else is final
+    return 'application/json', json.dumps(answer), answer['status'] != 'limit'
+
+
+def _stats(payload):
+    from . import profiling
+    from .run import choose_encoder
+    from .sinks import CountingSink
+    from .varmap import VarManager
+
+    times = {}
+    puzzle, _, status = _prepare(payload, times)
+    answer = {'status': status or 'encoded', 'times': times}
+    if status is None:
+        vm = VarManager()
+        sink = CountingSink()
+        profiler = profiling.LineProfiler(payload.get('top', 10))
+        t0 = time.perf_counter()
+        with profiling.subscribed(profiler):
+            choose_encoder(payload.get('approach', DEFAULT_APPROACH))(puzzle, vm, sink=sink)
+        times['encode'] = time.perf_counter() - t0
+        answer.update(vars=vm.nvars(), clauses=len(sink), profile=profiler.report())
+    return 'application/json', json.dumps(answer), True
+
+
+GOALS = {'check': _check, 'visualize': _visualize, 'solve': _solve, 'stats': _stats}
+
+
+def _run(payload):
+    try:
+        return GOALS[payload['goal']](payload)
+    except Exception as e:
+        return 'error', f'{type(e).__name__}: {e}', False
+
+
+# --- the server ----------------------------------------------------------------
+
+class Daemon:
+    def __init__(self, jobs=None, cache_entries=DEFAULT_CACHE_ENTRIES):
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=_warm)
+        self.answers = OrderedDict()
+        self.cache_entries = cache_entries
+        self.hits = self.misses = 0
+
+    async def answer(self, body):
+        """(HTTP status, content type, text) for one request body."""
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            return '400 Bad Request', 'text/plain', f'malformed JSON: {e}'
+        if not isinstance(payload, dict) or payload.get('goal') not in GOALS or 'clues' not in payload:
+            return '400 Bad Request', 'text/plain', f'expected a JSON object with clues and a goal in {sorted(GOALS)}'
+
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        cached = self.answers.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.answers.move_to_end(key)
+            return ('200 OK',) + cached
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        ctype, text, final = await loop.run_in_executor(self.pool, _run, payload)
+        if ctype == 'error':
+            return '500 Internal Server Error', 'text/plain', text
+        if final:
+            self.answers[key] = (ctype, text)
+            if len(self.answers) > self.cache_entries:
+                self.answers.popitem(last=False)
+        return '200 OK', ctype, text
+
+    async def handle(self, reader, writer):
+        try:
+            await reader.readline()     # request line; every method and path is treated alike
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            body = await reader.readexactly(length)
+            status, ctype, text = await self.answer(body)
+            data = text.encode()
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {ctype}; charset=utf-8\r\n'
+                         f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address):
+        """Serve until SIGINT or SIGTERM."""
+        where = parse_address(address)
+        if where[0] == 'unix':
+            if os.path.exists(where[1]):
+                os.remove(where[1])
+            server = await asyncio.start_unix_server(self.handle, path=where[1])
+        else:
+            server = await asyncio.start_server(self.handle, where[1], where[2])
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        print(f'Listening on {address}', flush=True)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            if where[0] == 'unix' and os.path.exists(where[1]):
+                os.remove(where[1])
+
+    def summary(self):
+        return f'Daemon answers: {self.hits} hits, {self.misses} misses, {len(self.answers)} cached'
+
+
+# --- the client ------------------------------------------------------------------
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost')
+        self.unix_path = path
+        self.unix_timeout = timeout
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.unix_timeout)
+        self.sock.connect(self.unix_path)
+
+
+def default_address():
+    return os.environ.get(ADDRESS_ENV, DEFAULT_ADDRESS)
+
+
+def request(payload, address=None, timeout=None):
+    """
+    Send one request to the daemon and return the text of its answer.
+    Raises OSError when no daemon listens at `address` and DaemonError when
+    it rejects the request.
+    """
+    where = parse_address(address or default_address())
+    if where[0] == 'unix':
+        conn = _UnixConnection(where[1], timeout)
+    else:
+        conn = http.client.HTTPConnection(where[1], where[2], timeout=timeout)
+    try:
+        conn.request('POST', '/', body=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        text = response.read().decode()
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise DaemonError(text)
+    return text
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Serve solve, check and encode-stats requests from warm worker processes.')
+    parser.add_argument('--listen', default=None,
+                        help=f'host:port or Unix socket path (default: ${ADDRESS_ENV} or {DEFAULT_ADDRESS})')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help='answers kept in the in-memory answer cache')
+    args = parser.parse_args(argv[1:])
+
+    daemon = Daemon(args.jobs, args.cache_entries)
+    try:
+        asyncio.run(daemon.serve(args.listen or default_address()))
+    finally:
+        daemon.pool.shutdown(cancel_futures=True)
+        print(daemon.summary())
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,217 @@
+"""
+Seeded generator of stress puzzles: writes a .clues file and the .solution
+it was made from.
+
+A puzzle is drawn as one array of cell colours (0 = background, indexed
+like puzzle['cells']), computed for all cells at once from their (row,
+column) coordinates; hex grids use the axial (r, q).  The clues are then
+read off with the verifier's vectorised run-length pass, so a 1000x1000
+puzzle takes a few seconds, most of it formatting text.
+
+Families (without a density the structured ones reproduce generated/ exactly):
+
+  random   every cell is filled with probability `density`, in a uniform colour
+  stairs   diagonal staircases, one every 2 / density columns
+  wedges   diagonal wedges (a staircase with a trailing edge), one every 2.5 / density columns
+  stripes  diagonal stripes 3 cells wide, slope 2, one every 3 / density columns
+
+Without a density the structured families draw a single shape (stripes:
+one every 7 columns).  With several colours the shapes
+of a structured family take the colours in turn.  Output is deterministic
+for a given family, size, density, colour count and seed; random puzzles
+need not have a unique solution, the .solution is the drawn one.
+
+    python -m solvers.generate stairs --size 1000
+    python -m solvers.generate random --size 200 500 1000 --density 0.4 --colors 3 --count 5 --out generated/random-big
+    python -m solvers.generate stripes --hex --size 50 --colors 2
+"""
+import argparse
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from .parser import build_puzzle
+from .verify import Geometry
+
+FAMILIES = ['random', 'stairs', 'wedges', 'stripes']
+PALETTE = ['#ffffff', '#000000', '#e6194b', '#3cb44b', '#4363d8', '#f58231',
+           '#911eb4', '#46f0f0', '#f032e6', '#bcf60c']
+MAX_COLORS = len(PALETTE) - 1     # 'a' .. 'i', as the check server's digits allow
+DEFAULT_OUT = 'generated'
+STRIPE_WIDTH = 3
+STRIPE_SLOPE = 2
+
+CELL_CHARS = np.frombuffer(b'-abcdefghi', dtype=np.uint8)
+
+
+def _period(density, per_row, span):
+    """
+    Columns from one shape to the next for shapes with `per_row` filled cells
+    per row on average that are `span` columns wide, or None (a single shape)
+    without a density.
+    """
+    if density is None:
+        return None
+    return max(span + 1, round(per_row / density))
+
+
+def _shapes(row, col, period, extent, ncolors, shift=0):
+    """(offset of every cell inside its shape's period, colour of that shape)."""
+    d = col - row + shift
+    if period is None:
+        period = extent + 3       # wider than the grid: the diagonal never wraps
+    shape = np.floor_divide(d, period)
+    return d - shape * period - shift, shape % ncolors + 1
+
+
+def random_cells(row, col, rng, density, ncolors, extent):
+    density = 0.5 if density is None else density
+    filled = rng.random(row.shape) < density
+    return np.where(filled, rng.integers(1, ncolors + 1, row.shape), 0)
+
+
+def stairs_cells(row, col, rng, density, ncolors, extent):
+    # even rows: the riser cell; odd rows: the tread, one cell to either side of it
+    period = _period(density, 2, 3)
+    d, color = _shapes(row, col, period, extent, ncolors, shift=1)
+    odd = row % 2 == 1
+    return np.where((d == 0) | (odd & (np.abs(d) == 1)), color, 0)
+
+
+def wedges_cells(row, col, rng, density, ncolors, extent):
+    # even rows: a 3 cell head and the edge two cells behind it; odd rows: the edge
+    period = _period(density, 2.5, 5)
+    d, color = _shapes(row, col, period, extent, ncolors, shift=2)
+    odd = row % 2 == 1
+    on = np.where(odd, d == -1, (d == -2) | ((d >= 0) & (d <= 2)))
+    return np.where(on, color, 0)
+
+
+def stripes_cells(row, col, rng, density, ncolors, extent):
+    period = _period(density, STRIPE_WIDTH, STRIPE_WIDTH) or 2 * STRIPE_WIDTH + 1
+    d = col - STRIPE_SLOPE * row + 2
+    stripe = np.floor_divide(d, period)
+    on = d - stripe * period < STRIPE_WIDTH
+    return np.where(on, stripe % ncolors + 1, 0)
+
+
+DRAW = {'random': random_cells, 'stairs': stairs_cells, 'wedges': wedges_cells, 'stripes': stripes_cells}
+
+
+def seed_of(family, kind, dims, density, ncolors, seed):
+    """The RNG seed of one instance: a stable hash of all its parameters."""
+    key = repr((family, kind, tuple(dims), density, ncolors, seed)).encode()
+    return zlib.crc32(key)
+
+
+def generate(family, kind, dims, density=None, ncolors=1, seed=0):
+    """(puzzle without clues, cell colours) of one instance; see the module docstring."""
+    if family not in DRAW:
+        raise ValueError(f'unknown family {family!r}, expected one of {FAMILIES}')
+    if not 1 <= ncolors <= MAX_COLORS:
+        raise ValueError(f'between 1 and {MAX_COLORS} colours are supported')
+    if density is not None and not 0 < density <= 1:
+        raise ValueError('density must be in (0, 1]')
+    dims = tuple(dims)
+    colors = PALETTE[:ncolors + 1]
+    nlines = dims[0] + dims[1] if kind == 'rect' else 3 * (2 * dims[0] - 1)
+    puzzle = build_puzzle(kind, dims, colors, [''] * nlines)
+
+    if kind == 'rect':
+        # rect cell ids are row-major
+        row, col = np.divmod(np.arange(dims[0] * dims[1], dtype=np.int64), dims[1])
+        extent = max(dims)
+    else:
+        # rows of constant r, as in the .solution file
+        coords = np.array(puzzle['cells'], dtype=np.int64).reshape(-1, 2)
+        row, col = coords[:, 1], coords[:, 0]
+        extent = 2 * dims[0] - 1
+    rng = np.random.default_rng(seed_of(family, kind, dims, density, ncolors, seed))
+    values = DRAW[family](row, col, rng, density, ncolors, extent)
+    return puzzle, values.astype(np.int64)
+
+
+def clue_lines(geo, values):
+    """The clue line of every line of the puzzle for cell colours `values`."""
+    line, length, color = geo.runs(values)
+    tokens = np.char.add(length.astype('U'), CELL_CHARS[color].view('S1').astype('U1'))
+    counts = np.bincount(line, minlength=geo.nlines)
+    out = []
+    pos = 0
+    for n in counts.tolist():
+        out.append(' '.join(tokens[pos:pos + n].tolist()))
+        pos += n
+    return out
+
+
+def clues_text(puzzle, values, geo=None):
+    geo = geo or Geometry(puzzle)
+    if puzzle['kind'] == 'rect':
+        header = f"rect {puzzle['height']} {puzzle['width']}"
+    else:
+        header = f"hex {puzzle['size']}"
+    return '\n'.join([header, ' '.join(puzzle['colors'])] + clue_lines(geo, values)) + '\n'
+
+
+def solution_text(puzzle, values, geo=None):
+    """The .solution file of cell colours `values` (the layout `cells_to_grid` writes)."""
+    chars = CELL_CHARS[values]
+    if puzzle['kind'] == 'rect':
+        rows = chars.reshape(puzzle['height'], puzzle['width'])
+        return b''.join(r.tobytes() + b'\n' for r in rows).decode()
+    geo = geo or Geometry(puzzle)
+    return ''.join(chars[ids].tobytes().decode() + '\n' for ids in geo.rows)
+
+
+def instance_name(family, kind, dims, density, ncolors, seed):
+    size = 'x'.join(map(str, dims)) if kind == 'rect' else f'hex{dims[0]}'
+    dens = '' if density is None else f'-d{density:g}'
+    return f'{family}-{size}-c{ncolors}{dens}-s{seed}'
+
+
+def write_instance(out_dir, family, kind, dims, density=None, ncolors=1, seed=0):
+    """Generate one instance into out_dir; returns the path of its .clues file."""
+    puzzle, values = generate(family, kind, dims, density, ncolors, seed)
+    geo = Geometry(puzzle)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = instance_name(family, kind, dims, density, ncolors, seed)
+    clue_path = out_dir / f'{stem}.clues'
+    clue_path.write_text(clues_text(puzzle, values, geo))
+    (out_dir / f'{stem}.solution').write_text(solution_text(puzzle, values, geo))
+    return clue_path
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Generate seeded stress puzzles (.clues and .solution).')
+    parser.add_argument('family', choices=FAMILIES)
+    parser.add_argument('--size', type=int, nargs='+', required=True,
+                        help='rows (rect) or side length (hex); several sizes give one instance set each')
+    parser.add_argument('--width', type=int, default=None, help='columns of a rect puzzle (default: square)')
+    parser.add_argument('--hex', action='store_true', help='hex grids instead of rect')
+    parser.add_argument('--density', type=float, default=None,
+                        help='fraction of filled cells (default: 0.5 for random, a single shape otherwise)')
+    parser.add_argument('--colors', type=int, default=1, help=f'block colours (1 .. {MAX_COLORS})')
+    parser.add_argument('--seed', type=int, default=0, help='first seed')
+    parser.add_argument('--count', type=int, default=1, help='instances per size (seeds seed .. seed+count-1)')
+    parser.add_argument('--out', default=None, help=f'output directory (default: {DEFAULT_OUT}/<family>-big)')
+    args = parser.parse_args(argv[1:])
+
+    kind = 'hex' if args.hex else 'rect'
+    out = args.out or str(Path(DEFAULT_OUT) / f'{args.family}-big')
+    for size in args.size:
+        dims = (size,) if args.hex else (size, args.width or size)
+        for seed in range(args.seed, args.seed + args.count):
+            try:
+                path = write_instance(out, args.family, kind, dims, args.density, args.colors, seed)
+            except ValueError as e:
+                print('Error:', e)
+                return 2
+            print(f'Wrote {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,266 @@
+"""
+Native solver engine: bitset line solving + propagation + DFS, no CNF.
+
+The state is, for every line, one Python int per colour whose bit p says
+"position p of this line may still take this colour".  A line is solved
+exactly with a bit-parallel placement DP over those masks:
+
+  - the starts where block j fits are the runs of at least n_j set bits
+    in the mask of its colour,
+  - moving through cells that may be background is a single add/xor
+    ("smear"), so every block costs O(1) big-int operations,
+  - a forward pass over the line and one over the reversed line give the
+    starts of every block that lie on a complete arrangement, from which
+    the new colour masks follow.
+
+Clues with '?' blocks fall back to the clue automaton (see `automaton`).
+Narrowed cells are pushed into the crossing lines and those lines are
+queued, as in `presolve`.  When propagation stalls the search branches on
+an undecided cell of the most constrained line (fewest undecided cells)
+using an explicit DFS stack.
+
+    result = solve(puzzle)
+    result.status   # 'sat', 'unsat' or 'limit'
+    result.cells    # {coord: colour index} when sat
+"""
+import time
+from collections import deque
+
+from .automaton import compile_clue, iter_bits
+
+
+def _smear(seeds, bg):
+    """Positions reachable from `seeds` by moving right over cells in `bg` (seeds included)."""
+    x = seeds & bg
+    return seeds | ((bg + x) ^ bg) | x
+
+
+def _starts(mask, n):
+    """Positions p with bits p .. p+n-1 of `mask` all set."""
+    r, have = mask, 1
+    while have < n:
+        step = min(have, n - have)
+        r &= r >> step
+        have += step
+    return r
+
+
+def _spread(starts, n):
+    """Bits p .. p+n-1 for every start p."""
+    r, have = starts, 1
+    while have < n:
+        step = min(have, n - have)
+        r |= r << step
+        have += step
+    return r
+
+
+def _reverse(x, width):
+    return int(format(x, f'0{width}b')[::-1], 2)
+
+
+def _forward(masks, blocks):
+    """
+    ready[j]: positions where blocks 0..j-1 can be complete with only
+    background since (len(blocks) + 1 entries); starts[j]: forward
+    feasible starts of block j.
+    """
+    bg = masks[0]
+    ready = [_smear(1, bg)]
+    starts = []
+    prev = None
+    ends = 0
+    for n, c in blocks:
+        if c == prev:
+            # a block of the same colour needs at least one background cell in between
+            can = _smear((ends & bg) << 1, bg)
+        else:
+            can = ready[-1]
+        s = can & _starts(masks[c], n)
+        starts.append(s)
+        ends = s << n
+        ready.append(_smear(ends, bg))
+        prev = c
+    return ready, starts
+
+
+def solve_line_masks(masks, blocks, length):
+    """
+    Narrow one line given per-colour position masks and blocks as
+    (length, cell colour).  Returns the new masks or None on contradiction.
+    """
+    k = len(blocks)
+    ready, starts = _forward(masks, blocks)
+    if not ready[k] >> length & 1:
+        return None
+    rmasks = [_reverse(m, length) for m in masks]
+    rready, rstarts = _forward(rmasks, blocks[::-1])
+
+    new = [0] * len(masks)
+    for j, (n, c) in enumerate(blocks):
+        ok = starts[j] & (_reverse(rstarts[k - 1 - j], length) >> (n - 1))
+        new[c] |= _spread(ok, n)
+    bg = 0
+    for j in range(k + 1):
+        # x is a gap cell after block j-1 if the suffix after it can hold blocks j..k-1
+        bg |= ready[j] & (_reverse(rready[k - j], length + 1) >> 1)
+    new[0] = bg & masks[0]
+    return new
+
+
+def _solve_line_auto(auto, masks, length):
+    doms = [0] * length
+    for c, m in enumerate(masks):
+        for p in iter_bits(m):
+            doms[p] |= 1 << c
+    res = auto.reachable(doms)
+    if res is None:
+        return None
+    new = [0] * len(masks)
+    for p, d in enumerate(res[1]):
+        for c in iter_bits(d):
+            new[c] |= 1 << p
+    return new
+
+
+class NativeResult:
+    def __init__(self, status, cells=None, nodes=0, elapsed=0.0):
+        self.status = status      # 'sat', 'unsat' or 'limit'
+        self.cells = cells        # {coord: colour index} when sat
+        self.nodes = nodes        # search nodes (1 = solved by propagation alone)
+        self.elapsed = elapsed
+
+
+class NativeSolver:
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        self.ncolors = len(puzzle['colors'])
+        lines = puzzle['lines']
+        self.lengths = [len(line['cells']) for line in lines]
+        self.blocks = []
+        self.autos = []
+        for line in lines:
+            parsed = line['blocks']
+            if any(col is None for _, col in parsed):
+                self.blocks.append(None)
+                self.autos.append(compile_clue(parsed, self.ncolors))
+            else:
+                self.blocks.append([(n, col + 1) for n, col in parsed])
+                self.autos.append(None)
+
+        # crossing[lidx][p]: the (other line, position) pairs that share cell p
+        incidence = [[tuple(x) for x in through] for through in puzzle['incidence'].tolist()]
+        self.crossing = [[[(o, q) for o, q in incidence[i] if o != lidx]
+                          for i in line['ids'].tolist()]
+                         for lidx, line in enumerate(lines)]
+
+    def initial(self):
+        state = []
+        for length in self.lengths:
+            full = (1 << length) - 1
+            state.append([full] * self.ncolors)
+        return state
+
+    def solve_line(self, lidx, masks):
+        if self.autos[lidx] is not None:
+            return _solve_line_auto(self.autos[lidx], masks, self.lengths[lidx])
+        return solve_line_masks(masks, self.blocks[lidx], self.lengths[lidx])
+
+    def propagate(self, state, queue, queued):
+        """Line solving to a fixpoint; False on contradiction."""
+        crossing = self.crossing
+        while queue:
+            lidx = queue.popleft()
+            queued[lidx] = False
+            old = state[lidx]
+            new = self.solve_line(lidx, old)
+            if new is None:
+                return False
+            for c in range(self.ncolors):
+                removed = old[c] & ~new[c]
+                for p in iter_bits(removed):
+                    for other, q in crossing[lidx][p]:
+                        state[other][c] &= ~(1 << q)
+                        if not queued[other]:
+                            queued[other] = True
+                            queue.append(other)
+            state[lidx] = new
+        return True
+
+    @staticmethod
+    def undecided(masks):
+        """Bitmask of positions that still allow more than one colour."""
+        seen = multi = 0
+        for m in masks:
+            multi |= seen & m
+            seen |= m
+        return multi
+
+    def choose(self, state):
+        """(line, position) to branch on: first undecided cell of the line with fewest undecided cells."""
+        best = None
+        for lidx, masks in enumerate(state):
+            u = self.undecided(masks)
+            if u:
+                cnt = bin(u).count('1')
+                if best is None or cnt < best[0]:
+                    best = (cnt, lidx, (u & -u).bit_length() - 1)
+                    if cnt == 1:
+                        break
+        return None if best is None else best[1:]
+
+    def assign(self, state, lidx, p, c):
+        """Fix cell p of line lidx to colour c in `state`; returns the lines to requeue."""
+        touched = [lidx]
+        bit = 1 << p
+        for x in range(self.ncolors):
+            if x != c:
+                state[lidx][x] &= ~bit
+        for other, q in self.crossing[lidx][p]:
+            obit = 1 << q
+            for x in range(self.ncolors):
+                if x != c:
+                    state[other][x] &= ~obit
+            touched.append(other)
+        return touched
+
+    def cells(self, state):
+        out = {}
+        for lidx, line in enumerate(self.puzzle['lines']):
+            masks = state[lidx]
+            for c in range(self.ncolors):
+                for p in iter_bits(masks[c]):
+                    out[line['cells'][p]] = c
+        return out
+
+    def solve(self, max_nodes=None, timeout=None):
+        start = time.perf_counter()
+        nlines = len(self.lengths)
+        stack = [(self.initial(), list(range(nlines)))]
+        nodes = 0
+        while stack:
+            if (max_nodes is not None and nodes >= max_nodes) or \
+                    (timeout is not None and time.perf_counter() - start > timeout):
+                return NativeResult('limit', nodes=nodes, elapsed=time.perf_counter() - start)
+            state, todo = stack.pop()
+            nodes += 1
+            queued = [False] * nlines
+            for lidx in todo:
+                queued[lidx] = True
+            if not self.propagate(state, deque(todo), queued):
+                continue
+            pick = self.choose(state)
+            if pick is None:
+                return NativeResult('sat', self.cells(state), nodes, time.perf_counter() - start)
+            lidx, p = pick
+            colors = [c for c in range(self.ncolors) if state[lidx][c] >> p & 1]
+            # block colours are tried before background (the last pushed is tried first)
+            for c in colors:
+                child = [list(m) for m in state]
+                stack.append((child, self.assign(child, lidx, p, c)))
+        return NativeResult('unsat', nodes=nodes, elapsed=time.perf_counter() - start)
+
+
+def solve(puzzle, max_nodes=None, timeout=None):
+    """Solve a parsed puzzle without SAT; see NativeResult."""
+    return NativeSolver(puzzle).solve(max_nodes, timeout)
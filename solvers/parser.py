@@ -1,35 +1,176 @@
+"""
+.clues 文件解析器。
+
+parse_clues 返回所有模块共用的拼图字典:
+  kind、height/width (rect) 或 size (hex)、colors、
+  cells: 单元格坐标列表，单元格在列表中的下标即其整数 id，
+  lines: [{'clue': 原始线索, 'cells': 坐标列表, 'blocks': 已分词的线索 (元组),
+           'ids': 单元格 id 的 int32 数组}]
+以及编译好的关联表 incidence: 形状为 (单元格数, k, 2) 的 int32 数组，
+incidence[i] 是经过单元格 i 的 k 条线 (rect 为 2，hex 为 3) 的 (线编号, 线内位置)。
+网格部分 (坐标、id 数组、incidence) 只取决于类型和大小，在进程内按大小共享，
+数组是只读的。
+
+给出 cache_dir 时，线索的分词结果按文件内容的哈希缓存在该目录下 (与 CNF 缓存
+一样用 pickle)，再次解析同一文件时直接加载，网格部分由 geometry 重建。
+"""
+import hashlib
+import os
 import pathlib
+import pickle
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+# Bump when the compiled layout (and so the cache entries) changes
+FORMAT = 1
 
-def parse_clues(path):
+DEFAULT_CACHE_DIR = 'parse_cache'
+
+
+def parse_clue_line(clue_line):
     """
-    解析 .clues 文件，支持矩形 (rect) 和任意大小的六边形 (hex) 格式。
+    Parse a clue line into a list of (length, color_index_or_None).
     """
+    parts = clue_line.replace(',', ' ').split()
+    parsed = []
+
+    for token in parts:
+        token = token.strip()
+        if not token:
+            continue
+        if token[-1].isalpha() or token[-1] == '?':
+            n = int(token[:-1])
+            if token[-1] == '?':
+                parsed.append((n, None))
+            else:
+                parsed.append((n, ord(token[-1]) - ord('a')))
+        else:
+            raise ValueError(f"Invalid clue token: {token}")
+
+    return parsed
+
+
+def read_text(path):
     p = pathlib.Path(path)
     try:
-        txt = p.read_text(encoding='utf-8').splitlines()
+        return p.read_text(encoding='utf-8')
     except UnicodeDecodeError:
-        txt = p.read_text(encoding='latin-1').splitlines()
+        return p.read_text(encoding='latin-1')
+
+
+def rect_lines(height, width):
+    """(cells, lines, ids) of a rect grid: the rows, then the columns."""
+    cells = list(product(range(height), range(width)))
+    lines = [cells[r * width:(r + 1) * width] for r in range(height)]
+    lines += [cells[c::width] for c in range(width)]
+    grid = np.arange(height * width, dtype=np.int32).reshape(height, width)
+    ids = [row.copy() for row in grid] + [col.copy() for col in grid.T]
+    return cells, lines, ids
+
+
+def hex_lines(size):
+    """
+    (cells, lines, ids) of a hex grid in axial coordinates (q, r), s = -q-r:
+    the lines of constant r (q ascending), of constant q (r descending),
+    then of constant s (q descending).  Lines are read off a (q, r) grid of
+    cell ids instead of filtering all cells per line.
+    """
+    n = size - 1
+    axis = np.arange(-n, n + 1)
+    qs, rs = np.meshgrid(axis, axis, indexing='ij')
+    valid = np.abs(qs + rs) <= n
+    # grid[q + n, r + n] is the id of cell (q, r), -1 outside the hexagon
+    grid = np.full(valid.shape, -1, dtype=np.int32)
+    grid[valid] = np.arange(valid.sum(), dtype=np.int32)
+    cells = list(zip(qs[valid].tolist(), rs[valid].tolist()))
+
+    ids = []
+    # 组 1: 水平线 (r 为常数)。箭头 -> (q 递增)
+    for r in axis:
+        ids.append(grid[:, r + n])
+    # 组 2: 垂直/斜向 (q 为常数)。箭头 ^ (r 递减)
+    for q in axis:
+        ids.append(grid[q + n, ::-1])
+    # 组 3: 另一斜向 (s 为常数)。箭头 \ (q 递减)
+    down = axis[::-1]
+    for s in axis:
+        r = -down - s
+        inside = np.abs(r) <= n
+        ids.append(grid[down[inside] + n, r[inside] + n])
+    ids = [line[line >= 0] for line in ids]
+    lines = [[cells[i] for i in line.tolist()] for line in ids]
+    return cells, lines, ids
+
+
+def incidence_of(ids, ncells):
+    """单元格到线的关联表 incidence (见模块说明)。"""
+    flat = np.concatenate(ids)
+    line_of = np.repeat(np.arange(len(ids), dtype=np.int32), [len(line) for line in ids])
+    pos = np.concatenate([np.arange(len(line), dtype=np.int32) for line in ids])
+    # every cell lies on the same number of lines, so sorting by cell id groups them evenly
+    order = np.argsort(flat, kind='stable')
+    k = len(flat) // ncells
+    return np.stack([line_of[order], pos[order]], axis=1).reshape(ncells, k, 2)
+
+
+@lru_cache(maxsize=64)
+def geometry(kind, dims):
+    """
+    (cells, lines, ids, incidence) of a grid, shared by every puzzle of the
+    same kind and size; build_puzzle hands out copies of the lists and
+    read-only arrays.
+    """
+    cells, lines, ids = rect_lines(*dims) if kind == 'rect' else hex_lines(*dims)
+    incidence = incidence_of(ids, len(cells))
+    for a in ids + [incidence]:
+        a.flags.writeable = False
+    return cells, lines, ids, incidence
+
+
+@lru_cache(maxsize=65536)
+def tokenize(clue):
+    """parse_clue_line 的结果 (元组)，相同的线索只分词一次。"""
+    return tuple(parse_clue_line(clue))
+
 
+def build_puzzle(kind, dims, colors, raw_clues, blocks=None):
+    cells, lines, ids, incidence = geometry(kind, dims)
+    if blocks is None:
+        blocks = [tokenize(clue) for clue in raw_clues]
+    puzzle = {'kind': kind}
+    if kind == 'rect':
+        puzzle.update(height=dims[0], width=dims[1])
+    else:
+        puzzle['size'] = dims[0]
+    puzzle.update({
+        'colors': colors, 'cells': list(cells),
+        'lines': [{'clue': raw_clues[i], 'cells': list(lines[i]), 'blocks': blocks[i], 'ids': ids[i]}
+                  for i in range(len(lines))],
+        'incidence': incidence,
+    })
+    return puzzle
+
+
+def parse_text(text, name='<clues>'):
+    """
+    解析 .clues 文件内容，支持矩形 (rect) 和任意大小的六边形 (hex) 格式。
+    """
+    txt = text.splitlines()
     if not txt:
         raise ValueError('空的 .clues 文件')
 
     first = txt[0].split()
-    
+
     if first[0] == 'rect':
         height, width = int(first[1]), int(first[2])
         colors = txt[1].split()
-        expected_clues = height + width
-        raw_clues = [line.rstrip() for line in txt[2:2 + expected_clues]]
-
-        cells = [(r, c) for r in range(height) for c in range(width)]
-        lines = []
-        for r in range(height): lines.append([(r, c) for c in range(width)])
-        for c in range(width): lines.append([(r, c) for r in range(height)])
-            
-        return {
-            'kind': 'rect', 'height': height, 'width': width, 'colors': colors, 'cells': cells,
-            'lines': [{'clue': raw_clues[i], 'cells': lines[i]} for i in range(len(lines))]
-        }
+        expected = height + width
+        raw_clues = [line.rstrip() for line in txt[2:2 + expected]]
+        # 末尾的空线索行 (整行为背景) 可能被省略
+        raw_clues += [''] * (expected - len(raw_clues))
+        return build_puzzle('rect', (height, width), colors, raw_clues)
 
     elif first[0] == 'hex':
         size = int(first[1])
@@ -38,39 +179,69 @@ def parse_clues(path):
         raw_clues = [line.rstrip() for line in txt[2:2 + expected]]
 
         if len(raw_clues) != expected:
-             raise ValueError(f'线索数量错误: 文件 "{p.name}" 需要 {expected} 条, 但找到 {len(raw_clues)} 条。')
-        
-        # 1. 生成轴向坐标 (q, r), s = -q-r
-        coords = []
-        for q in range(-(size - 1), size):
-            for r in range(-(size - 1), size):
-                if abs(-q - r) < size:
-                    coords.append((q, r))
-
-        # 2. 按逆时针规则和箭头方向，定义三个方向的线索组
-        dir_group1, dir_group2, dir_group3 = [], [], []
-        
-        # 组 1: 水平线 (r 为常数)。箭头 -> (q 递增)
-        for r_val in range(-(size - 1), size):
-            line = sorted([c for c in coords if c[1] == r_val], key=lambda x: x[0])
-            dir_group1.append(line)
-
-        # 组 2: 垂直/斜向 (q 为常数)。箭头 ^ (r 递减)
-        for q_val in range(-(size - 1), size):
-            line = sorted([c for c in coords if c[0] == q_val], key=lambda x: x[1], reverse=True)
-            dir_group2.append(line)
-            
-        # 组 3: 另一斜向 (s 为常数)。箭头 \ (q 递减)
-        for s_val in range(-(size - 1), size):
-            line = sorted([c for c in coords if -c[0]-c[1] == s_val], key=lambda x: x[0], reverse=True)
-            dir_group3.append(line)
-
-        # 3. 按照 r -> q -> s (一个可能的、符合逆时针的组序) 组合所有线索
-        all_lines = dir_group1 + dir_group2 + dir_group3
-        
-        return {
-            'kind': 'hex', 'size': size, 'colors': colors, 'cells': coords,
-            'lines': [{'clue': raw_clues[i], 'cells': all_lines[i]} for i in range(expected)]
-        }
+            raise ValueError(f'线索数量错误: 文件 "{name}" 需要 {expected} 条, 但找到 {len(raw_clues)} 条。')
+
+        return build_puzzle('hex', (size,), colors, raw_clues)
     else:
         raise NotImplementedError('不支持的拼图类型: ' + first[0])
+
+
+def _cache_path(cache_dir, data):
+    h = hashlib.sha256(data)
+    h.update(repr(FORMAT).encode())
+    key = h.hexdigest()
+    return pathlib.Path(cache_dir) / key[:2] / (key + '.pkl')
+
+
+def save_compiled(path, puzzle):
+    """
+    把拼图中不能由网格大小推出的部分 (颜色、线索及其分词结果) 写入缓存
+    (先写临时文件再改名)；网格本身加载时由 geometry 重建。
+    """
+    kind = puzzle['kind']
+    dims = (puzzle['height'], puzzle['width']) if kind == 'rect' else (puzzle['size'],)
+    entry = {
+        'format': FORMAT, 'kind': kind, 'dims': dims, 'colors': puzzle['colors'],
+        'clues': [line['clue'] for line in puzzle['lines']],
+        'blocks': [line['blocks'] for line in puzzle['lines']],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as fp:
+        pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def load_compiled(path):
+    with open(path, 'rb') as fp:
+        entry = pickle.load(fp)
+    if entry.get('format') != FORMAT:
+        raise ValueError('stale parse cache entry')
+    return build_puzzle(entry['kind'], entry['dims'], entry['colors'], entry['clues'], entry['blocks'])
+
+
+def parse_clues(path, cache_dir=None):
+    """
+    解析 .clues 文件 (见模块说明)。cache_dir 不为空时先查找缓存，
+    未命中则解析后写入缓存；缓存损坏时重新解析。
+    """
+    p = pathlib.Path(path)
+    if cache_dir is None:
+        return parse_text(read_text(p), p.name)
+
+    data = p.read_bytes()
+    entry = _cache_path(cache_dir, data)
+    try:
+        return load_compiled(entry)
+    except (OSError, EOFError, ValueError, KeyError, pickle.UnpicklingError):
+        pass
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+    puzzle = parse_text(text, p.name)
+    try:
+        save_compiled(entry, puzzle)
+    except OSError:
+        pass
+    return puzzle
@@ -0,0 +1,155 @@
+"""
+Parallel solver portfolio.
+
+Every member is an (approach, PySAT backend) pair, written 'A:backend'
+(e.g. '3:cadical153').  All members encode and solve the same puzzle in
+their own process; the first member to answer (SAT or UNSAT) wins and the
+others are terminated.  Members that fail are ignored as long as another
+one can still answer.
+
+Win statistics are accumulated in a JSON file (`PortfolioStats`) so the
+portfolio can be trimmed to the members that actually win on a workload.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+from .varmap import VarManager
+
+DEFAULT_MEMBERS = ['2:glucose4', '3:cadical153', '4:maplechrono', '3:lingeling']
+DEFAULT_STATS = 'portfolio_stats.json'
+
+
+def parse_members(spec):
+    """'2:glucose4,3:cadical153' -> [(2, 'glucose4'), (3, 'cadical153')]."""
+    members = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        approach, sep, backend = item.partition(':')
+        if not sep or not backend:
+            raise ValueError(f'bad portfolio member {item!r}, expected APPROACH:BACKEND')
+        members.append((int(approach), backend))
+    if not members:
+        raise ValueError('empty portfolio')
+    return members
+
+
+def member_name(member):
+    return f'{member[0]}:{member[1]}'
+
+
+def _run_member(index, member, puzzle, fixed, amo, results):
+    from .run import choose_encoder
+    from .solver_pysat import SolverSink
+
+    start = time.perf_counter()
+    try:
+        approach, backend = member
+        vm = VarManager()
+        with SolverSink(backend) as sink:
+            choose_encoder(approach)(puzzle, vm, amo=amo, sink=sink)
+            result = sink.solve(vm, fixed)
+        results.put((index, result.status, result.grid, time.perf_counter() - start))
+    except Exception as e:
+        results.put((index, 'error', repr(e), time.perf_counter() - start))
+
+
+class PortfolioResult:
+    def __init__(self, status, grid=None, winner=None, elapsed=0.0, errors=None):
+        self.status = status      # 'sat', 'unsat', 'timeout' or 'error'
+        self.grid = grid
+        self.winner = winner      # (approach, backend) of the first finisher
+        self.elapsed = elapsed    # wall-clock seconds of the winner (or the whole run)
+        self.errors = errors or {}
+
+
+def run_portfolio(puzzle, members, fixed=None, amo='auto', timeout=None):
+    """
+    Solve `puzzle` (as returned by parse_clues, optionally with presolved
+    'domains') with every member in parallel and return a PortfolioResult
+    for the first one that answers.
+    """
+    ctx = multiprocessing.get_context()
+    results = ctx.Queue()
+    procs = []
+    for i, member in enumerate(members):
+        p = ctx.Process(target=_run_member, args=(i, member, puzzle, fixed, amo, results), daemon=True)
+        p.start()
+        procs.append(p)
+
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    errors = {}
+    result = None
+    try:
+        while len(errors) < len(members):
+            wait = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            try:
+                index, status, payload, elapsed = results.get(timeout=wait)
+            except queue.Empty:
+                result = PortfolioResult('timeout', elapsed=time.perf_counter() - start, errors=errors)
+                break
+            if status == 'error':
+                errors[members[index]] = payload
+                continue
+            result = PortfolioResult(status, payload if status == 'sat' else None,
+                                     members[index], elapsed, errors)
+            break
+        else:
+            result = PortfolioResult('error', elapsed=time.perf_counter() - start, errors=errors)
+    finally:
+        # cancel the members that are still running
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join()
+        results.close()
+    return result
+
+
+class PortfolioStats:
+    """Per-member run/win counts, persisted as JSON."""
+
+    def __init__(self, path=DEFAULT_STATS):
+        self.path = path
+        self.members = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as fp:
+                    self.members = json.load(fp)
+            except (OSError, ValueError):
+                self.members = {}
+
+    def _entry(self, member):
+        return self.members.setdefault(member_name(member),
+                                       {'runs': 0, 'wins': 0, 'errors': 0, 'win_time': 0.0})
+
+    def record(self, members, result):
+        for member in members:
+            self._entry(member)['runs'] += 1
+        for member in result.errors:
+            self._entry(member)['errors'] += 1
+        if result.winner is not None:
+            entry = self._entry(result.winner)
+            entry['wins'] += 1
+            entry['win_time'] += result.elapsed
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(self.members, fp, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def summary(self):
+        lines = [f'{"member":<20} {"runs":>6} {"wins":>6} {"errors":>6} {"avg win s":>10}']
+        for name, e in sorted(self.members.items(), key=lambda kv: -kv[1]['wins']):
+            avg = e['win_time'] / e['wins'] if e['wins'] else 0.0
+            lines.append(f'{name:<20} {e["runs"]:>6} {e["wins"]:>6} {e["errors"]:>6} {avg:>10.3f}')
+        return '\n'.join(lines)
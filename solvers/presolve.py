@@ -0,0 +1,65 @@
+"""
+Presolve: iterated line solving before any CNF is emitted.
+
+Every cell starts with the full colour domain.  Each line is solved exactly
+against the current domains (forward/backward reachability over the clue
+automaton, which generalises the left-most/right-most placement overlap to
+coloured and '?' blocks), and lines crossing a changed cell are re-queued
+until nothing changes any more.
+
+The result is a domain per cell which the encoders use to skip variables and
+clauses for decided cells.
+"""
+from collections import deque
+
+from .automaton import compile_clue, iter_bits
+
+
+def solve_line(auto, doms):
+    """Narrow one line's colour bitmasks. Returns the new bitmasks or None on contradiction."""
+    res = auto.reachable(doms)
+    if res is None:
+        return None
+    return res[1]
+
+
+def presolve(puzzle):
+    """
+    Run line solving to a fixpoint.
+    Returns {coord: tuple of allowed colour indices}, or None if the clues are contradictory.
+    """
+    ncolors = len(puzzle['colors'])
+    full = (1 << ncolors) - 1
+    cells = puzzle['cells']
+    # domains by cell id while solving
+    dom = [full] * len(cells)
+
+    lines = puzzle['lines']
+    autos = [compile_clue(line['blocks'], ncolors) for line in lines]
+    line_ids = [line['ids'].tolist() for line in lines]
+    lines_of = puzzle['incidence'][:, :, 0].tolist()
+
+    queue = deque(range(len(lines)))
+    queued = [True] * len(lines)
+    while queue:
+        lidx = queue.popleft()
+        queued[lidx] = False
+        ids = line_ids[lidx]
+        new = solve_line(autos[lidx], [dom[i] for i in ids])
+        if new is None:
+            return None
+        for i, m in zip(ids, new):
+            if m != dom[i]:
+                dom[i] = m
+                for other in lines_of[i]:
+                    if other != lidx and not queued[other]:
+                        queued[other] = True
+                        queue.append(other)
+
+    return {coord: tuple(iter_bits(m)) for coord, m in zip(cells, dom)}
+
+
+def fixed_cells(domains):
+    """The decided part of a presolve result: {coord: colour index}."""
+    return {coord: d[0] for coord, d in domains.items() if len(d) == 1}
+
@@ -0,0 +1,180 @@
+"""
+Per-line encoding profiler and the hook API behind it.
+
+`templates.encode_lines` emits one event per encoded line to every
+subscriber:
+
+  {'event': 'line', 'line': index, 'clue': ..., 'length': ...,
+   'vars': variables added, 'clauses': clauses added, 'time': seconds,
+   'template': 'hit' / 'miss' / None,
+   # encoder specific size, see below
+   'arrangements' (approach 1) / 'starts' (2) / 'nodes' (3) / 'states' (4),
+   # with tracemalloc running
+   'mem_peak': bytes}
+
+Encoders report their own sizes with `note(**stats)` while a line is being
+encoded; notes recorded when a template is built are kept with the
+template and reported again on every hit.  Nothing is measured while
+there are no subscribers.
+
+    with profiling.subscribed(callback):
+        encoder(puzzle, vm)
+
+`LineProfiler` is the subscriber behind `run.py --profile` and
+`benchmark.py --profile`: it collects the events of a puzzle and builds a
+JSON report of the lines that cost the most.
+"""
+import contextlib
+import json
+import time
+import tracemalloc
+
+DEFAULT_TOP = 20
+
+_subscribers = []
+_notes = None
+_peak = 0
+
+
+def subscribe(callback):
+    """Call `callback(event)` for every event; returns the callback."""
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+@contextlib.contextmanager
+def subscribed(callback):
+    subscribe(callback)
+    try:
+        yield callback
+    finally:
+        unsubscribe(callback)
+
+
+def active():
+    return bool(_subscribers)
+
+
+def emit(event):
+    for callback in list(_subscribers):
+        callback(event)
+
+
+def note(**stats):
+    """Attach encoder specific sizes to the line being encoded (ignored otherwise)."""
+    if _notes is not None:
+        _notes.update(stats)
+
+
+def start_notes():
+    """Start collecting notes; returns the state to hand back to stop_notes."""
+    global _notes
+    prev, _notes = _notes, {}
+    return prev
+
+
+def stop_notes(prev):
+    """The notes collected since start_notes."""
+    global _notes
+    notes, _notes = _notes, prev
+    return notes
+
+
+def traced_peak():
+    """Peak traced memory, also across the per-line resets done by LineTimer."""
+    return max(_peak, tracemalloc.get_traced_memory()[1])
+
+
+def reset_peak():
+    global _peak
+    _peak = 0
+    tracemalloc.reset_peak()
+
+
+class LineTimer:
+    """Measures one line for `encode_lines`."""
+
+    def __init__(self, lidx, line, vm, clauses):
+        global _peak
+        self.vm = vm
+        self.clauses = clauses
+        self.event = {'event': 'line', 'line': lidx, 'clue': line['clue'].strip(),
+                      'length': len(line['cells']), 'template': None}
+        self.tracing = tracemalloc.is_tracing()
+        if self.tracing:
+            self.mem0, peak = tracemalloc.get_traced_memory()
+            _peak = max(_peak, peak)
+            tracemalloc.reset_peak()
+        self.notes_state = start_notes()
+        self.vars0 = vm.nvars()
+        self.clauses0 = len(clauses)
+        self.t0 = time.perf_counter()
+
+    def finish(self, template=None, notes=None):
+        elapsed = time.perf_counter() - self.t0
+        event = self.event
+        event.update(stop_notes(self.notes_state))
+        if notes:
+            event.update(notes)
+        event['template'] = template
+        event['vars'] = self.vm.nvars() - self.vars0
+        event['clauses'] = len(self.clauses) - self.clauses0
+        event['time'] = elapsed
+        if self.tracing:
+            event['mem_peak'] = tracemalloc.get_traced_memory()[1] - self.mem0
+        emit(event)
+
+
+class LineProfiler:
+    """Collects line events and builds the report of the most expensive lines."""
+
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.lines = []
+
+    def __call__(self, event):
+        if event.get('event') == 'line':
+            self.lines.append(event)
+
+    def reset(self):
+        self.lines = []
+
+    def report(self, **info):
+        """JSON-ready dict: totals and the top lines by time, clauses and variables."""
+        lines = self.lines
+        report = dict(info)
+        report['lines'] = len(lines)
+        report['totals'] = {key: sum(e.get(key, 0) for e in lines) for key in ('vars', 'clauses', 'time')}
+        report['templates'] = {'hit': sum(e['template'] == 'hit' for e in lines),
+                               'miss': sum(e['template'] == 'miss' for e in lines)}
+        for key in ('time', 'clauses', 'vars', 'mem_peak'):
+            if lines and key in lines[0]:
+                report[f'top_{key}'] = sorted(lines, key=lambda e: e[key], reverse=True)[:self.top]
+        return report
+
+
+def memory_sites(snapshot, limit=10):
+    """The top allocation sites of a tracemalloc snapshot, JSON-ready."""
+    return [{'site': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:limit]]
+
+
+def describe(report, limit=5):
+    """A few lines of text about the most expensive lines of a report."""
+    totals = report['totals']
+    out = [f"Profile: {report['lines']} lines, {totals['vars']} vars, {totals['clauses']} clauses, "
+           f"{totals['time']:.3f}s in line encoders"]
+    for e in report.get('top_time', [])[:limit]:
+        size = ', '.join(f'{k} {e[k]}' for k in ('arrangements', 'starts', 'nodes', 'states') if k in e)
+        out.append(f"  line {e['line']:>4} len {e['length']:>4}: {e['time'] * 1000:8.2f} ms, "
+                   f"{e['vars']} vars, {e['clauses']} clauses{', ' + size if size else ''}  [{e['clue']}]")
+    return '\n'.join(out)
+
+
+def write_report(path, reports):
+    with open(path, 'w') as fp:
+        json.dump(reports, fp, indent=1)
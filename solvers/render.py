@@ -0,0 +1,143 @@
+"""
+Local renderer for solutions (SVG or PNG), rect and hex grids.
+
+Cells are drawn with the palette from the colour line of the .clues file
+(colour 0 is the background).  Hex puzzles are drawn pointy-top from their
+axial (q, r) coordinates, one row per r as in the .solution file.  PNG
+output needs pillow.
+
+    python -m solvers.render path/to/nonogram.clues path/to/nonogram.solution [--format png]
+    python -m solvers.render clues_dir solutions_dir --out renders/ [--jobs N]
+"""
+import argparse
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .verify import find_clues, geometry
+
+FORMATS = ['svg', 'png']
+DEFAULT_CELL = 16
+GRID_COLOR = '#cccccc'
+MARGIN = 2
+
+
+def cell_polygons(puzzle, cell=DEFAULT_CELL):
+    """([polygon per cell, indexed like puzzle['cells']], width, height) in pixels."""
+    if puzzle['kind'] == 'rect':
+        polys = [[(c * cell, r * cell), ((c + 1) * cell, r * cell),
+                  ((c + 1) * cell, (r + 1) * cell), (c * cell, (r + 1) * cell)]
+                 for r, c in puzzle['cells']]
+    else:
+        # pointy-top hexagons with circumradius `size`; rows of constant r are horizontal
+        size = cell / math.sqrt(3)
+        corners = [(size * math.cos(math.radians(60 * k - 30)), size * math.sin(math.radians(60 * k - 30)))
+                   for k in range(6)]
+        polys = []
+        for q, r in puzzle['cells']:
+            cx = cell * (q + r / 2)
+            cy = 1.5 * size * r
+            polys.append([(cx + dx, cy + dy) for dx, dy in corners])
+    xs = [x for poly in polys for x, _ in poly]
+    ys = [y for poly in polys for _, y in poly]
+    x0, y0 = min(xs) - MARGIN, min(ys) - MARGIN
+    polys = [[(x - x0, y - y0) for x, y in poly] for poly in polys]
+    return polys, math.ceil(max(xs) - x0 + MARGIN), math.ceil(max(ys) - y0 + MARGIN)
+
+
+def render_svg(puzzle, values, cell=DEFAULT_CELL):
+    """SVG document (str) for cell colours `values` (indexed like puzzle['cells'])."""
+    palette = puzzle['colors']
+    polys, width, height = cell_polygons(puzzle, cell)
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+           f'viewBox="0 0 {width} {height}">',
+           f'<rect width="{width}" height="{height}" fill="{palette[0]}"/>']
+    for poly, v in zip(polys, values):
+        points = ' '.join(f'{x:.2f},{y:.2f}' for x, y in poly)
+        out.append(f'<polygon points="{points}" fill="{palette[v]}" stroke="{GRID_COLOR}" stroke-width="0.5"/>')
+    out.append('</svg>')
+    return '\n'.join(out) + '\n'
+
+
+def render_png(puzzle, values, cell=DEFAULT_CELL):
+    """PIL image for cell colours `values` (indexed like puzzle['cells'])."""
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        raise ImportError('PNG output needs pillow (pip install pillow)')
+    palette = puzzle['colors']
+    polys, width, height = cell_polygons(puzzle, cell)
+    img = Image.new('RGB', (width, height), palette[0])
+    draw = ImageDraw.Draw(img)
+    for poly, v in zip(polys, values):
+        draw.polygon(poly, fill=palette[v], outline=GRID_COLOR)
+    return img
+
+
+def render_file(clue_path, solution_path, out_path, fmt='svg', cell=DEFAULT_CELL):
+    """Render one solution file; raises ValueError if it does not fit the puzzle."""
+    geo = geometry(clue_path)
+    values = geo.read_solution(Path(solution_path).read_text()).tolist()
+    if fmt == 'png':
+        render_png(geo.puzzle, values, cell).save(out_path)
+    else:
+        Path(out_path).write_text(render_svg(geo.puzzle, values, cell))
+    return out_path
+
+
+def _render_job(job):
+    clue_path, solution_path, out_path, fmt, cell = job
+    if clue_path is None:
+        return solution_path, 'no matching .clues file'
+    try:
+        render_file(clue_path, solution_path, out_path, fmt, cell)
+    except Exception as e:
+        return solution_path, f'{type(e).__name__}: {e}'
+    return solution_path, None
+
+
+def render_directory(clues_dir, solutions_dir, out_dir, fmt='svg', cell=DEFAULT_CELL, jobs=None):
+    """Render every .solution file into out_dir with `jobs` processes; returns [(path, error or None)]."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    work = [(find_clues(clues_dir, s), s, out_dir / f'{s.stem}.{fmt}', fmt, cell)
+            for s in sorted(Path(solutions_dir).glob('*.solution'))]
+    if jobs == 1 or len(work) < 2:
+        return [_render_job(job) for job in work]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_render_job, work, chunksize=4))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Render nonogram solutions as SVG or PNG.')
+    parser.add_argument('clues', help='.clues file or directory of .clues files')
+    parser.add_argument('solutions', help='.solution file or directory of .solution files')
+    parser.add_argument('--out', default=None, help='output file or directory (default: next to the solution / renders/)')
+    parser.add_argument('--format', default='svg', choices=FORMATS, help='output format')
+    parser.add_argument('--cell', type=int, default=DEFAULT_CELL, help='cell size in pixels')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes for directories (default: one per core)')
+    args = parser.parse_args(argv[1:])
+
+    if Path(args.solutions).is_dir():
+        out_dir = args.out or 'renders'
+        results = render_directory(args.clues, args.solutions, out_dir, args.format, args.cell, args.jobs)
+        failed = [(p, err) for p, err in results if err]
+        for p, err in failed:
+            print(f'{p.name}: {err}')
+        print(f'Rendered {len(results) - len(failed)} of {len(results)} solutions into {out_dir}')
+        return 1 if failed else 0
+
+    solution = Path(args.solutions)
+    out = args.out or str(solution.with_name(f'{solution.name}.{args.format}'))
+    try:
+        render_file(args.clues, solution, out, args.format, args.cell)
+    except Exception as e:
+        print(f'{solution.name}: {type(e).__name__}: {e}')
+        return 1
+    print(f'Wrote {out}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -1,15 +1,27 @@
 import sys
-from .parser import parse_clues
+from .parser import parse_clues, DEFAULT_CACHE_DIR as PARSE_CACHE_DIR
 from .varmap import VarManager
+from .presolve import presolve, fixed_cells
+from .cardinality import METHODS as AMO_METHODS
+from .sinks import DimacsSink, ClauseBuffer, CountingSink, TeeSink
+from . import templates, profiling
+from .cache import CNFCache, encoder_version, DEFAULT_DIR as CACHE_DIR, DEFAULT_MAX_MB as CACHE_MAX_MB
+from .portfolio import DEFAULT_MEMBERS as PORTFOLIO_MEMBERS, DEFAULT_STATS as PORTFOLIO_STATS
 def write_dimacs(nvars, clauses, path):
-    with open(path, 'w') as fp:
-        fp.write(f'p cnf {nvars} {len(clauses)}\n')
-        for cl in clauses:
-            fp.write(' '.join(str(x) for x in cl) + ' 0\n')
+    sink = DimacsSink(path)
+    sink.extend(clauses)
+    sink.close(nvars)
 import argparse
+import json
 import os
 from pathlib import Path
 import pprint
+import time
+import tracemalloc
+
+RESULTS_FILE = 'results.jsonl'
+PROFILE_FILE = 'profile.json'
+ENGINES = ['sat', 'native', 'auto']
 
 
 def choose_encoder(n):
@@ -17,6 +29,8 @@ def choose_encoder(n):
         from .approach1 import encode
     elif n == 2:
         from .approach2 import encode
+    elif n == 3:
+        from .approach3 import encode
     elif n == 4:
         from .approach4 import encode
     else:
@@ -24,41 +38,100 @@ def choose_encoder(n):
     return encode
 
 
-def main(argv):
+def build_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument('input')
     parser.add_argument('output', nargs='?', default=None, help='optional output CNF path or directory')
     parser.add_argument('--approach', type=int, default=1, choices=[1,2,3,4], help='which encoding approach')
     parser.add_argument('--solve', action='store_true', help='also solve the generated CNF with PySAT and write a .solution file')
     parser.add_argument('--solution', default=None, help='path to write the .solution file when using --solve')
+    parser.add_argument('--check-unique', action='store_true',
+                        help='also report whether the solution is unique (implies --solve)')
+    parser.add_argument('--count-solutions', type=int, default=None, metavar='K',
+                        help='count solutions up to K with blocking clauses on the same solver (implies --solve)')
+    parser.add_argument('--backend', default='glucose3', help='PySAT backend used by --solve (e.g. glucose4, cadical153)')
+    parser.add_argument('--conflicts', type=int, default=None, metavar='N', help='conflict budget of the SAT solve')
+    parser.add_argument('--propagations', type=int, default=None, metavar='N', help='propagation budget of the SAT solve')
+    parser.add_argument('--solve-timeout', type=float, default=None, metavar='S',
+                        help='wall-clock limit of the SAT solve; the solver is interrupted when it runs out')
     parser.add_argument('--dump-puzzle', action='store_true', help='print the parsed puzzle structure and skip encoding')
-    args = parser.parse_args(argv[1:])
-    inp = args.input; out = args.output
-    encoder = choose_encoder(args.approach)
+    parser.add_argument('--amo', default='auto', choices=AMO_METHODS, help='at-most-one encoding used by the encoder')
+    parser.add_argument('--presolve', action='store_true', help='fix cells by iterated line solving before encoding')
+    parser.add_argument('--no-cache', action='store_true', help='always re-encode instead of using the on-disk CNF cache')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the CNF cache')
+    parser.add_argument('--cache-size', type=float, default=CACHE_MAX_MB, help='size cap of the CNF cache in MB')
+    parser.add_argument('--parse-cache', nargs='?', const=PARSE_CACHE_DIR, default=None, metavar='DIR',
+                        help=f'keep parsed clue files in an on-disk cache (default directory: {PARSE_CACHE_DIR})')
+    parser.add_argument('--portfolio', nargs='?', const=','.join(PORTFOLIO_MEMBERS), default=None, metavar='A:BACKEND,...',
+                        help='solve with several approach:backend members in parallel and keep the first answer')
+    parser.add_argument('--portfolio-timeout', type=float, default=None, help='wall-clock limit (s) of a portfolio run')
+    parser.add_argument('--portfolio-stats', default=PORTFOLIO_STATS, help='JSON file accumulating per-member win statistics')
+    parser.add_argument('--var-map', action='store_true', help='write a <cnf>.map file naming every variable block (bypasses the cache)')
+    parser.add_argument('--engine', default='sat', choices=ENGINES,
+                        help='sat: CNF + PySAT; native: bitset line solving + DFS, no CNF; '
+                             'auto: native within --native-nodes, then SAT')
+    parser.add_argument('--native-nodes', type=int, default=1000, help='search node budget of the native engine in auto mode')
+    parser.add_argument('--no-templates', action='store_true',
+                        help='encode every line on its own instead of instantiating shared line templates')
+    parser.add_argument('--profile', nargs='?', const=PROFILE_FILE, default=None, metavar='PATH',
+                        help=f'record per-line encoding costs and write the most expensive lines as JSON '
+                             f'(default: {PROFILE_FILE}; bypasses the cache)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile, also trace allocations (per-line peaks and top allocation sites; slow)')
+    parser.add_argument('--profile-top', type=int, default=profiling.DEFAULT_TOP, metavar='N',
+                        help='lines listed per category in the profile report')
+    parser.add_argument('--no-cnf', action='store_true', help='do not write the CNF file')
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help='process puzzles in N worker processes (0: one per core)')
+    parser.add_argument('--timeout', type=float, default=None, help='per-puzzle wall-clock limit in seconds (with --jobs)')
+    parser.add_argument('--memory-limit', type=float, default=None, metavar='MB', help='per-puzzle memory limit (with --jobs)')
+    parser.add_argument('--results', default=None,
+                        help='append one JSON line per puzzle to this file (default results.jsonl with --jobs)')
+    return parser
 
-    def process_one(clue_path: Path, out_arg: str):
-        try:
-            puzzle = parse_clues(str(clue_path))
-        except Exception as e:
-            print(f'Error parsing {clue_path}:', e)
-            return 1
 
-        if args.dump_puzzle:
-            print(f'Parsed puzzle for {clue_path}:')
-            pprint.pprint(puzzle)
-            return 0
+def open_cache(args):
+    if args.no_cache or args.var_map or args.portfolio or args.profile or args.engine == 'native':
+        return None
+    return CNFCache(args.cache_dir, args.cache_size)
 
-        vm = VarManager()
-        try:
-            clauses = encoder(puzzle, vm)
-        except Exception as e:
-            print(f'Error encoding {clue_path}:', e)
-            return 1
-        nvars = vm.nvars()
 
+def make_processor(args, cache=None, members=None, stats=None, profiles=None):
+    """
+    Return process_one(clue_path, out_arg, record=None) -> exit code, which
+    encodes (and with --solve solves) one puzzle.  If `record` is a dict it is
+    filled with the outcome: status, vars, clauses and per-phase times.
+    Portfolio wins are only added to `stats` when it is given.  With
+    --profile the line profile of every encoded puzzle is put into
+    `profiles` under its path.
+    """
+    encoder = choose_encoder(args.approach)
+    # a variable map names the blocks of each encoder, which templates replace by one block per line
+    use_templates = not args.no_templates and not args.var_map
+
+    def solution_path(clue_stem, tag=None):
+        tag = tag or f'a{args.approach}'
+        solpath = args.solution
+        if solpath is None:
+            sol_dir = Path('solutions')
+            sol_dir.mkdir(exist_ok=True)
+            solpath = sol_dir / (f"{clue_stem}_{tag}.solution")
+        else:
+            solpath = Path(solpath)
+            if str(args.solution).endswith(os.path.sep) or solpath.is_dir():
+                solpath.mkdir(parents=True, exist_ok=True)
+                solpath = solpath / (f"{clue_stem}_{tag}.solution")
+            else:
+                if solpath.parent == Path('.') or str(solpath.parent) == '':
+                    sol_dir = Path('solutions')
+                    sol_dir.mkdir(exist_ok=True)
+                    solpath = sol_dir / solpath.name
+                else:
+                    solpath.parent.mkdir(parents=True, exist_ok=True)
+        return solpath
+
+    def cnf_path(clue_stem, out_arg):
         # Determine CNF output path using same logic as single-file mode
-        inp_path = Path(clue_path)
-        clue_stem = inp_path.stem
         if out_arg is None:
             cnf_dir = Path('cnf')
             cnf_dir.mkdir(exist_ok=True)
@@ -74,41 +147,349 @@ def main(argv):
                     out_path = cnf_dir / out_path.name
                 else:
                     out_path.parent.mkdir(parents=True, exist_ok=True)
+        return out_path
+
+    def process_portfolio(clue_path: Path, rec):
+        from .portfolio import run_portfolio, member_name
+        from .solver_pysat import cells_to_grid, write_solution_file
+        times = rec.setdefault('times', {})
+        t0 = time.perf_counter()
+        try:
+            puzzle = parse_clues(str(clue_path), args.parse_cache)
+        except Exception as e:
+            print(f'Error parsing {clue_path}:', e)
+            rec['status'] = 'error'
+            return 1
+        times['parse'] = time.perf_counter() - t0
+        fixed = None
+        if args.presolve:
+            t0 = time.perf_counter()
+            domains = presolve(puzzle)
+            times['presolve'] = time.perf_counter() - t0
+            if domains is None:
+                print('UNSAT (presolve found contradictory clues)')
+                rec['status'] = 'unsat'
+                return 10
+            fixed = fixed_cells(domains)
+            print(f'Presolve fixed {len(fixed)} of {len(domains)} cells')
+            if len(fixed) == len(domains):
+                solpath = solution_path(Path(clue_path).stem, 'portfolio')
+                write_solution_file(str(solpath), cells_to_grid(fixed))
+                print(f'Solved by presolve, wrote solution to {solpath}')
+                rec['status'] = 'sat'
+                return 0
+            puzzle['domains'] = domains
 
-        write_dimacs(nvars, clauses, str(out_path))
-        print(f'Wrote {out_path} with {nvars} vars and {len(clauses)} clauses (approach {args.approach})')
+        print(f'Running portfolio of {len(members)} members: {", ".join(map(member_name, members))}')
+        result = run_portfolio(puzzle, members, fixed, amo=args.amo, timeout=args.portfolio_timeout)
+        times['solve'] = result.elapsed
+        rec['winner'] = member_name(result.winner) if result.winner else None
+        rec['member_errors'] = {member_name(m): err for m, err in result.errors.items()}
+        if stats is not None:
+            stats.record(members, result)
+            stats.save()
+        for member, err in result.errors.items():
+            print(f'  member {member_name(member)} failed: {err}')
+        rec['status'] = result.status
+        if result.status == 'timeout':
+            print(f'Portfolio timed out after {result.elapsed:.2f}s')
+            return 1
+        if result.status == 'error':
+            print('All portfolio members failed')
+            return 1
+        print(f'Winner: {member_name(result.winner)} ({result.status}) in {result.elapsed:.2f}s')
+        if result.status == 'unsat':
+            print('UNSAT (no solution)')
+            return 10
+        solpath = solution_path(Path(clue_path).stem, 'portfolio')
+        write_solution_file(str(solpath), result.grid)
+        print(f'Wrote solution to {solpath}')
+        return 0
+
+    def report_count(nsol, rec):
+        rec['solutions'] = nsol
+        rec['unique'] = nsol == 1
+        if nsol == 1:
+            print('Unique solution')
+        elif nsol >= args.count_solutions:
+            print(f'Multiple solutions (stopped after {nsol}, --count-solutions {args.count_solutions})')
+        else:
+            print(f'Exactly {nsol} solutions')
+
+    def process_native(clue_path: Path, rec):
+        """Solve with the native engine; returns None when auto mode should fall back to SAT."""
+        from .native import solve as native_solve
+        from .solver_pysat import cells_to_grid, write_solution_file
+        times = rec.setdefault('times', {})
+        t0 = time.perf_counter()
+        try:
+            puzzle = parse_clues(str(clue_path), args.parse_cache)
+        except Exception as e:
+            print(f'Error parsing {clue_path}:', e)
+            rec['status'] = 'error'
+            return 1
+        times['parse'] = time.perf_counter() - t0
+        budget = args.native_nodes if args.engine == 'auto' else None
+        result = native_solve(puzzle, max_nodes=budget)
+        times['native'] = result.elapsed
+        rec['nodes'] = result.nodes
+        if result.status == 'limit':
+            print(f'Native engine gave up after {result.nodes} nodes, falling back to SAT')
+            return None
+        rec['engine'] = 'native'
+        print(f'Native engine: {result.status} after {result.nodes} nodes in {result.elapsed:.3f}s')
+        if result.status == 'unsat':
+            print('UNSAT (no solution)')
+            rec['status'] = 'unsat'
+            return 10
+        solpath = solution_path(Path(clue_path).stem, 'native')
+        write_solution_file(str(solpath), cells_to_grid(result.cells))
+        print(f'Wrote solution to {solpath}')
+        rec['status'] = 'sat'
+        return 0
+
+    def process_one(clue_path: Path, out_arg: str, record=None):
+        rec = record if record is not None else {}
+        if members is not None:
+            return process_portfolio(clue_path, rec)
+        if args.engine != 'sat' and not args.dump_puzzle and not args.count_solutions:
+            rc = process_native(clue_path, rec)
+            if rc is not None:
+                return rc
+        times = rec.setdefault('times', {})
+        cached = None
+        if cache is not None and not args.dump_puzzle:
+            try:
+                clue_bytes = Path(clue_path).read_bytes()
+            except OSError as e:
+                print(f'Error reading {clue_path}:', e)
+                rec['status'] = 'error'
+                return 1
+            key = cache.key(clue_bytes, args.approach, encoder_version(encoder),
+                            amo=args.amo, presolve=args.presolve, templates=use_templates)
+            t0 = time.perf_counter()
+            cached = cache.load(key)
+            rec['cache'] = 'miss' if cached is None else 'hit'
+            if cached is not None:
+                times['cache_load'] = time.perf_counter() - t0
 
+        clue_stem = Path(clue_path).stem
         if args.solve:
-            solpath = args.solution
-            if solpath is None:
-                sol_dir = Path('solutions')
-                sol_dir.mkdir(exist_ok=True)
-                solpath = sol_dir / (f"{clue_stem}_a{args.approach}.solution")
-            else:
-                solpath = Path(solpath)
-                if str(args.solution).endswith(os.path.sep) or solpath.is_dir():
-                    solpath = solpath / (f"{clue_stem}_a{args.approach}.solution")
-                else:
-                    if solpath.parent == Path('.') or str(solpath.parent) == '':
-                        sol_dir = Path('solutions')
-                        sol_dir.mkdir(exist_ok=True)
-                        solpath = sol_dir / solpath.name
-                    else:
-                        solpath.parent.mkdir(parents=True, exist_ok=True)
             try:
-                from .solver_pysat import solve_cnf, write_solution_file
+                from .solver_pysat import SolverSink, write_solution_file
             except Exception as e:
                 print('PySAT integration not available:', e)
+                rec['status'] = 'error'
+                return 1
+
+        solver = None
+        out_path = None
+        if cached is not None:
+            vm, clauses, fixed = cached
+            print(f'Loaded {clue_path} from CNF cache')
+            if not args.no_cnf:
+                t0 = time.perf_counter()
+                out_path = cnf_path(clue_stem, out_arg)
+                write_dimacs(vm.nvars(), clauses, str(out_path))
+                times['cnf_write'] = time.perf_counter() - t0
+            nclauses = len(clauses)
+            if args.solve:
+                solver = SolverSink(args.backend)
+                solver.extend(clauses)
+        else:
+            t0 = time.perf_counter()
+            try:
+                puzzle = parse_clues(str(clue_path), args.parse_cache)
+            except Exception as e:
+                print(f'Error parsing {clue_path}:', e)
+                rec['status'] = 'error'
                 return 1
+            times['parse'] = time.perf_counter() - t0
+
+            if args.dump_puzzle:
+                print(f'Parsed puzzle for {clue_path}:')
+                pprint.pprint(puzzle)
+                rec['status'] = 'dumped'
+                return 0
+
+            fixed = None
+            if args.presolve:
+                t0 = time.perf_counter()
+                domains = presolve(puzzle)
+                times['presolve'] = time.perf_counter() - t0
+                if domains is None:
+                    print('UNSAT (presolve found contradictory clues)')
+                    rec['status'] = 'unsat'
+                    return 10
+                fixed = fixed_cells(domains)
+                print(f'Presolve fixed {len(fixed)} of {len(domains)} cells')
+                if len(fixed) == len(domains):
+                    if args.solve:
+                        from .solver_pysat import cells_to_grid
+                        solpath = solution_path(clue_stem)
+                        write_solution_file(str(solpath), cells_to_grid(fixed))
+                        print(f'Solved by presolve, wrote solution to {solpath}')
+                    rec.update(status='sat', vars=0, clauses=0)
+                    if args.count_solutions:
+                        # line solving decided every cell, so no other solution exists
+                        report_count(1, rec)
+                    return 0
+                puzzle['domains'] = domains
+
+            # Stream the clauses into the CNF file (and the solver / cache) as they are generated
+            sinks = []
+            dimacs = None
+            if not args.no_cnf:
+                out_path = cnf_path(clue_stem, out_arg)
+                dimacs = DimacsSink(str(out_path))
+                sinks.append(dimacs)
+            if args.solve:
+                solver = SolverSink(args.backend)
+                sinks.append(solver)
+            if cache is not None:
+                buf = ClauseBuffer()
+                sinks.append(buf)
+            if not sinks:
+                sinks.append(CountingSink())
+            sink = TeeSink(sinks) if len(sinks) > 1 else sinks[0]
+            vm = VarManager(debug=args.var_map)
+            profiler = profiling.LineProfiler(args.profile_top) if args.profile else None
+            if profiler is not None:
+                profiling.subscribe(profiler)
+                if args.profile_memory:
+                    tracemalloc.start()
+            t0 = time.perf_counter()
+            try:
+                encoder(puzzle, vm, amo=args.amo, sink=sink, templates=use_templates)
+            except Exception as e:
+                if dimacs is not None:
+                    dimacs.abort()
+                print(f'Error encoding {clue_path}:', e)
+                rec['status'] = 'memout' if isinstance(e, MemoryError) else 'error'
+                return 1
+            finally:
+                if profiler is not None:
+                    profiling.unsubscribe(profiler)
+                    snapshot = None
+                    if tracemalloc.is_tracing():
+                        snapshot = tracemalloc.take_snapshot()
+                        tracemalloc.stop()
+            if profiler is not None:
+                report = profiler.report(file=str(clue_path), approach=args.approach,
+                                         encode=time.perf_counter() - t0)
+                if snapshot is not None:
+                    report['memory_sites'] = profiling.memory_sites(snapshot)
+                print(profiling.describe(report))
+                if profiles is not None:
+                    profiles[str(clue_path)] = report
+            if dimacs is not None:
+                dimacs.close(vm.nvars())
+            times['encode'] = time.perf_counter() - t0
+            nclauses = len(sink)
+            if args.var_map and out_path is not None:
+                map_path = Path(str(out_path) + '.map')
+                map_path.write_text(''.join(line + '\n' for line in vm.describe()))
+                print(f'Wrote variable map to {map_path}')
+            if cache is not None:
+                cache.store(key, vm, buf, fixed)
+        nvars = vm.nvars()
+        rec.update(vars=nvars, clauses=nclauses, status='encoded')
+        if out_path is not None:
+            print(f'Wrote {out_path} with {nvars} vars and {nclauses} clauses (approach {args.approach})')
+        else:
+            print(f'Encoded {clue_path} with {nvars} vars and {nclauses} clauses (approach {args.approach})')
+
+        if args.solve:
+            solpath = solution_path(clue_stem)
             print('Solving using PySAT...')
-            grid = solve_cnf(vm, clauses)
-            if grid is None:
+            t0 = time.perf_counter()
+            try:
+                if args.count_solutions:
+                    nsol, grid, status = solver.count(vm, fixed, args.count_solutions, args.conflicts,
+                                                      args.propagations, args.solve_timeout)
+                else:
+                    result = solver.solve(vm, fixed, args.conflicts, args.propagations, args.solve_timeout)
+                    status, grid = result.status, result.grid
+                stats = solver.stats()
+            except ValueError as e:
+                print(f'Error solving {clue_path}:', e)
+                rec['status'] = 'error'
+                return 1
+            finally:
+                solver.delete()
+            times['solve'] = time.perf_counter() - t0
+            rec['solver'] = dict(stats, backend=args.backend)
+            if stats:
+                print(f"Solver {args.backend}: {stats.get('conflicts', 0)} conflicts, {stats.get('decisions', 0)} decisions, "
+                      f"{stats.get('propagations', 0)} propagations, {stats.get('restarts', 0)} restarts "
+                      f"in {times['solve']:.3f}s")
+            if status == 'limit':
+                if grid is not None:
+                    # counting ran out of budget after finding solutions: nsol is only a lower bound
+                    write_solution_file(str(solpath), grid)
+                    print(f'Wrote solution to {solpath}')
+                    print(f'UNKNOWN (solver budget exhausted after {nsol} solution(s); at least {nsol})')
+                    rec.update(solutions=nsol, unique=None)
+                else:
+                    print('UNKNOWN (solver budget exhausted)')
+                rec['status'] = 'limit'
+                return 1
+            if status == 'unsat':
                 print('UNSAT (no solution)')
+                rec['status'] = 'unsat'
                 return 10
             write_solution_file(str(solpath), grid)
             print(f'Wrote solution to {solpath}')
+            rec['status'] = 'sat'
+            if args.count_solutions:
+                report_count(nsol, rec)
         return 0
 
+    return process_one
+
+
+def backend_error(name):
+    """Why PySAT cannot build backend `name`, or None (also None when PySAT is missing)."""
+    try:
+        from .solver_pysat import SolverSink
+    except ImportError:
+        return None
+    try:
+        SolverSink(name).delete()
+    except Exception as e:
+        return f'unknown or unavailable PySAT backend {name!r} ({type(e).__name__}: {e})'
+    return None
+
+
+def main(argv):
+    args = build_parser().parse_args(argv[1:])
+    inp = args.input; out = args.output
+    if args.check_unique and not args.count_solutions:
+        args.count_solutions = 2
+    if args.count_solutions:
+        if args.portfolio:
+            print('Error: --check-unique / --count-solutions cannot be combined with --portfolio')
+            return 2
+        args.solve = True
+    if args.solve and not args.portfolio:
+        # fail once up front instead of on every puzzle of a directory run
+        error = backend_error(args.backend)
+        if error:
+            print('Error:', error)
+            return 2
+    members = stats = None
+    if args.portfolio:
+        from .portfolio import parse_members, PortfolioStats
+        try:
+            members = parse_members(args.portfolio)
+        except ValueError as e:
+            print('Error:', e)
+            return 2
+        stats = PortfolioStats(args.portfolio_stats)
+    if args.profile and (args.portfolio or args.jobs is not None):
+        print('Error: --profile cannot be combined with --portfolio or --jobs')
+        return 2
+
     # If input is a directory, iterate all .clues files
     inp_path = Path(inp)
     if inp_path.is_dir():
@@ -116,19 +497,53 @@ def main(argv):
         if not files:
             print('No .clues files found in', inp_path)
             return 2
+    else:
+        files = [inp_path]
+
+    if args.jobs is not None:
+        from .batch import run_batch
+        jobs = args.jobs or os.cpu_count() or 1
+        failures = run_batch(args, files, out, jobs, results_path=args.results or RESULTS_FILE,
+                             members=members, stats=stats)
+    else:
+        cache = open_cache(args)
+        profiles = {} if args.profile else None
+        process_one = make_processor(args, cache, members, stats, profiles)
+        results = open(args.results, 'a') if args.results else None
         failures = 0
+        rc = 0
         for p in files:
-            print('Processing', p)
-            rc = process_one(p, out)
+            if inp_path.is_dir():
+                print('Processing', p)
+            record = {'file': str(p)}
+            t0 = time.perf_counter()
+            rc = process_one(p, out, record)
+            record['rc'] = rc
+            record['wall'] = time.perf_counter() - t0
+            if results is not None:
+                results.write(json.dumps(record) + '\n')
+                results.flush()
             if rc != 0:
                 failures += 1
-        if failures:
-            print(f'Completed with {failures} failures')
-            return 3
-        return 0
+        if results is not None:
+            results.close()
+        if cache is not None:
+            print(cache.summary())
+        if inp_path.is_dir() and (templates.hits or templates.misses):
+            print(templates.summary())
+        if profiles:
+            profiling.write_report(args.profile, profiles)
+            print(f'Wrote line profile to {args.profile}')
+        if not inp_path.is_dir():
+            # single-file mode
+            return rc
 
-    # single-file mode
-    return process_one(Path(inp), out)
+    if stats is not None and inp_path.is_dir():
+        print(stats.summary())
+    if failures:
+        print(f'Completed with {failures} failures')
+        return 3
+    return 0
 
 
 if __name__ == '__main__':
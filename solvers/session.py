@@ -0,0 +1,307 @@
+"""
+Incremental solving session: edit one clue at a time and re-solve on a live
+PySAT solver.
+
+The cell variables and their exactly-one constraints are encoded once.  The
+clauses of every line are added with one extra literal, the negation of the
+line's guard variable, so they only hold while the guard is assumed true;
+every solve runs under the guards of the current clues as assumptions.
+Editing a clue retires the line's guard for good (a unit clause -guard, which
+the solver treats as satisfied clauses from then on), encodes only that line
+against the existing cell variables under a fresh guard, and solves again;
+the solver keeps what it learned about the cells and the other lines.
+
+An unsatisfiable answer comes with the lines of the solver's core: clues
+that cannot hold together.  The uniqueness check blocks the first solution
+under a guard of its own, which is retired right after the check.
+
+Presolve is not used: its domains would no longer hold after an edit.
+
+    session = Session(parse_text(text), approach=4)
+    session.solve()                          # {'status', 'solution', ...}
+    session.edit(3, '2a 1b')                 # encodes line 3 only
+    session.solve(unique=True)
+
+The command line front end reads commands from stdin, as text or, with
+--json, one JSON object per line (answers are JSON lines as well):
+
+    python -m solvers.session path/to/nonogram.clues [--approach 4] [--backend glucose3] [--json]
+
+    solve | unique | edit LINE CLUE... | clue LINE | show | save PATH | write PATH | quit
+    {"op": "edit", "line": 3, "clue": "2a 1b"}     {"op": "solve", "unique": true}
+
+LINE is the index of the clue line in the .clues file (0 is the line after
+the colours), as in `profiling` reports.  'edit' solves right away unless
+the JSON request says "solve": false.
+"""
+import argparse
+import importlib
+import json
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from .cells import encode_cells
+from .parser import parse_text, read_text, tokenize
+from .sinks import ClauseBuffer
+from .solver_pysat import DEFAULT_BACKEND, SolverSink
+from .templates import get_template
+from .varmap import VarManager
+
+DEFAULT_APPROACH = 4
+
+COMMANDS = ['solve', 'unique', 'edit', 'clue', 'show', 'save', 'write', 'quit']
+
+
+def guarded(clauses, guard):
+    """A ClauseBuffer of `clauses` with -guard appended to every clause."""
+    lits = np.frombuffer(clauses.lits, dtype=np.int32)
+    starts = np.frombuffer(clauses.starts, dtype=np.int64)
+    # insert -guard in front of every terminator; clause i moves right by i
+    lits = np.insert(lits, np.flatnonzero(lits == 0), -guard)
+    starts = starts + np.arange(len(starts))
+    return ClauseBuffer(array('i', lits.tobytes()), array('q', starts.tobytes()))
+
+
+def clues_text(puzzle):
+    """The .clues file of a puzzle with its current clues."""
+    if puzzle['kind'] == 'rect':
+        header = f"rect {puzzle['height']} {puzzle['width']}"
+    else:
+        header = f"hex {puzzle['size']}"
+    return '\n'.join([header, ' '.join(puzzle['colors'])] + [line['clue'] for line in puzzle['lines']]) + '\n'
+
+
+class Session:
+    def __init__(self, puzzle, approach=DEFAULT_APPROACH, backend=DEFAULT_BACKEND, amo='auto', templates=True):
+        if puzzle.get('domains') is not None:
+            raise ValueError('a session needs the puzzle without presolved domains')
+        self.puzzle = puzzle
+        self.encode_line = importlib.import_module(f'.approach{approach}', __package__).encode_line
+        self.amo = amo
+        self.templates = templates
+        self.ncolors = len(puzzle['colors'])
+        self.vm = VarManager()
+        self.sink = SolverSink(backend)
+        self.lits = np.asarray(encode_cells(puzzle, self.vm, self.sink, amo), dtype=np.int32)
+        self.colors = np.arange(self.ncolors, dtype=np.int32)
+        self.guards = [None] * len(puzzle['lines'])
+        self.line_of = {}            # guard -> line index
+        self.retired = 0
+        for lidx in range(len(self.guards)):
+            self._encode(lidx)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.sink.delete()
+
+    def _encode(self, lidx):
+        """Add the clauses of line `lidx` under a fresh guard."""
+        line = self.puzzle['lines'][lidx]
+        length = len(line['cells'])
+        cl = self.lits[(line['ids'][:, None] * self.ncolors + self.colors).ravel()]
+        buf = ClauseBuffer()
+        if self.templates:
+            tmpl, _ = get_template(self.encode_line, line['blocks'], length, self.ncolors, None, self.amo)
+            tmpl.instantiate(cl, self.vm, buf, lidx)
+        else:
+            self.encode_line(lidx, line['blocks'], length, self.ncolors, cl.tolist(), None, self.vm, buf, self.amo)
+        guard = self.vm.reserve(1, 'guard', lidx)
+        self.sink.extend(guarded(buf, guard))
+        self.guards[lidx] = guard
+        self.line_of[guard] = lidx
+
+    def _retire(self, guard):
+        self.sink.append([-guard])
+        self.line_of.pop(guard, None)
+        self.retired += 1
+
+    def _check_line(self, lidx):
+        nlines = len(self.puzzle['lines'])
+        if not 0 <= lidx < nlines:
+            raise ValueError(f'line {lidx} out of range 0 .. {nlines - 1}')
+
+    def edit(self, lidx, clue):
+        """
+        Replace the clue of line `lidx` (text as in a .clues file).  Raises
+        ValueError for a bad line index or clue; returns the edit's stats.
+        """
+        lines = self.puzzle['lines']
+        self._check_line(lidx)
+        clue = clue.strip()
+        blocks = tokenize(clue)
+        for n, col in blocks:
+            if n < 1 or (col is not None and not 0 <= col < self.ncolors - 1):
+                raise ValueError(f'invalid block {n}{"?" if col is None else chr(ord("a") + col)} '
+                                 f'for {self.ncolors - 1} colours')
+        t0 = time.perf_counter()
+        nvars, nclauses = self.vm.nvars(), len(self.sink)
+        self._retire(self.guards[lidx])
+        lines[lidx] = dict(lines[lidx], clue=clue, blocks=blocks)
+        self._encode(lidx)
+        return {'line': lidx, 'clue': clue, 'vars': self.vm.nvars() - nvars,
+                'clauses': len(self.sink) - nclauses, 'time': time.perf_counter() - t0}
+
+    def solve(self, unique=False, conflicts=None, propagations=None, timeout=None):
+        """
+        Solve under the guards of the current clues.  The answer has 'status'
+        ('sat' / 'unsat' / 'limit'), 'solution' (.solution text) when sat,
+        'unique' when asked for and 'conflict' (line indices) when unsat.
+        """
+        assumptions = list(self.guards)
+        result = self.sink.solve(self.vm, None, conflicts, propagations, timeout, assumptions)
+        answer = {'status': result.status, 'time': result.elapsed}
+        if result.status == 'sat':
+            answer['solution'] = ''.join(''.join(row) + '\n' for row in result.grid)
+            if unique:
+                answer['unique'] = self._unique(assumptions, conflicts, propagations, timeout, answer)
+        elif result.status == 'unsat':
+            core = self.sink.solver.get_core() or []
+            answer['conflict'] = sorted(self.line_of[g] for g in core if g in self.line_of)
+        answer.update(vars=self.vm.nvars(), clauses=len(self.sink), solver=self.sink.stats())
+        return answer
+
+    def _unique(self, assumptions, conflicts, propagations, timeout, answer):
+        """True / False, or None when the budget runs out, for the model the solver just found."""
+        model = self.sink.solver.get_model()
+        start = self.vm.cell_base - 1
+        block = [-lit for lit in model[start:start + len(self.vm.cell_owner)] if lit > 0]
+        guard = self.vm.reserve(1, 'guard', 'unique')
+        self.sink.append(block + [-guard])
+        try:
+            result = self.sink.solve(self.vm, None, conflicts, propagations, timeout, assumptions + [guard])
+        finally:
+            self._retire(guard)
+        answer['time'] += result.elapsed
+        if result.status == 'limit':
+            return None
+        return result.status == 'unsat'
+
+    def handle(self, request):
+        """Answer one request dict ({'op': ..., ...}, see the module docstring)."""
+        op = request.get('op')
+        if op in ('solve', 'unique'):
+            return self.solve(request.get('unique', op == 'unique'), request.get('conflicts'),
+                              request.get('propagations'), request.get('timeout'))
+        if op == 'edit':
+            t0 = time.perf_counter()
+            answer = {'edit': self.edit(int(request['line']), request['clue'])}
+            if request.get('solve', True):
+                answer.update(self.solve(request.get('unique', False), request.get('conflicts'),
+                                         request.get('propagations'), request.get('timeout')))
+                answer['latency'] = time.perf_counter() - t0
+            return answer
+        if op == 'show':
+            return dict(self.solve(), show=True)
+        if op == 'clue':
+            lidx = int(request['line'])
+            self._check_line(lidx)
+            return {'line': lidx, 'clue': self.puzzle['lines'][lidx]['clue']}
+        if op == 'save':
+            with open(request['path'], 'w') as fp:
+                fp.write(clues_text(self.puzzle))
+            return {'saved': request['path']}
+        if op == 'write':
+            answer = self.solve()
+            if 'solution' in answer:
+                with open(request['path'], 'w') as fp:
+                    fp.write(answer['solution'])
+                answer['written'] = request['path']
+            return answer
+        raise ValueError(f'unknown op {op!r}, expected one of {COMMANDS}')
+
+    def summary(self):
+        return (f'Session: {len(self.guards)} lines, {self.retired} retired guards, '
+                f'{self.vm.nvars()} vars, {len(self.sink)} clauses')
+
+
+def parse_command(text):
+    """The request dict of one text command, or None for an empty line."""
+    words = text.split()
+    if not words:
+        return None
+    op, args = words[0], words[1:]
+    if op == 'edit':
+        if not args:
+            raise ValueError('usage: edit LINE CLUE...')
+        return {'op': 'edit', 'line': int(args[0]), 'clue': ' '.join(args[1:])}
+    if op == 'clue':
+        if len(args) != 1:
+            raise ValueError('usage: clue LINE')
+        return {'op': 'clue', 'line': int(args[0])}
+    if op in ('save', 'write'):
+        if len(args) != 1:
+            raise ValueError(f'usage: {op} PATH')
+        return {'op': op, 'path': args[0]}
+    return {'op': op}
+
+
+def describe(answer):
+    """A few lines of text about an answer, for the text front end."""
+    out = []
+    if 'edit' in answer:
+        e = answer['edit']
+        out.append(f"line {e['line']}: '{e['clue']}' (+{e['vars']} vars, +{e['clauses']} clauses, "
+                   f"{e['time'] * 1000:.1f} ms)")
+    if 'status' in answer:
+        status = answer['status'].upper()
+        if answer.get('unique') is not None:
+            status += ', unique' if answer['unique'] else ', NOT unique'
+        out.append(f"{status} in {answer['time'] * 1000:.1f} ms"
+                   + (f", {answer['latency'] * 1000:.1f} ms after the edit" if 'latency' in answer else ''))
+        if 'conflict' in answer:
+            out.append(f"conflicting lines: {' '.join(map(str, answer['conflict']))}")
+    if answer.get('show') and 'solution' in answer:
+        out.append(answer['solution'].rstrip('\n'))
+    if 'clue' in answer and 'edit' not in answer:
+        out.append(f"line {answer['line']}: '{answer['clue']}'")
+    for key in ('saved', 'written'):
+        if key in answer:
+            out.append(f'wrote {answer[key]}')
+    return '\n'.join(out)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Edit clues and re-solve incrementally on a live SAT solver.')
+    parser.add_argument('input', help='.clues file')
+    parser.add_argument('--approach', type=int, default=DEFAULT_APPROACH, choices=[1, 2, 3, 4])
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, help='PySAT backend (must support assumptions)')
+    parser.add_argument('--amo', default='auto', help='at-most-one encoding (see cardinality)')
+    parser.add_argument('--json', action='store_true', help='read JSON requests and answer JSON lines')
+    args = parser.parse_args(argv[1:])
+
+    t0 = time.perf_counter()
+    puzzle = parse_text(read_text(args.input), args.input)
+    with Session(puzzle, args.approach, args.backend, args.amo) as session:
+        ready = f'{session.summary()}, encoded in {time.perf_counter() - t0:.3f}s'
+        print(json.dumps({'ready': ready}) if args.json else ready, flush=True)
+        for text in sys.stdin:
+            try:
+                request = json.loads(text) if args.json and text.strip() else parse_command(text)
+                if request is None:
+                    continue
+                if not isinstance(request, dict):
+                    raise ValueError('expected a JSON object with an "op"')
+                if request.get('op') == 'quit':
+                    break
+                answer = session.handle(request)
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                answer = {'error': f'{type(e).__name__}: {e}'}
+            if args.json:
+                print(json.dumps(answer), flush=True)
+            else:
+                print(answer['error'] if 'error' in answer else describe(answer), flush=True)
+        if not args.json:
+            print(session.summary())
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,216 @@
+"""
+Clause sinks: where encoders write their clauses.
+
+Encoders only ever call `append(clause)` on their sink, so a plain list works
+and is the default.  The sinks here let clauses stream to their consumer as
+they are produced instead of being collected into one big list first:
+
+  DimacsSink      writes DIMACS directly; the `p cnf` header is back-patched on close
+  ClauseBuffer    compact flat int array store (e.g. for the CNF cache)
+  CountingSink    keeps only clause/literal counts
+  TeeSink         fans every clause out to several sinks
+  ConstantFilter  drops clauses satisfied by the constant-true variable and
+                  strips its negation (used with presolved domains)
+
+The PySAT sink lives in `solver_pysat.SolverSink`.
+"""
+import re
+from array import array
+
+import numpy as np
+
+# Width of each number field in the placeholder DIMACS header
+_HEADER_FIELD = 12
+
+_TERMINATOR = re.compile(r' 0(?= )')
+
+
+class CountingSink:
+    def __init__(self):
+        self.nclauses = 0
+        self.nliterals = 0
+
+    def append(self, clause):
+        self.nclauses += 1
+        self.nliterals += len(clause)
+
+    def extend(self, clauses):
+        if isinstance(clauses, ClauseBuffer):
+            self.nclauses += len(clauses)
+            self.nliterals += len(clauses.lits) - len(clauses)
+            return
+        for clause in clauses:
+            self.append(clause)
+
+    def __len__(self):
+        return self.nclauses
+
+
+class DimacsSink:
+    """
+    Stream clauses into a DIMACS file. The header is written as a fixed-width
+    placeholder and overwritten by close() once the counts are known.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.nclauses = 0
+        self._fp = open(path, 'w')
+        self._fp.write(self._header(0, 0))
+
+    @staticmethod
+    def _header(nvars, nclauses):
+        return f'p cnf {nvars:<{_HEADER_FIELD}} {nclauses:<{_HEADER_FIELD}}\n'
+
+    def append(self, clause):
+        self._fp.write(' '.join(str(x) for x in clause) + ' 0\n')
+        self.nclauses += 1
+
+    def extend(self, clauses):
+        if isinstance(clauses, ClauseBuffer):
+            clauses.write_dimacs(self._fp)
+            self.nclauses += len(clauses)
+            return
+        for clause in clauses:
+            self.append(clause)
+
+    def __len__(self):
+        return self.nclauses
+
+    def close(self, nvars):
+        self._fp.seek(0)
+        self._fp.write(self._header(nvars, self.nclauses))
+        self._fp.close()
+
+    def abort(self):
+        self._fp.close()
+
+
+class ClauseBuffer:
+    """
+    Compact clause store: every literal in one flat array('i') with a 0 after
+    each clause, plus an array of clause start offsets. About 4 bytes per
+    literal and 8 per clause, instead of a Python list per clause.
+
+    Iterating yields lists (like a list of clauses); `views()` yields
+    zero-copy memoryview slices, which is what `SolverSink.extend` hands to
+    PySAT; `write_dimacs` converts the buffer to text in large chunks.
+    """
+
+    def __init__(self, lits=None, starts=None):
+        self.lits = array('i') if lits is None else lits
+        self.starts = array('q') if starts is None else starts
+
+    def append(self, clause):
+        self.starts.append(len(self.lits))
+        self.lits.extend(clause)
+        self.lits.append(0)
+
+    def extend(self, clauses):
+        if isinstance(clauses, ClauseBuffer):
+            base = len(self.lits)
+            self.starts.extend(base + s for s in clauses.starts)
+            self.lits.extend(clauses.lits)
+            return
+        for clause in clauses:
+            self.append(clause)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _end(self, i):
+        # offset of the terminating 0 of clause i
+        if i + 1 < len(self.starts):
+            return self.starts[i + 1] - 1
+        return len(self.lits) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.starts)
+        return self.lits[self.starts[i]:self._end(i)].tolist()
+
+    def __iter__(self):
+        lits = self.lits
+        for i, start in enumerate(self.starts):
+            yield lits[start:self._end(i)].tolist()
+
+    def views(self):
+        """Zero-copy memoryview of every clause (without its terminator)."""
+        mv = memoryview(self.lits)
+        n = len(self.starts)
+        for i, start in enumerate(self.starts):
+            end = self.starts[i + 1] - 1 if i + 1 < n else len(self.lits) - 1
+            yield mv[start:end]
+
+    def nbytes(self):
+        return self.lits.itemsize * len(self.lits) + self.starts.itemsize * len(self.starts)
+
+    def write_dimacs(self, fp, chunk=1 << 20):
+        """Write the clause lines (no header) to an open text file."""
+        lits = self.lits
+        n = len(lits)
+        pos = 0
+        while pos < n:
+            end = min(pos + chunk, n)
+            # extend the chunk to the end of the clause it stops in
+            while lits[end - 1] != 0:
+                end += 1
+            # literals are never 0, so a lone '0' token is always a terminator
+            text = _TERMINATOR.sub(' 0\n', ' ' + ' '.join(map(str, lits[pos:end])) + ' ')
+            fp.write(text.replace('\n ', '\n')[1:])
+            pos = end
+
+
+class TeeSink:
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.nclauses = 0
+
+    def append(self, clause):
+        for s in self.sinks:
+            s.append(clause)
+        self.nclauses += 1
+
+    def extend(self, clauses):
+        if not isinstance(clauses, ClauseBuffer):
+            clauses = list(clauses)
+        for s in self.sinks:
+            s.extend(clauses)
+        self.nclauses += len(clauses)
+
+    def __len__(self):
+        return self.nclauses
+
+
+class ConstantFilter:
+    def __init__(self, sink, true):
+        self.sink = sink
+        self.true = true
+
+    def append(self, clause):
+        true = self.true
+        if true in clause:
+            return
+        if -true in clause:
+            clause = [x for x in clause if x != -true]
+        self.sink.append(clause)
+
+    def extend(self, clauses):
+        if not isinstance(clauses, ClauseBuffer):
+            for clause in clauses:
+                self.append(clause)
+            return
+        lits = np.frombuffer(clauses.lits, dtype=np.int32)
+        starts = np.frombuffer(clauses.starts, dtype=np.int64)
+        # clause index of every literal (terminators included)
+        cid = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(lits))))
+        sat = np.zeros(len(starts), dtype=bool)
+        sat[cid[lits == self.true]] = True
+        keep = ~sat[cid] & (lits != -self.true)
+        kept = lits[keep]
+        # the new start of a clause is the number of kept literals before it
+        before = np.concatenate(([0], np.cumsum(keep)))[starts]
+        self.sink.extend(ClauseBuffer(array('i', kept.tobytes()), array('q', before[~sat].tobytes())))
+
+    def __len__(self):
+        return len(self.sink)
@@ -1,51 +1,222 @@
 """
 PySAT 求解器集成模块。
-提供 `solve_cnf(vm, clauses)` 函数，该函数返回颜色索引网格，
-以及辅助函数 `write_solution_file(path, grid)` 用于生成符合格式要求的 .solution 文件。
+提供 `solve_cnf(vm, clauses)` 函数，该函数返回 SolveResult (状态、网格与求解器统计)；
+求解可以限制冲突数、传播数与墙钟时间 (到时由计时器调用 interrupt)；
+`SolverSink` 可作为编码器的子句输出 (sink)，子句生成时即直接加入求解器；
+以及辅助函数 `cells_to_grid(cells)` 与 `write_solution_file(path, grid)` 用于生成符合格式要求的 .solution 文件。
 """
+import threading
+import time
 from typing import List, Optional, Any
 
-def solve_cnf(vm, clauses: List[List[int]]) -> Optional[List[List[str]]]:
+DEFAULT_BACKEND = 'glucose3'
+
+class SolveResult:
+    def __init__(self, status, grid=None, stats=None, elapsed=0.0):
+        self.status = status          # 'sat'、'unsat' 或 'limit' (预算或时间用完)
+        self.grid = grid              # sat 时为字符网格
+        self.stats = stats or {}      # conflicts / decisions / propagations / restarts (后端不支持时为空)
+        self.elapsed = elapsed        # 求解调用本身的耗时 (秒)，不含加入子句
+
+def solve_cnf(vm, clauses: List[List[int]], fixed: Optional[dict] = None, backend: str = DEFAULT_BACKEND,
+              conflicts: Optional[int] = None, propagations: Optional[int] = None,
+              timeout: Optional[float] = None) -> SolveResult:
+    """
+    使用 PySAT 后端 `backend` 求解 CNF 公式，并将变量赋值映射回拼图网格。
+    `fixed` 为预处理 (presolve) 已确定的单元格 {coord: color_index}，它们在 CNF 中没有变量。
+    conflicts / propagations / timeout (秒) 限制求解，用完时返回 status='limit'。
+    求解器在返回前释放。
+    """
+    with SolverSink(backend) as sink:
+        sink.extend(clauses)
+        return sink.solve(vm, fixed, conflicts, propagations, timeout)
+
+class SolverSink:
+    """
+    子句输出 (sink)：编码器每生成一个子句就直接 add_clause 到 PySAT 求解器，
+    不需要先在内存中保存完整的子句列表。
+    """
+    def __init__(self, name: str = DEFAULT_BACKEND):
+        """`name` 为 PySAT 后端名称 (如 'glucose4'、'cadical153'、'maplechrono'、'lingeling')。"""
+        try:
+            from pysat.solvers import Solver
+        except ImportError:
+            raise ImportError
+        self.name = name
+        self.solver = Solver(name=name)
+        self.nclauses = 0
+
+    def append(self, clause):
+        self.solver.add_clause(clause)
+        self.nclauses += 1
+
+    def extend(self, clauses):
+        # ClauseBuffer: hand over zero-copy memoryview slices instead of lists
+        views = clauses.views() if hasattr(clauses, 'views') else clauses
+        for clause in views:
+            self.solver.add_clause(clause)
+            self.nclauses += 1
+
+    def __len__(self):
+        return self.nclauses
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.delete()
+
+    def delete(self):
+        """释放底层求解器 (PySAT 的求解器在 C 侧分配，不会被垃圾回收及时释放)。"""
+        if self.solver is not None:
+            self.solver.delete()
+            self.solver = None
+
+    def stats(self) -> dict:
+        """求解器累计统计 (conflicts / decisions / propagations / restarts)，后端不支持时为空字典。"""
+        return _accum_stats(self.solver)
+
+    def solve(self, vm, fixed: Optional[dict] = None, conflicts: Optional[int] = None,
+              propagations: Optional[int] = None, timeout: Optional[float] = None,
+              assumptions: Optional[List[int]] = None) -> SolveResult:
+        """求解已加入的子句 (限制与假设见 solve_with)，返回 SolveResult。"""
+        result = solve_with(self.solver, vm, fixed, conflicts, propagations, timeout, assumptions)
+        result.stats = self.stats()
+        return result
+
+    def count(self, vm, fixed: Optional[dict] = None, limit: int = 2, conflicts: Optional[int] = None,
+              propagations: Optional[int] = None, timeout: Optional[float] = None):
+        """在同一个求解器上逐个枚举解 (最多 limit 个，限制见 count_solutions)，返回 (解的个数, 第一个解的网格, 状态)。"""
+        return count_solutions(self.solver, vm, fixed, limit, conflicts, propagations, timeout)
+
+def count_solutions(solver, vm, fixed: Optional[dict] = None, limit: int = 2, conflicts: Optional[int] = None,
+                    propagations: Optional[int] = None, timeout: Optional[float] = None):
     """
-    使用 PySAT 求解 CNF 公式，并将变量赋值映射回拼图网格。
+    增量枚举解：每找到一个模型，就向同一个 (仍在运行的) PySAT 求解器加入一条
+    只包含单元格变量的阻塞子句，然后继续求解，已学习的子句得以保留。
+    每个单元格恰好一种颜色，所以阻塞子句只需否定为真的单元格变量。
+    conflicts / propagations / timeout 限制整个枚举 (而不是每一次求解)，
+    每次求解只用剩余的预算 (见 limited_solve)。
+    返回 (解的个数, 第一个解的网格或 None, 状态)：状态为 'sat' (达到 limit 或已无更多解)、
+    'unsat' 或 'limit' (预算在此之前用完，此时解的个数只是下界)。
     """
+    first = None
+    count = 0
+    start = vm.cell_base - 1 if vm.cell_base is not None else 0
+    size = len(vm.cell_owner)
+    used0 = _accum_stats(solver)
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    while count < limit:
+        used = _accum_stats(solver)
+        budgets = [_remaining(conflicts, used, used0, 'conflicts'),
+                   _remaining(propagations, used, used0, 'propagations'),
+                   None if deadline is None else deadline - time.perf_counter()]
+        if any(b is not None and b <= 0 for b in budgets):
+            return count, first, 'limit'
+        sat, _ = limited_solve(solver, *budgets)
+        if sat is None:
+            return count, first, 'limit'
+        if not sat:
+            break
+        model = solver.get_model()
+        count += 1
+        if first is None:
+            cells = vm.decode_cells(model)
+            if fixed:
+                cells.update(fixed)
+            first = cells_to_grid(cells) if cells else None
+        block = [-lit for lit in model[start:start + size] if lit > 0]
+        if not block:
+            # 所有单元格都已由预处理确定，解是唯一的
+            break
+        solver.add_clause(block)
+    return count, first, 'sat' if count else 'unsat'
+
+def _accum_stats(solver) -> dict:
     try:
-        from pysat.solvers import Glucose3
-    except ImportError:
-        raise ImportError
-
-    # 1. 初始化求解器并添加子句
-    solver = Glucose3()
-    for cl in clauses:
-        solver.add_clause(cl)
-    
+        return dict(solver.accum_stats())
+    except Exception:
+        return {}
+
+def _remaining(budget, used, used0, key):
+    """枚举中剩余的预算；后端不提供累计统计时每次求解都用完整预算。"""
+    if budget is None or key not in used:
+        return budget
+    return budget - (used[key] - used0.get(key, 0))
+
+def limited_solve(solver, conflicts: Optional[int] = None, propagations: Optional[int] = None,
+                  timeout: Optional[float] = None, assumptions: Optional[List[int]] = None):
+    """
+    调用一次求解器，限制同 solve_with；返回 (True / False / None (限制用完), 耗时秒数)。
+    后端不支持某项限制时抛出 ValueError。
+    """
+    limited = conflicts is not None or propagations is not None or timeout is not None
+    timer = None
+    try:
+        if conflicts is not None:
+            solver.conf_budget(conflicts)
+        if propagations is not None:
+            solver.prop_budget(propagations)
+        if timeout is not None:
+            # 先探测后端是否支持中断 (不支持时抛出 NotImplementedError)，
+            # 否则计时器线程里的 interrupt 会出错，求解也不会停下
+            solver.clear_interrupt()
+            timer = threading.Timer(timeout, solver.interrupt)
+            timer.daemon = True
+        start = time.perf_counter()
+        if timer is not None:
+            timer.start()
+        try:
+            assumptions = assumptions or []
+            if limited:
+                sat = solver.solve_limited(assumptions=assumptions, expect_interrupt=timer is not None)
+            else:
+                sat = solver.solve(assumptions=assumptions)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        elapsed = time.perf_counter() - start
+        if timer is not None:
+            solver.clear_interrupt()
+    except NotImplementedError:
+        raise ValueError('所用的 PySAT 后端不支持冲突 / 传播预算或中断')
+    return sat, elapsed
+
+def solve_with(solver, vm, fixed: Optional[dict] = None, conflicts: Optional[int] = None,
+               propagations: Optional[int] = None, timeout: Optional[float] = None,
+               assumptions: Optional[List[int]] = None) -> SolveResult:
+    """
+    用已加载子句的 PySAT 求解器求解，并将模型解码为网格。
+    给出 conflicts / propagations 时设置求解器的冲突 / 传播预算；给出 timeout (秒)
+    时由计时器线程在到时后调用 interrupt。任一限制生效时改用 solve_limited，
+    未得出结论则返回 status='limit'。后端不支持某项限制时抛出 ValueError。
+    `assumptions` 为本次求解假设为真的文字 (增量求解，见 session)，
+    unsat 时可用 solver.get_core() 取得冲突的假设。
+    """
     # 2. 求解
-    sat = solver.solve()
+    sat, elapsed = limited_solve(solver, conflicts, propagations, timeout, assumptions)
+    if sat is None:
+        return SolveResult('limit', elapsed=elapsed)
     if not sat:
-        return None
-        
+        return SolveResult('unsat', elapsed=elapsed)
+
     model = solver.get_model()
-    # 将模型转化为字典，便于快速查找变量的正负（True/False）
-    assignment = {abs(lit): (lit > 0) for lit in model}
 
     # 3. 提取所有被设为 True 的单元格变量
-    # 单元格变量在 VarManager 中的 key 格式为: ('cell', coord, color_index)
-    cells = {}
-    # 我们遍历模型中所有为真的变量
-    for var, val in assignment.items():
-        if not val:
-            continue
-        key = vm.key_of(var)
-        if key and isinstance(key, tuple) and key[0] == 'cell':
-            _, coord, col_idx = key
-            # 存入坐标对应的颜色索引 (0为背景, 1为'a', 2为'b'...)
-            # 注意：由于每个格子只能有一种颜色，逻辑正确时每个 coord 只会对应一个 col_idx
-            cells[coord] = col_idx
+    # 单元格变量是 VarManager 中连续的一段，按 vm.cell_owner 直接解码为 {coord: color_index}
+    cells = vm.decode_cells(model)
 
+    if fixed:
+        cells.update(fixed)
     if not cells:
-        return None
+        return SolveResult('unsat', elapsed=elapsed)
+    return SolveResult('sat', cells_to_grid(cells), elapsed=elapsed)
 
-    # 4. 判断网格类型并格式化输出
+def cells_to_grid(cells: dict) -> List[List[str]]:
+    """
+    将 {coord: color_index} 转换为按行排列的字符网格 (矩形或六边形)。
+    """
+    # 判断网格类型并格式化输出
     # 获取一个样本坐标来检查类型
     sample_coord = next(iter(cells.keys()))
     
@@ -76,12 +247,14 @@ def solve_cnf(vm, clauses: List[List[int]]) -> Optional[List[List[str]]]:
     else:
         # --- 六边形网格格式化 ---
         # 六边形通常按轴向坐标 r 分行，按 q 排序
-        r_coords = sorted(set(c[1] for c in cells.keys()))
-        
+        # 先按 r 一次性分组，再对每行按 q 排序（避免每行都扫描全部单元格）
+        rows = {}
+        for coord in cells.keys():
+            rows.setdefault(coord[1], []).append(coord)
+
         grid = []
-        for r in r_coords:
-            # 获取当前行 (r固定) 的所有单元格并按 q 排序
-            row_cells = sorted([c for c in cells.keys() if c[1] == r], key=lambda x: x[0])
+        for r in sorted(rows):
+            row_cells = sorted(rows[r], key=lambda x: x[0])
             row_chars = []
             for coord in row_cells:
                 col_idx = cells.get(coord, 0)
@@ -0,0 +1,154 @@
+"""
+Encode-once line templates.
+
+Every encoder describes a single line with an `encode_line` function that
+only sees the line: its blocks, its length, a flat table `cl` of the line's
+cell literals (cl[p * ncolors + x] is "position p has colour x"), and the
+line's presolved domains.  `encode_lines` drives it over a puzzle.
+
+With templates on, each distinct (encoder, clue, length, ncolors, amo,
+domains) is encoded only once, against symbolic literals: codes
+1 .. length*ncolors stand for the cell table and the codes after that for
+the line's own variables.  Every line with that key is then instantiated by
+reserving one block for its variables and mapping the codes to real
+literals, which is a single NumPy gather over the template's flat code
+array; the clauses reach the sink as one ClauseBuffer.  Templates live in
+an in-process LRU, so identical clues in later puzzles of a batch hit as
+well.
+"""
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from . import profiling
+from .sinks import ClauseBuffer
+from .cells import line_decided
+
+DEFAULT_CAPACITY = 4096
+
+_templates = OrderedDict()
+_capacity = DEFAULT_CAPACITY
+hits = 0
+misses = 0
+
+
+class LineTemplate:
+    def __init__(self, nlocal, codes, starts, notes=None):
+        self.nlocal = nlocal      # variables of the line besides its cell literals
+        self.codes = codes        # signed codes of every clause, 0 after each (as in ClauseBuffer)
+        self.starts = starts      # clause start offsets into codes
+        self.notes = notes or {}  # what the encoder reported through profiling.note while recording
+
+    def instantiate(self, cl, vm, clauses, lidx):
+        """Add the clauses of one line with cell literals `cl` to `clauses` in one go."""
+        base = vm.reserve(self.nlocal, 'line', lidx)
+        n = len(cl) + self.nlocal
+        # m[code] is the literal of a code; a negative code indexes from the end
+        m = np.empty(2 * n + 1, dtype=np.int32)
+        m[0] = 0
+        m[1:len(cl) + 1] = cl
+        m[len(cl) + 1:n + 1] = np.arange(base, base + self.nlocal, dtype=np.int32)
+        m[n + 1:] = -m[n:0:-1]
+        lits = m[self.codes]
+        clauses.extend(ClauseBuffer(array('i', lits.tobytes()), array('q', self.starts)))
+
+
+class _LocalVars:
+    """Stands in for the VarManager while a template is recorded."""
+
+    def __init__(self, first):
+        self._counter = first
+
+    def reserve(self, n, family='aux', *label):
+        base = self._counter + 1
+        self._counter += n
+        return base
+
+    def label(self, base, n, family, *label):
+        pass
+
+    def fresh(self):
+        self._counter += 1
+        return self._counter
+
+
+def build_template(encode_line, blocks, length, ncolors, doms, amo):
+    ncell = length * ncolors
+    local = _LocalVars(ncell)
+    recorded = []
+    prev = profiling.start_notes()
+    try:
+        encode_line(0, blocks, length, ncolors, range(1, ncell + 1), doms, local, recorded, amo)
+    finally:
+        notes = profiling.stop_notes(prev)
+    buf = ClauseBuffer()
+    buf.extend(recorded)
+    return LineTemplate(local._counter - ncell, np.frombuffer(buf.lits, dtype=np.int32), buf.starts, notes)
+
+
+def get_template(encode_line, blocks, length, ncolors, doms, amo):
+    """(template, hit) of a line, from the LRU or freshly recorded."""
+    global hits, misses
+    key = (encode_line.__module__, tuple(blocks), length, ncolors, doms, amo)
+    tmpl = _templates.get(key)
+    if tmpl is not None:
+        hits += 1
+        _templates.move_to_end(key)
+        return tmpl, True
+    misses += 1
+    tmpl = build_template(encode_line, blocks, length, ncolors, doms, amo)
+    _templates[key] = tmpl
+    if len(_templates) > _capacity:
+        _templates.popitem(last=False)
+    return tmpl, False
+
+
+def set_capacity(n):
+    global _capacity
+    _capacity = n
+    while len(_templates) > _capacity:
+        _templates.popitem(last=False)
+
+
+def clear():
+    global hits, misses
+    _templates.clear()
+    hits = misses = 0
+
+
+def encode_lines(puzzle, vm, clauses, lits, encode_line, amo='auto', templates=True):
+    """
+    Encode every line of `puzzle` with `encode_line` (see the module
+    docstring), skipping lines that presolve already decided.  While
+    anything is subscribed to `profiling`, one event is emitted per line.
+    """
+    ncolors = len(puzzle['colors'])
+    domains = puzzle.get('domains')
+    lits = np.asarray(lits, dtype=np.int32)
+    colors = np.arange(ncolors, dtype=np.int32)
+    profile = profiling.active()
+
+    for lidx, line in enumerate(puzzle['lines']):
+        cells = line['cells']
+        doms = None
+        if domains is not None:
+            if line_decided(domains, cells):
+                continue
+            doms = tuple(domains[coord] for coord in cells)
+        blocks = line['blocks']
+        timer = profiling.LineTimer(lidx, line, vm, clauses) if profile else None
+        cl = lits[(line['ids'][:, None] * ncolors + colors).ravel()]
+        if templates:
+            tmpl, hit = get_template(encode_line, blocks, len(cells), ncolors, doms, amo)
+            tmpl.instantiate(cl, vm, clauses, lidx)
+            if timer:
+                timer.finish('hit' if hit else 'miss', tmpl.notes)
+        else:
+            encode_line(lidx, blocks, len(cells), ncolors, cl.tolist(), doms, vm, clauses, amo)
+            if timer:
+                timer.finish()
+
+
+def summary():
+    return f'Line templates: {hits} hits, {misses} misses, {len(_templates)} cached'
@@ -1,22 +1,90 @@
+"""
+Variable allocation.
+
+Variables are handed out in contiguous blocks; encoders compute ids as
+`base + offset` instead of hashing tuple keys.  The cell-colour variables of
+a puzzle form one block whose layout (`cell_owner`) is what a model is
+decoded with.  With debug=True every block is also recorded with a family
+name and label so `key_of` / `describe` can map ids back for inspection.
+"""
+from bisect import bisect_right
+
+
 class VarManager:
-    def __init__(self):
-        self._map = {}
-        self._rev = {}
+    def __init__(self, debug=False):
         self._counter = 0
+        self.debug = debug
+        self._blocks = []        # (base, size, family, label), debug only
+        self.true = None         # constant-true variable (presolved puzzles)
+        self.cell_base = None    # first cell-colour variable
+        self.cell_owner = []     # (coord, colour) of cell variable cell_base + i
+
+    @classmethod
+    def from_layout(cls, nvars, cell_base, cell_owner):
+        """Rebuild a manager that can decode models (e.g. for a cached CNF)."""
+        vm = cls()
+        vm._counter = nvars
+        vm.cell_base = cell_base
+        vm.cell_owner = list(cell_owner)
+        return vm
 
-    def new(self, key):
-        if key in self._map:
-            return self._map[key]
+    def reserve(self, n, family='aux', *label):
+        """Reserve n consecutive variables and return the first id."""
+        base = self._counter + 1
+        self._counter += n
+        if self.debug and n > 0:
+            self._blocks.append((base, n, family, label))
+        return base
+
+    def label(self, base, n, family, *label):
+        """Record an already allocated range (e.g. built with fresh()) in debug mode."""
+        if self.debug and n > 0:
+            self._blocks.append((base, n, family, label))
+
+    def fresh(self):
+        """Allocate an anonymous auxiliary variable."""
         self._counter += 1
-        self._map[key] = self._counter
-        self._rev[self._counter] = key
         return self._counter
 
-    def get(self, key):
-        return self._map.get(key)
+    def add_cells(self, owners):
+        """Reserve the cell-colour block; owners lists (coord, colour) per variable."""
+        self.cell_owner = list(owners)
+        self.cell_base = self.reserve(len(self.cell_owner), 'cell')
+        return self.cell_base
+
+    def decode_cells(self, model):
+        """{coord: colour} for the cell variables that are true in a solver model."""
+        cells = {}
+        if self.cell_base is None:
+            return cells
+        start = self.cell_base - 1
+        for offset, lit in enumerate(model[start:start + len(self.cell_owner)]):
+            if lit > 0:
+                coord, col = self.cell_owner[offset]
+                cells[coord] = col
+        return cells
 
     def key_of(self, var):
-        return self._rev.get(var)
+        """('cell', coord, colour), (family, *label, offset) in debug mode, else None."""
+        if self.cell_base is not None and 0 <= var - self.cell_base < len(self.cell_owner):
+            return ('cell',) + tuple(self.cell_owner[var - self.cell_base])
+        i = bisect_right(self._blocks, (var, float('inf'))) - 1
+        if i >= 0:
+            base, n, family, label = self._blocks[i]
+            if var < base + n:
+                return (family,) + label + (var - base,)
+        return None
+
+    def describe(self):
+        """Lines 'first last family label...' for every recorded block (debug mode)."""
+        lines = []
+        if self.cell_base is not None and self.cell_owner:
+            lines.append(f'{self.cell_base} {self.cell_base + len(self.cell_owner) - 1} cell')
+        for base, n, family, label in self._blocks:
+            if family == 'cell':
+                continue
+            lines.append(' '.join(str(x) for x in (base, base + n - 1, family) + label))
+        return lines
 
     def nvars(self):
         return self._counter
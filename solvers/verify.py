@@ -0,0 +1,239 @@
+"""
+Offline solution verifier for rect and hex puzzles.
+
+The line geometry (cell id arrays and tokenized clues) comes from
+`parser.parse_clues`.  A solution file is read into one array of cell
+colours (indexed like puzzle['cells']), every line is gathered through a
+single concatenated index array, and all lines are run-length encoded
+together with NumPy.  The runs are then compared against
+the parsed clues in one vectorised pass, so the result names exactly which
+lines are wrong.
+
+    python -m solvers.verify path/to/nonogram.clues path/to/nonogram.solution
+    python -m solvers.verify clues_dir solutions_dir [--jobs N]
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .parser import parse_clues
+
+
+def grid_rows(puzzle):
+    """Cells of each row of a .solution file, in file order (the layout `cells_to_grid` writes)."""
+    if puzzle['kind'] == 'rect':
+        w = puzzle['width']
+        return [[(r, c) for c in range(w)] for r in range(puzzle['height'])]
+    rows = {}
+    for coord in puzzle['cells']:
+        rows.setdefault(coord[1], []).append(coord)
+    return [sorted(rows[r]) for r in sorted(rows)]
+
+
+def line_name(puzzle, lidx):
+    """Human readable name of line `lidx` (row 3, column 5, hex r=-2 ...)."""
+    if puzzle['kind'] == 'rect':
+        h = puzzle['height']
+        return f'row {lidx}' if lidx < h else f'column {lidx - h}'
+    n = 2 * puzzle['size'] - 1
+    axis, i = divmod(lidx, n)
+    return f'{"rqs"[axis]}={i - (puzzle["size"] - 1)} line'
+
+
+def runs_to_clue(lengths, colors):
+    return ' '.join(f'{n}{chr(ord("a") + c - 1)}' for n, c in zip(lengths, colors))
+
+
+class Geometry:
+    """Everything needed to check solutions of one clue file, compiled to arrays."""
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        self.ncolors = len(puzzle['colors'])
+        if puzzle['kind'] == 'rect':
+            # rect cell ids are row-major
+            self.rows = np.arange(len(puzzle['cells'])).reshape(puzzle['height'], puzzle['width'])
+        else:
+            ids = {coord: i for i, coord in enumerate(puzzle['cells'])}
+            self.rows = [[ids[coord] for coord in row] for row in grid_rows(puzzle)]
+
+        lines = puzzle['lines']
+        self.nlines = len(lines)
+        sizes = [len(line['cells']) for line in lines]
+        self.flat = np.concatenate([line['ids'] for line in lines]).astype(np.int64)
+        self.line_of = np.repeat(np.arange(self.nlines), sizes)
+        # a run always starts at the first cell of a line
+        self.line_start = np.zeros(len(self.flat), dtype=bool)
+        self.line_start[np.cumsum([0] + sizes[:-1])[np.array(sizes) > 0]] = True
+
+        # expected runs of every line, concatenated; colour -1 is a '?' block
+        exp_len, exp_col, exp_line = [], [], []
+        for lidx, line in enumerate(lines):
+            for n, col in line['blocks']:
+                exp_len.append(n)
+                exp_col.append(-1 if col is None else col + 1)
+                exp_line.append(lidx)
+        self.exp_len = np.array(exp_len, dtype=np.int64)
+        self.exp_col = np.array(exp_col, dtype=np.int64)
+        self.exp_line = np.array(exp_line, dtype=np.int64)
+        self.exp_count = np.bincount(self.exp_line, minlength=self.nlines)
+
+    def read_solution(self, text):
+        """Cell colours (0 = background) indexed like puzzle['cells']; ValueError if malformed."""
+        rows = [row.strip() for row in text.splitlines()]
+        while rows and not rows[-1]:
+            rows.pop()
+        if len(rows) != len(self.rows):
+            raise ValueError(f'expected {len(self.rows)} rows, found {len(rows)}')
+        values = np.zeros(len(self.puzzle['cells']), dtype=np.int64)
+        for r, (row, ids) in enumerate(zip(rows, self.rows)):
+            if len(row) != len(ids):
+                raise ValueError(f'row {r}: expected {len(ids)} cells, found {len(row)}')
+            chars = np.frombuffer(row.encode('latin-1'), dtype=np.uint8).astype(np.int64)
+            cols = np.where(chars == ord('-'), 0, chars - ord('a') + 1)
+            if ((cols < 0) | (cols >= self.ncolors)).any():
+                raise ValueError(f'row {r}: invalid colour in {row!r}')
+            values[ids] = cols
+        return values
+
+    def runs(self, values):
+        """(line, length, colour) arrays of every non-background run, in line order."""
+        seq = values[self.flat]
+        start = self.line_start.copy()
+        start[1:] |= seq[1:] != seq[:-1]
+        pos = np.flatnonzero(start)
+        lengths = np.diff(np.append(pos, len(seq)))
+        colors = seq[pos]
+        keep = colors != 0
+        return self.line_of[pos][keep], lengths[keep], colors[keep]
+
+    def bad_lines(self, values):
+        """Indices of the lines whose runs do not match their clue."""
+        act_line, act_len, act_col = self.runs(values)
+        act_count = np.bincount(act_line, minlength=self.nlines)
+        same = act_count == self.exp_count
+        # lines with the same number of runs line up run by run
+        a, e = same[act_line], same[self.exp_line]
+        diff = (act_len[a] != self.exp_len[e]) | ((self.exp_col[e] >= 0) & (act_col[a] != self.exp_col[e]))
+        bad = ~same
+        bad[act_line[a][diff]] = True
+        return np.flatnonzero(bad), (act_line, act_len, act_col)
+
+    def check(self, text):
+        """CheckResult for the contents of a .solution file."""
+        try:
+            values = self.read_solution(text)
+        except ValueError as e:
+            return CheckResult(False, error=f'malformed solution: {e}')
+        bad, (act_line, act_len, act_col) = self.bad_lines(values)
+        failures = []
+        for lidx in bad.tolist():
+            mask = act_line == lidx
+            failures.append((lidx, line_name(self.puzzle, lidx), self.puzzle['lines'][lidx]['clue'].strip(),
+                             runs_to_clue(act_len[mask].tolist(), act_col[mask].tolist())))
+        return CheckResult(not failures, failures)
+
+
+class CheckResult:
+    def __init__(self, ok, failures=None, error=None):
+        self.ok = ok
+        self.failures = failures or []   # (line index, line name, expected clue, actual runs)
+        self.error = error
+
+    def describe(self, limit=10):
+        if self.error:
+            return f'Error: {self.error}'
+        if self.ok:
+            return 'Correct'
+        lines = [f'Wrong: {len(self.failures)} lines do not match their clues']
+        for _, name, expected, actual in self.failures[:limit]:
+            lines.append(f'  {name}: expected {expected!r}, got {actual!r}')
+        if len(self.failures) > limit:
+            lines.append(f'  ... and {len(self.failures) - limit} more')
+        return '\n'.join(lines)
+
+
+@lru_cache(maxsize=32)
+def _geometry(clue_path, mtime):
+    return Geometry(parse_clues(clue_path))
+
+
+def geometry(clue_path):
+    clue_path = str(clue_path)
+    return _geometry(clue_path, os.path.getmtime(clue_path))
+
+
+def check_solution(clue_path, solution_path):
+    """Check one .solution file against its .clues file."""
+    return geometry(clue_path).check(Path(solution_path).read_text())
+
+
+def find_clues(clues_dir, solution_path):
+    """
+    The .clues file of a solution: same stem, or the stem without the
+    '_a2' / '_portfolio' style suffixes run.py adds.
+    """
+    stem = Path(solution_path).stem
+    while True:
+        path = Path(clues_dir) / (stem + '.clues')
+        if path.exists():
+            return path
+        if '_' not in stem:
+            return None
+        stem = stem.rsplit('_', 1)[0]
+
+
+def _check_pair(pair):
+    clue_path, solution_path = pair
+    if clue_path is None:
+        return CheckResult(False, error='no matching .clues file')
+    try:
+        return check_solution(clue_path, solution_path)
+    except Exception as e:
+        return CheckResult(False, error=f'{type(e).__name__}: {e}')
+
+
+def check_directory(clues_dir, solutions_dir, jobs=None):
+    """[(solution path, CheckResult)] for every .solution file, checked in `jobs` processes."""
+    solutions = sorted(Path(solutions_dir).glob('*.solution'))
+    pairs = [(find_clues(clues_dir, s), s) for s in solutions]
+    if jobs == 1 or len(pairs) < 2:
+        results = [_check_pair(p) for p in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_check_pair, pairs, chunksize=8))
+    return list(zip(solutions, results))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Check nonogram solutions offline.')
+    parser.add_argument('clues', help='.clues file or directory of .clues files')
+    parser.add_argument('solutions', help='.solution file or directory of .solution files')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes for directories (default: one per core)')
+    parser.add_argument('--quiet', action='store_true', help='only print solutions that are wrong')
+    args = parser.parse_args(argv[1:])
+
+    if Path(args.solutions).is_dir():
+        results = check_directory(args.clues, args.solutions, args.jobs)
+    else:
+        results = [(Path(args.solutions), _check_pair((args.clues, args.solutions)))]
+
+    correct = 0
+    for path, result in results:
+        correct += result.ok
+        if not (args.quiet and result.ok):
+            print(path.name)
+            print('   ', result.describe().replace('\n', '\n    '))
+    if len(results) > 1:
+        print()
+        print(f'Correct: {correct}, Wrong: {len(results) - correct}')
+    return 0 if correct == len(results) else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))